@@ -6,10 +6,12 @@ from sqlalchemy import select
 
 from app.core.database import get_db
 from app.core.security import (
-    verify_password,
-    get_password_hash,
+    password_hasher,
+    password_needs_rehash,
+    PasswordHasherBusyError,
     create_access_token,
-    get_current_user
+    get_current_user,
+    invalidate_user
 )
 from app.models.user import User
 from app.schemas.user import UserCreate, UserResponse, Token
@@ -19,6 +21,14 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
+def _hasher_busy_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many login requests, please retry later",
+        headers={"Retry-After": "1"}
+    )
+
+
 @router.post("/auth/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def register(
     user_data: UserCreate,
@@ -44,7 +54,12 @@ async def register(
         )
     
     # 创建新用户
-    hashed_password = get_password_hash(user_data.password)
+    try:
+        hashed_password = await password_hasher.hash(user_data.password)
+    except PasswordHasherBusyError:
+        logger.warning("Registration rejected: password hasher busy")
+        raise _hasher_busy_exception()
+    
     new_user = User(
         username=user_data.username,
         email=user_data.email,
@@ -55,7 +70,7 @@ async def register(
     await db.commit()
     await db.refresh(new_user)
     
-    logger.info(f"User registered: {new_user.username}")
+    logger.info("User registered: %s", new_user.username)
     
     return new_user
 
@@ -74,18 +89,34 @@ async def login(
     )
     user = result.scalar_one_or_none()
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
-        logger.warning(f"Login failed for username: {form_data.username}")
+    try:
+        password_ok = user is not None and await password_hasher.verify(form_data.password, user.hashed_password)
+    except PasswordHasherBusyError:
+        logger.warning("Login rejected for username %s: password hasher busy", form_data.username)
+        raise _hasher_busy_exception()
+    
+    if not password_ok:
+        logger.warning("Login failed for username: %s", form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # BCRYPT_ROUNDS变更后，用本次登录的明文密码重新哈希（失败不影响登录）
+    if password_needs_rehash(user.hashed_password):
+        try:
+            user.hashed_password = await password_hasher.hash(form_data.password)
+            await db.commit()
+            invalidate_user(user.id)
+            logger.info("Password rehashed for user %s", user.id)
+        except PasswordHasherBusyError:
+            logger.info("Password rehash for user %s skipped: password hasher busy", user.id)
+    
     # 创建访问令牌（JWT的sub字段必须是字符串）
     access_token = create_access_token(data={"sub": str(user.id)})
     
-    logger.info(f"User logged in: {user.username}")
+    logger.info("User logged in: %s", user.username)
     
     return {"access_token": access_token, "token_type": "bearer"}
 
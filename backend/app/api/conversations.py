@@ -1,54 +1,167 @@
 import logging
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Dict, List, Optional, Tuple, Union
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, func
 
 from app.core.database import get_db
+from app.core.etag import etag_matches, make_etag
+from app.core.pagination import MAX_PAGE_SIZE, InvalidCursorError, fetch_page
+from app.core.responses import ORJSONResponse
 from app.core.security import get_current_user
 from app.models.user import User
 from app.models.conversation import Conversation
 from app.models.message import Message
-from app.schemas.conversation import ConversationCreate, ConversationResponse
+from app.schemas.conversation import (
+    ConversationCreate,
+    ConversationListItemResponse,
+    ConversationResponse,
+    ConversationSummaryResponse,
+)
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 摘要模式下最后一条消息的预览长度
+PREVIEW_LENGTH = 100
 
-@router.get("/conversations", response_model=List[ConversationResponse])
+# 带ETag的响应要求客户端每次使用前重新验证（内容未变时返回304）
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+# 返回消息时只查询这些列（顺序与MessageResponse字段一致），跳过ORM对象构建
+MESSAGE_COLUMNS = (Message.role, Message.content, Message.id, Message.conversation_id, Message.created_at)
+
+
+@router.get(
+    "/conversations",
+    response_model=Union[List[ConversationSummaryResponse], List[ConversationListItemResponse]]
+)
 async def get_conversations(
+    summary: bool = Query(False, description="只返回摘要（标题、最后一条消息预览、消息数），不返回完整消息"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="每页条数，不传则返回全部"),
+    before: Optional[str] = Query(None, description="返回早于该游标的对话"),
+    after: Optional[str] = Query(None, description="返回晚于该游标的对话"),
+    if_none_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取当前用户的所有对话"""
+    """
+    获取当前用户的对话（按创建时间倒序）
+    
+    分页时下一页游标通过响应头 X-Next-Cursor 返回；
+    本页的对话和消息都没有变化时按 If-None-Match 返回304，不加载消息内容
+    """
+    stmt = select(Conversation).where(Conversation.user_id == current_user.id)
+    
+    try:
+        conversations, next_cursor = await fetch_page(
+            db, stmt, Conversation.created_at, Conversation.id,
+            limit=limit, before=before, after=after, newest_first=True
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    # 消息只会新增：本页每个对话的消息数和最大ID不变即内容不变（只查询本页对话，走索引）
+    stats = await _get_message_stats(db, [conv.id for conv in conversations])
+    etag = make_etag(
+        "conversations", current_user.id, summary, limit, before, after, next_cursor,
+        *((conv.id, conv.title, *stats.get(conv.id, (0, None))) for conv in conversations)
+    )
+    cache_headers = {"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+    
+    if summary:
+        content = await _get_conversation_summaries(db, conversations, stats)
+    else:
+        messages = await _get_messages_by_conversation(db, [conv.id for conv in conversations])
+        content = [
+            {
+                "title": conv.title,
+                "id": conv.id,
+                "user_id": conv.user_id,
+                "created_at": conv.created_at,
+                "messages": messages.get(conv.id, [])
+            }
+            for conv in conversations
+        ]
+    
+    # 内容已按响应模型整理，直接序列化，跳过response_model校验
+    if next_cursor:
+        cache_headers["X-Next-Cursor"] = next_cursor
+    return ORJSONResponse(content, headers=cache_headers)
+
+
+async def _get_messages_by_conversation(db: AsyncSession, conversation_ids: List[int]) -> Dict[int, List[dict]]:
+    """一次IN查询按列加载多个对话的全部消息（避免N+1查询），按对话分组"""
+    grouped: Dict[int, List[dict]] = {}
+    if not conversation_ids:
+        return grouped
+    
     result = await db.execute(
-        select(Conversation)
-        .where(Conversation.user_id == current_user.id)
-        .order_by(Conversation.created_at.desc())
+        select(*MESSAGE_COLUMNS)
+        .where(Message.conversation_id.in_(conversation_ids))
+        .order_by(Message.created_at, Message.id)
     )
-    conversations = result.scalars().all()
-    
-    # 加载消息
-    conversation_list = []
-    for conv in conversations:
-        messages_result = await db.execute(
-            select(Message)
-            .where(Message.conversation_id == conv.id)
-            .order_by(Message.created_at)
+    for row in result.all():
+        grouped.setdefault(row.conversation_id, []).append(row._asdict())
+    return grouped
+
+
+async def _get_message_stats(db: AsyncSession, conversation_ids: List[int]) -> Dict[int, Tuple[int, int]]:
+    """每个对话的消息数和最后一条消息ID（一次按对话分组的查询，只走索引）"""
+    if not conversation_ids:
+        return {}
+    
+    result = await db.execute(
+        select(
+            Message.conversation_id,
+            func.count(Message.id),
+            func.max(Message.id)
+        )
+        .where(Message.conversation_id.in_(conversation_ids))
+        .group_by(Message.conversation_id)
+    )
+    return {conv_id: (count, last_id) for conv_id, count, last_id in result.all()}
+
+
+async def _get_conversation_summaries(
+    db: AsyncSession,
+    conversations: List[Conversation],
+    stats: Dict[int, Tuple[int, int]]
+) -> List[dict]:
+    """对话摘要：消息统计（见 _get_message_stats）+ 最后一条消息预览"""
+    if not conversations:
+        return []
+    
+    # 最后一条消息（只取截断后的内容）
+    previews = {}
+    last_ids = [last_id for _, last_id in stats.values()]
+    if last_ids:
+        preview_result = await db.execute(
+            select(
+                Message.id,
+                Message.conversation_id,
+                Message.role,
+                func.substr(Message.content, 1, PREVIEW_LENGTH),
+                Message.created_at
+            ).where(Message.id.in_(last_ids))
         )
-        messages = messages_result.scalars().all()
-        
-        conv_dict = {
+        for msg_id, conv_id, role, content, created_at in preview_result.all():
+            previews[conv_id] = {"id": msg_id, "role": role, "content": content, "created_at": created_at}
+    
+    return [
+        {
+            "title": conv.title,
             "id": conv.id,
             "user_id": conv.user_id,
-            "title": conv.title,
             "created_at": conv.created_at,
-            "messages": [{"id": m.id, "conversation_id": m.conversation_id, "role": m.role, "content": m.content, "created_at": m.created_at} for m in messages]
+            "message_count": stats.get(conv.id, (0, None))[0],
+            "last_message": previews.get(conv.id)
         }
-        conversation_list.append(conv_dict)
-    
-    return conversation_list
+        for conv in conversations
+    ]
 
 
 @router.post("/conversations", response_model=ConversationResponse, status_code=status.HTTP_201_CREATED)
@@ -67,7 +180,7 @@ async def create_conversation(
     await db.commit()
     await db.refresh(new_conversation)
     
-    logger.info(f"Conversation created: {new_conversation.id} by user {current_user.id}")
+    logger.info("Conversation created: %s by user %s", new_conversation.id, current_user.id)
     
     return ConversationResponse(
         id=new_conversation.id,
@@ -81,10 +194,20 @@ async def create_conversation(
 @router.get("/conversations/{conversation_id}", response_model=ConversationResponse)
 async def get_conversation(
     conversation_id: int,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="每页消息数，不传则返回全部"),
+    before: Optional[str] = Query(None, description="返回早于该游标的消息"),
+    after: Optional[str] = Query(None, description="返回晚于该游标的消息"),
+    if_none_match: Optional[str] = Header(None),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取单个对话详情"""
+    """
+    获取单个对话详情
+    
+    消息按时间正序返回；不传游标时返回最新一页，next_cursor 用于继续向同一方向翻页
+    （默认和 before 为更早的消息，after 为更新的消息）。
+    没有新消息时按 If-None-Match 返回304，不加载消息内容
+    """
     result = await db.execute(
         select(Conversation).where(
             Conversation.id == conversation_id,
@@ -99,19 +222,34 @@ async def get_conversation(
             detail="Conversation not found"
         )
     
-    # 加载消息
-    messages_result = await db.execute(
-        select(Message)
+    # 消息只会新增：数量和最新消息ID不变即内容不变（只走索引，不读取消息内容）
+    version_result = await db.execute(
+        select(func.count(Message.id), func.max(Message.id))
         .where(Message.conversation_id == conversation_id)
-        .order_by(Message.created_at)
     )
-    messages = messages_result.scalars().all()
+    etag = make_etag("conversation", conversation.id, conversation.title, *version_result.one(), limit, before, after)
+    cache_headers = {"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
     
-    return ConversationResponse(
-        id=conversation.id,
-        user_id=conversation.user_id,
-        title=conversation.title,
-        created_at=conversation.created_at,
-        messages=[{"id": m.id, "conversation_id": m.conversation_id, "role": m.role, "content": m.content, "created_at": m.created_at} for m in messages]
-    )
+    # 按列加载消息
+    try:
+        messages, next_cursor = await fetch_page(
+            db,
+            select(*MESSAGE_COLUMNS).where(Message.conversation_id == conversation_id),
+            Message.created_at, Message.id,
+            limit=limit, before=before, after=after, newest_first=False
+        )
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    # 内容已按响应模型整理，直接序列化，跳过response_model校验
+    return ORJSONResponse({
+        "title": conversation.title,
+        "id": conversation.id,
+        "user_id": conversation.user_id,
+        "created_at": conversation.created_at,
+        "messages": [row._asdict() for row in messages],
+        "next_cursor": next_cursor
+    }, headers=cache_headers)
 
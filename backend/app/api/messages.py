@@ -1,6 +1,8 @@
+import json
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import JSONResponse
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
@@ -9,25 +11,36 @@ from app.core.security import get_current_user
 from app.models.user import User
 from app.models.conversation import Conversation
 from app.schemas.message import MessageCreate
-from app.schemas.task import TaskCreateResponse
-from app.services.task_service import task_service
+from app.services.task_service import task_service, TaskQueueFullError, IdempotencyKeyConflictError
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+def queue_full_error(e: TaskQueueFullError) -> HTTPException:
+    """排队已满：单个用户超限返回429，整体繁忙返回503"""
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS if e.per_user else status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many pending messages" if e.per_user else "Server is busy, please try again later",
+        headers={"Retry-After": "5"}
+    )
+
+
 @router.post("/conversations/{conversation_id}/messages", status_code=status.HTTP_202_ACCEPTED)
 async def send_message(
     conversation_id: int,
     message_data: MessageCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=255, description="重试时携带相同的值，返回同一个任务"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
     发送消息（异步处理，立即返回202）
     
-    如果AI响应时间超过2秒，返回202 Accepted和task_id，由前端轮询获取结果
+    如果AI响应时间超过2秒，返回202 Accepted和task_id，由前端轮询获取结果。
+    重复提交（相同的Idempotency-Key，或短时间内相同的内容）返回已有任务，
+    响应头 Idempotent-Replayed: true
     """
     # 验证对话是否存在且属于当前用户
     result = await db.execute(
@@ -44,15 +57,25 @@ async def send_message(
             detail="Conversation not found"
         )
     
+    # 结束请求会话的事务归还连接：任务记录由写入合并器在另一个连接上提交，
+    # 并发请求各自占着连接等待合并提交会耗尽连接池
+    await db.commit()
+    
     # 创建任务并立即返回task_id
-    task_id = await task_service.create_task(
-        db=db,
-        user_id=current_user.id,
-        conversation_id=conversation_id,
-        user_message=message_data.content
-    )
+    try:
+        task_id, replayed = await task_service.create_task(
+            user_id=current_user.id,
+            conversation_id=conversation_id,
+            user_message=message_data.content,
+            idempotency_key=idempotency_key
+        )
+    except IdempotencyKeyConflictError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except TaskQueueFullError as e:
+        logger.warning("Task rejected for user %s: %s", current_user.id, e)
+        raise queue_full_error(e)
     
-    logger.info(f"Message task created: {task_id} for conversation {conversation_id}")
+    logger.info("Message task created: %s for conversation %s", task_id, conversation_id)
     
     # 返回202 Accepted和task_id
     return JSONResponse(
@@ -61,6 +84,65 @@ async def send_message(
             "task_id": task_id,
             "status": "pending",
             "message": "Message is being processed"
-        }
+        },
+        headers={"Idempotent-Replayed": "true"} if replayed else None
     )
 
+
+
+@router.post("/conversations/{conversation_id}/messages/stream")
+async def stream_message(
+    conversation_id: int,
+    message_data: MessageCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    发送消息（流式返回，Server-Sent Events）
+    
+    事件类型：start（用户消息已保存）、token（生成片段）、done（AI响应已保存）、
+    error（已生成的部分仍会保存，message_id为其ID）
+    """
+    # 验证对话是否存在且属于当前用户
+    result = await db.execute(
+        select(Conversation).where(
+            Conversation.id == conversation_id,
+            Conversation.user_id == current_user.id
+        )
+    )
+    conversation = result.scalar_one_or_none()
+    
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+    
+    # 结束请求会话的事务归还连接（依赖的清理要等响应流结束后才执行）
+    await db.commit()
+    
+    # 与任务共用排队上限和执行槽，不足时在开始响应前拒绝
+    try:
+        await task_service.check_stream_capacity(current_user.id)
+    except TaskQueueFullError as e:
+        logger.warning("Stream rejected for user %s: %s", current_user.id, e)
+        raise queue_full_error(e)
+    
+    logger.info("Streaming message for conversation %s", conversation_id)
+    
+    async def event_stream():
+        async for event in task_service.stream_message(
+            conversation_id=conversation_id,
+            user_message=message_data.content
+        ):
+            data = json.dumps(event["data"], ensure_ascii=False)
+            yield f"event: {event['event']}\ndata: {data}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # 禁止Nginx缓冲
+        }
+    )
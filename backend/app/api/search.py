@@ -0,0 +1,39 @@
+import logging
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_db
+from app.core.security import get_current_user
+from app.models.user import User
+from app.schemas.search import SearchResponse
+from app.services.search_service import search_service
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# 单页最大条数
+MAX_SEARCH_LIMIT = 100
+
+
+@router.get("/search", response_model=SearchResponse)
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=200, description="搜索词（空格分隔，全部匹配）"),
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_LIMIT, description="每页条数"),
+    offset: int = Query(0, ge=0, description="跳过的结果数（使用上一页返回的next_offset）"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    搜索当前用户所有对话中的消息
+    
+    按相关度排序，每条结果包含所在对话和高亮的内容片段（不返回完整消息）
+    """
+    results, next_offset = await search_service.search(
+        db=db,
+        user_id=current_user.id,
+        query=q,
+        limit=limit,
+        offset=offset
+    )
+    return {"query": q, "results": results, "next_offset": next_offset}
@@ -1,11 +1,14 @@
+import asyncio
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
-from app.core.security import get_current_user
+from app.core.config import settings
+from app.core.database import get_db, AsyncSessionLocal
+from app.core.security import get_current_user, decode_access_token
 from app.models.user import User
 from app.schemas.task import TaskResponse
+from app.services.task_events import task_events, TERMINAL_STATUSES
 from app.services.task_service import task_service
 
 logger = logging.getLogger(__name__)
@@ -16,15 +19,24 @@ router = APIRouter()
 @router.get("/tasks/{task_id}", response_model=TaskResponse)
 async def get_task_status(
     task_id: str,
+    wait: float = Query(0, ge=0, le=settings.TASK_WAIT_MAX_SECONDS, description="长轮询：最多等待多少秒直到任务完成或失败"),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """获取任务状态（用于轮询）"""
-    task = await task_service.get_task_status(
-        db=db,
-        task_id=task_id,
-        user_id=current_user.id
-    )
+    """获取任务状态（用于轮询；传入wait时在任务结束或超时后才返回）"""
+    if wait > 0:
+        task = await task_service.wait_for_task(
+            db=db,
+            task_id=task_id,
+            user_id=current_user.id,
+            timeout=wait
+        )
+    else:
+        task = await task_service.get_task_status(
+            db=db,
+            task_id=task_id,
+            user_id=current_user.id
+        )
     
     if not task:
         raise HTTPException(
@@ -34,3 +46,52 @@ async def get_task_status(
     
     return task
 
+
+@router.websocket("/tasks/{task_id}/ws")
+async def task_status_ws(
+    websocket: WebSocket,
+    task_id: str,
+    token: str = Query(..., description="访问令牌（浏览器WebSocket无法设置Authorization头）")
+):
+    """
+    推送任务状态（WebSocket）
+    
+    连接后立即发送一次当前状态，之后每次状态变化推送一条，任务结束后关闭连接
+    """
+    user_id = decode_access_token(token)
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    
+    # 先订阅再查询，避免错过两者之间发生的状态变化
+    with task_events.subscribe(task_id) as events:
+        async with AsyncSessionLocal() as db:
+            task = await task_service.get_task_status(db=db, task_id=task_id, user_id=user_id)
+            if not task:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Task not found")
+                return
+            state = TaskResponse.model_validate(task).model_dump(mode="json")
+        
+        try:
+            await websocket.send_json(state)
+            while state["status"] not in TERMINAL_STATUSES:
+                try:
+                    state = await asyncio.wait_for(events.get(), timeout=settings.TASK_WAIT_RECHECK_INTERVAL)
+                except asyncio.TimeoutError:
+                    # 兜底：任务可能在其他worker进程执行，重新查询数据库
+                    async with AsyncSessionLocal() as db:
+                        task = await task_service.get_task_status(db=db, task_id=task_id, user_id=user_id)
+                    if not task:
+                        # 任务在订阅期间被删除（例如所属对话被删除）
+                        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Task not found")
+                        return
+                    latest = TaskResponse.model_validate(task).model_dump(mode="json")
+                    if latest["status"] == state["status"]:
+                        continue
+                    state = latest
+                await websocket.send_json(state)
+            await websocket.close()
+        except WebSocketDisconnect:
+            logger.info("Task %s websocket disconnected", task_id)
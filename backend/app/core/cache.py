@@ -0,0 +1,59 @@
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """
+    进程内LRU缓存，每个条目有过期时间
+    
+    不是线程安全的，只在事件循环中使用
+    """
+    
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+    
+    def get(self, key: Hashable) -> Optional[V]:
+        """读取条目，不存在或已过期时返回None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.time() >= expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+    
+    def set(self, key: Hashable, value: V, expires_at: Optional[float] = None):
+        """
+        写入条目
+        
+        Args:
+            key: 键
+            value: 值
+            expires_at: 过期时间（Unix时间戳），默认为当前时间 + ttl，且不会晚于默认值
+        """
+        default_expires_at = time.time() + self.ttl
+        if expires_at is None or expires_at > default_expires_at:
+            expires_at = default_expires_at
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """删除条目"""
+        entry = self._entries.pop(key, None)
+        return entry[1] if entry is not None else None
+    
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,208 @@
+import zlib
+from typing import Iterable, Optional, Set, Tuple
+
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli是可选依赖，未安装时只使用gzip
+    brotli = None
+
+# 默认不压缩的类型：流式响应（压缩会延迟推送）和已压缩的格式，支持 type/*
+DEFAULT_EXCLUDE_CONTENT_TYPES = (
+    "text/event-stream",
+    "application/x-ndjson",
+    "application/gzip",
+    "application/zip",
+    "font/woff2",
+    "image/*",
+    "audio/*",
+    "video/*",
+)
+
+
+def accepted_encodings(accept_encoding: str) -> Set[str]:
+    """解析Accept-Encoding，返回客户端接受的编码（忽略q=0）"""
+    encodings = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(name)
+    return encodings
+
+
+def parse_content_types(content_types: str) -> Tuple[str, ...]:
+    """解析逗号分隔的Content-Type列表（小写，去除空项）"""
+    return tuple(item.strip().lower() for item in content_types.split(",") if item.strip())
+
+
+class GzipEncoder:
+    """gzip编码（流式响应每块之后flush，客户端可以立即解压）"""
+    content_encoding = "gzip"
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        data = self._compressor.compress(body)
+        return data + self._compressor.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    """brotli编码（流式响应每块之后flush）"""
+    content_encoding = "br"
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        data = self._compressor.process(body)
+        return data + (self._compressor.flush() if more_body else self._compressor.finish())
+
+
+class CompressionResponder:
+    """
+    压缩单个响应
+
+    已设置Content-Encoding、206部分响应、排除的Content-Type原样发送；
+    不分块且小于 minimum_size 的响应不压缩；流式响应逐块压缩。
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        encoder,
+        minimum_size: int,
+        thread_minimum_size: int,
+        exclude_content_types: Iterable[str]
+    ):
+        self.app = app
+        self.encoder = encoder
+        self.minimum_size = minimum_size
+        self.thread_minimum_size = thread_minimum_size
+        self.exclude_content_types = set(exclude_content_types)
+        self.send: Optional[Send] = None
+        self.initial_message: Optional[Message] = None
+        self.passthrough = False
+        self.started = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.send = send
+        await self.app(scope, receive, self.send_with_compression)
+
+    def _is_excluded(self, headers: Headers) -> bool:
+        media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+        return bool({media_type, media_type.partition("/")[0] + "/*"} & self.exclude_content_types)
+
+    async def _compress(self, body: bytes, more_body: bool) -> bytes:
+        if len(body) >= self.thread_minimum_size:
+            # 大块数据在线程中压缩，避免阻塞事件循环
+            return await anyio.to_thread.run_sync(self.encoder.compress, body, more_body)
+        return self.encoder.compress(body, more_body)
+
+    async def send_with_compression(self, message: Message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # 等到第一块响应体才能决定是否压缩（需要修改响应头）
+            headers = Headers(raw=message["headers"])
+            self.passthrough = (
+                "content-encoding" in headers
+                or message["status"] == 206
+                or self._is_excluded(headers)
+            )
+            if self.passthrough:
+                await self.send(message)
+            else:
+                self.initial_message = message
+            return
+
+        if self.passthrough or message_type != "http.response.body":
+            if self.initial_message is not None:
+                await self.send(self.initial_message)
+                self.initial_message = None
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not self.started:
+            self.started = True
+            if len(body) < self.minimum_size and not more_body:
+                self.passthrough = True
+                await self.send(self.initial_message)
+                self.initial_message = None
+                await self.send(message)
+                return
+
+            headers = MutableHeaders(raw=self.initial_message["headers"])
+            headers.add_vary_header("Accept-Encoding")
+            headers["Content-Encoding"] = self.encoder.content_encoding
+            body = await self._compress(body, more_body)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(body))
+            await self.send(self.initial_message)
+            self.initial_message = None
+            await self.send({**message, "body": body})
+            return
+
+        await self.send({**message, "body": await self._compress(body, more_body)})
+
+
+class CompressionMiddleware:
+    """
+    响应压缩中间件
+
+    客户端支持且安装了brotli时使用br，否则使用gzip；小于 minimum_size 的响应和
+    exclude_content_types 中的类型（默认为SSE等流式响应和已压缩的格式）不压缩
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        thread_minimum_size: int = 128 * 1024,
+        exclude_content_types: Iterable[str] = DEFAULT_EXCLUDE_CONTENT_TYPES
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.thread_minimum_size = thread_minimum_size
+        self.exclude_content_types = tuple(content_type.lower() for content_type in exclude_content_types)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encodings = accepted_encodings(Headers(scope=scope).get("Accept-Encoding", ""))
+        if brotli is not None and "br" in encodings:
+            encoder = BrotliEncoder(self.brotli_quality)
+        elif "gzip" in encodings:
+            encoder = GzipEncoder(self.gzip_level)
+        else:
+            await self.app(scope, receive, send)
+            return
+
+        responder = CompressionResponder(
+            self.app, encoder,
+            minimum_size=self.minimum_size,
+            thread_minimum_size=self.thread_minimum_size,
+            exclude_content_types=self.exclude_content_types
+        )
+        await responder(scope, receive, send)
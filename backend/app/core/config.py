@@ -9,21 +9,101 @@ class Settings(BaseSettings):
     
     # 数据库配置
     DATABASE_URL: str = "sqlite+aiosqlite:///./chat.db"
+    DB_AUTO_MIGRATE: bool = True  # 启动时自动执行迁移（多进程部署建议关闭，改为部署前执行 alembic upgrade head）
+    DB_ECHO: bool = False  # 打印执行的SQL
+    DB_POOL_SIZE: int = 5  # 每个进程保持的连接数
+    DB_MAX_OVERFLOW: int = 10  # 连接池满时允许临时创建的额外连接数
+    DB_POOL_TIMEOUT: float = 30.0  # 等待可用连接的时间（秒）
+    DB_POOL_RECYCLE: int = 1800  # 连接使用多久后重建（秒，避免被数据库或中间件断开）
+    DB_POOL_PRE_PING: bool = True  # 取出连接前检测是否可用
+    DB_WRITE_BATCH_MAX_SIZE: int = 100  # 合并到同一个事务的写操作数上限
+    DB_WRITE_BATCH_MAX_DELAY: float = 0.005  # 写操作最多等待多久以便与其他写操作合并提交（秒）
+    DB_STATEMENT_TIMEOUT_MS: int = 0  # PostgreSQL单条语句超时（毫秒，0为不限制）
+    SQLITE_JOURNAL_MODE: str = "WAL"  # SQLite日志模式（WAL允许读写并发）
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # SQLite同步级别（FULL更安全但写入更慢）
+    SQLITE_BUSY_TIMEOUT_MS: int = 15000  # SQLite等待写锁的时间（毫秒，多进程同时写入时超时会报 database is locked）
+    SQLITE_CACHE_SIZE_KB: int = 65536  # 每个SQLite连接的页缓存大小（KiB）
+    SQLITE_MMAP_SIZE: int = 268435456  # SQLite内存映射读取的大小（字节，0为关闭）
     
     # JWT配置
     SECRET_KEY: str = "your-secret-key-change-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    AUTH_TOKEN_CACHE_SIZE: int = 10000  # 缓存的已验证token数
+    AUTH_USER_CACHE_SIZE: int = 10000  # 缓存的用户快照数
+    AUTH_USER_CACHE_TTL: float = 60.0  # 用户快照缓存时间（秒，多进程部署时其他进程的修改最多延迟这么久生效）
+    
+    # 密码哈希配置
+    BCRYPT_ROUNDS: int = 12  # bcrypt cost（每加1耗时翻倍；修改后旧密码在用户下次登录时自动重新哈希）
+    PASSWORD_HASH_WORKERS: int = 2  # 计算bcrypt的线程数（同时占用的CPU核数）
+    PASSWORD_HASH_MAX_PENDING: int = 32  # 排队的哈希计算上限，超出时登录/注册返回503
     
     # Ollama配置
     OLLAMA_API_URL: str = "http://localhost:11434"
+    OLLAMA_API_URLS: str = ""  # 多个Ollama后端地址（逗号分隔，为空则只使用 OLLAMA_API_URL）
+    OLLAMA_BACKEND_MAX_CONCURRENCY: int = 0  # 单个后端同时处理的请求数上限（0为不限制，应不大于 OLLAMA_POOL_SIZE_PER_HOST）
+    OLLAMA_BACKEND_ACQUIRE_TIMEOUT: float = 60.0  # 所有后端都达到并发上限时等待的时间（秒）
+    OLLAMA_HEALTH_CHECK_INTERVAL: float = 10.0  # 后端健康检查间隔（秒，0为关闭）
+    OLLAMA_EJECT_AFTER_FAILURES: int = 3  # 后端连续失败多少次后暂停分配请求
+    OLLAMA_EJECT_SECONDS: float = 30.0  # 暂停分配的时长（秒）
     OLLAMA_MODEL: str = "qwen3:0.6b"
+    OLLAMA_SYSTEM_PROMPT: str = ""  # 系统提示词（为空则不发送）
+    OLLAMA_POOL_SIZE: int = 100  # 连接池总连接数上限
+    OLLAMA_POOL_SIZE_PER_HOST: int = 20  # 单个Ollama主机的连接数上限
+    OLLAMA_KEEPALIVE_TIMEOUT: float = 30.0  # 空闲连接保活时间（秒）
+    OLLAMA_DNS_CACHE_TTL: int = 300  # DNS缓存时间（秒）
+    
+    # 生成结果缓存配置（输入完全相同时直接返回之前的生成结果）
+    GENERATION_CACHE_ENABLED: bool = False  # 是否启用
+    GENERATION_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # 内存缓存大小上限（字节）
+    GENERATION_CACHE_TTL: float = 86400.0  # 缓存有效期（秒）
+    GENERATION_CACHE_PATH: str = ""  # 磁盘缓存的SQLite文件路径（为空则只缓存在内存中）
+    GENERATION_CACHE_DISK_MAX_BYTES: int = 512 * 1024 * 1024  # 磁盘缓存大小上限（字节）
+    
+    # 任务队列配置
+    TASK_WORKERS: int = 4  # 每个进程并发执行的任务数（即同时调用Ollama的数量，流式响应也占用这些执行槽；0为本进程不执行任务，由 python -m app.worker 执行）
+    STREAM_MAX_CONCURRENCY: int = 4  # 不执行任务的进程（TASK_WORKERS=0）同时进行的流式响应数上限
+    TASK_QUEUE_MAX_SIZE: int = 100  # 排队任务总数上限（所有进程合计），超出返回503
+    TASK_QUEUE_MAX_PER_USER: int = 5  # 单个用户排队和执行中的任务数上限（所有进程合计），超出返回429
+    TASK_QUEUE_DRAIN_TIMEOUT: float = 30.0  # 关闭时等待执行中任务完成的时间（秒），超时的任务交给其他进程重新执行
+    TASK_LEASE_SECONDS: float = 30.0  # 任务租约时长（秒），执行期间每1/3租约时长续约；进程崩溃后任务最多等待这么久被重新领取
+    TASK_MAX_ATTEMPTS: int = 3  # 任务最多被领取执行的次数（租约过期后重新执行），超过后标记为失败
+    TASK_POLL_INTERVAL: float = 1.0  # 空闲时查询待执行任务的间隔（秒；本进程创建的任务立即领取）
+    TASK_STORE_MAX_ENTRIES: int = 10000  # 内存中保留的任务状态数上限
+    TASK_STORE_FINISHED_TTL: float = 300.0  # 已结束任务在内存中保留的时间（秒）
+    TASK_DEDUP_WINDOW: float = 30.0  # 多久内同一对话的相同消息复用进行中的任务（秒，0为关闭）
+    TASK_IDEMPOTENCY_TTL: float = 86400.0  # 幂等键在进程内缓存的时间（秒，之后仍从数据库识别）
+    TASK_DEDUP_MAX_ENTRIES: int = 10000  # 进程内登记的请求数上限
+    TASK_WAIT_MAX_SECONDS: float = 25.0  # 长轮询最长等待时间（秒）
+    TASK_WAIT_RECHECK_INTERVAL: float = 1.0  # 等待期间重新查询数据库的间隔（秒，其他进程执行的任务通过查询得知结束）
+    
+    # 对话上下文缓存配置
+    CONTEXT_CACHE_MAX_CONVERSATIONS: int = 1000  # 最多缓存的对话数（LRU淘汰）
+    CONTEXT_CACHE_TTL: float = 600.0  # 对话未被访问多久后过期（秒）
+    
+    # 上下文窗口配置
+    CONTEXT_TOKEN_BUDGET: int = 2048  # 发送给Ollama的历史+当前消息的token预算（估算值）
+    CONTEXT_SUMMARY_ENABLED: bool = True  # 超出预算的早期消息是否生成滚动摘要
+    CONTEXT_SUMMARY_TARGET_RATIO: float = 0.5  # 摘要后剩余的最近消息占预算的比例
+    CONTEXT_SUMMARY_SHUTDOWN_TIMEOUT: float = 5.0  # 关闭时等待进行中的摘要的时间（秒），超时的摘要被取消
+    
+    # 响应压缩配置
+    COMPRESSION_MIN_SIZE: int = 1024  # 小于该字节数的响应不压缩
+    GZIP_COMPRESS_LEVEL: int = 6  # gzip压缩级别（1-9）
+    BROTLI_QUALITY: int = 4  # brotli压缩质量（0-11，需要安装brotli）
+    COMPRESSION_EXCLUDE_CONTENT_TYPES: str = "text/event-stream,application/x-ndjson,application/gzip,application/zip,font/woff2,image/*,audio/*,video/*"  # 不压缩的Content-Type（逗号分隔，支持 type/*）
+    
+    # 监控配置
+    METRICS_ENABLED: bool = True  # 是否提供 /metrics（Prometheus格式，多进程部署需设置 PROMETHEUS_MULTIPROC_DIR）
     
     # 日志配置
     LOG_LEVEL: str = "INFO"
     LOG_FILE: str = "logs/app.log"
     LOG_MAX_BYTES: int = 10 * 1024 * 1024  # 10MB
     LOG_BACKUP_COUNT: int = 5
+    LOG_FORMAT: str = "text"  # 日志格式：text 或 json（每行一个JSON对象）
+    LOG_QUEUE_SIZE: int = 10000  # 等待后台线程写入的日志条数上限（超出时丢弃，不阻塞请求）
+    LOG_SOCKET: str = ""  # 日志写入进程的Unix socket路径（gunicorn多进程时由 gunicorn_conf.py 设置，文件日志统一由该进程写入）
     
     # 应用配置
     PROJECT_NAME: str = "AI Chat API"
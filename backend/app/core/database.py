@@ -1,15 +1,89 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from pathlib import Path
+from typing import Any, Dict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 
 from app.core.config import settings
 
+# backend目录（alembic.ini 与 migrations/ 所在位置）
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+# 引入迁移之前 create_all 创建的表结构对应的版本
+BASELINE_REVISION = "0001"
+
+
+def normalize_database_url(url: str) -> str:
+    """PostgreSQL地址未指定驱动时使用asyncpg（postgres:// 与 postgresql:// 均可）"""
+    parsed = make_url(url)
+    if parsed.drivername in ("postgres", "postgresql"):
+        parsed = parsed.set(drivername="postgresql+asyncpg")
+    return parsed.render_as_string(hide_password=False)
+
+
+def _sqlite_pragmas() -> Dict[str, Any]:
+    """每个SQLite连接建立时执行的PRAGMA"""
+    return {
+        "journal_mode": settings.SQLITE_JOURNAL_MODE,  # WAL：读写互不阻塞
+        "synchronous": settings.SQLITE_SYNCHRONOUS,  # WAL下NORMAL不会损坏数据库，只可能丢失最后几个事务
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,  # 写锁被占用时等待而不是立即报 database is locked
+        "cache_size": -settings.SQLITE_CACHE_SIZE_KB,  # 负数表示KiB
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        "temp_store": "MEMORY",
+    }
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in _sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+    finally:
+        cursor.close()
+
+
+def create_engine_from_settings(url: str) -> AsyncEngine:
+    """
+    按配置创建异步引擎
+    
+    - SQLite：连接时设置WAL等PRAGMA；内存数据库使用默认的单连接池
+    - PostgreSQL（asyncpg）及其他数据库：使用连接池配置，并设置连接的application_name
+    """
+    url = normalize_database_url(url)
+    parsed = make_url(url)
+    options: Dict[str, Any] = {
+        "echo": settings.DB_ECHO,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    connect_args: Dict[str, Any] = {}
+    
+    is_sqlite = parsed.get_backend_name() == "sqlite"
+    is_memory = is_sqlite and parsed.database in (None, "", ":memory:")
+    if not is_memory:
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+    if is_sqlite:
+        # sqlite3模块自身的锁等待时间（秒），与busy_timeout保持一致
+        connect_args["timeout"] = settings.SQLITE_BUSY_TIMEOUT_MS / 1000
+    elif parsed.drivername == "postgresql+asyncpg":
+        connect_args["server_settings"] = {"application_name": settings.PROJECT_NAME}
+        if settings.DB_STATEMENT_TIMEOUT_MS:
+            connect_args["server_settings"]["statement_timeout"] = str(settings.DB_STATEMENT_TIMEOUT_MS)
+    
+    new_engine = create_async_engine(url, connect_args=connect_args, **options)
+    if is_sqlite:
+        event.listen(new_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return new_engine
+
 
 # 创建异步引擎
-engine = create_async_engine(
-    settings.DATABASE_URL,
-    echo=False,
-    future=True
-)
+engine = create_engine_from_settings(settings.DATABASE_URL)
 
 # 创建异步会话工厂
 AsyncSessionLocal = async_sessionmaker(
@@ -37,11 +111,31 @@ async def get_db() -> AsyncSession:
             await session.close()
 
 
+def run_migrations(connection):
+    """在同步连接上执行Alembic迁移到最新版本"""
+    from alembic import command
+    from alembic.config import Config
+    
+    config = Config(str(BACKEND_DIR / "alembic.ini"))
+    config.set_main_option("script_location", str(BACKEND_DIR / "migrations"))
+    config.attributes["connection"] = connection
+    
+    # 引入迁移之前创建的数据库没有版本表，先标记为初始版本再升级
+    inspector = inspect(connection)
+    if inspector.has_table("users") and not inspector.has_table("alembic_version"):
+        command.stamp(config, BASELINE_REVISION)
+    
+    command.upgrade(config, "head")
+
+
 async def init_db():
-    """初始化数据库（创建表）"""
+    """初始化数据库（执行迁移）"""
+    if not settings.DB_AUTO_MIGRATE:
+        return
+    
     # 导入所有模型以确保它们被注册到Base.metadata
     from app.models import User, Conversation, Message, Task
     
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
 
@@ -1,27 +1,94 @@
+import atexit
+import json
 import logging
+import os
+import pickle
+import queue
+import signal
+import socketserver
+import struct
 import sys
-from logging.handlers import RotatingFileHandler
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, SocketHandler
 from pathlib import Path
+from typing import List, Optional
 
 from app.core.config import settings
 
+# LogRecord自带的属性，其余属性视为通过 extra= 传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
 
-def setup_logging():
-    """配置日志系统"""
-    # 创建日志目录
-    log_file_path = Path(settings.LOG_FILE)
-    log_file_path.parent.mkdir(parents=True, exist_ok=True)
+_listener: Optional["_QueueListener"] = None
+_queue_handler: Optional["NonBlockingQueueHandler"] = None
+
+
+class JSONFormatter(logging.Formatter):
+    """每条日志输出一行JSON（时间、级别、logger、消息、进程号、异常和extra字段）"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    把日志记录放入内存队列，由后台线程格式化和写入
+    
+    与标准库QueueHandler不同，入队前只合并消息参数，不套用格式、不生成异常堆栈
+    （由后台线程完成），队列已满时丢弃并计数，调用方永远不会等待
+    """
     
-    # 配置日志格式
-    log_format = logging.Formatter(
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 参数可能是之后会被修改的可变对象（或者不能跨线程使用），在调用方线程中合并成字符串
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _QueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # 队列满时等待后台线程腾出位置，保证停止前写完已入队的日志
+        self.queue.put(self._sentinel)
+
+
+def _make_formatter() -> logging.Formatter:
+    if settings.LOG_FORMAT.lower() == "json":
+        return JSONFormatter()
+    return logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
-    
-    # 控制台处理器
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.INFO)
-    console_handler.setFormatter(log_format)
+
+
+def _file_handlers(formatter: logging.Formatter) -> List[logging.Handler]:
+    """应用日志和错误日志文件处理器（按大小轮转）"""
+    log_file_path = Path(settings.LOG_FILE)
+    log_file_path.parent.mkdir(parents=True, exist_ok=True)
     
     # 文件处理器（按大小轮转）
     file_handler = RotatingFileHandler(
@@ -31,10 +98,10 @@ def setup_logging():
         encoding='utf-8'
     )
     file_handler.setLevel(logging.INFO)
-    file_handler.setFormatter(log_format)
+    file_handler.setFormatter(formatter)
     
     # 错误日志文件处理器
-    error_log_file = Path(settings.LOG_FILE).parent / "error.log"
+    error_log_file = log_file_path.parent / "error.log"
     error_handler = RotatingFileHandler(
         str(error_log_file),
         maxBytes=settings.LOG_MAX_BYTES,
@@ -42,14 +109,46 @@ def setup_logging():
         encoding='utf-8'
     )
     error_handler.setLevel(logging.ERROR)
-    error_handler.setFormatter(log_format)
+    error_handler.setFormatter(formatter)
+    return [file_handler, error_handler]
+
+
+def setup_logging():
+    """
+    配置日志系统
+    
+    根日志记录器只挂一个队列处理器，调用方只做入队；格式化和控制台/文件写入在后台线程中完成。
+    设置了 LOG_SOCKET 时（gunicorn多进程，见 gunicorn_conf.py），文件日志发送给唯一的
+    日志写入进程，由它负责写入和轮转，避免多个worker同时轮转同一个文件。
+    """
+    global _listener, _queue_handler
+    formatter = _make_formatter()
+    
+    # 控制台处理器
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(formatter)
+    handlers: List[logging.Handler] = [console_handler]
+    
+    if settings.LOG_SOCKET:
+        socket_handler = SocketHandler(settings.LOG_SOCKET, None)  # port为None时使用Unix socket
+        socket_handler.setLevel(logging.INFO)
+        handlers.append(socket_handler)
+    else:
+        handlers.extend(_file_handlers(formatter))
     
     # 配置根日志记录器
     root_logger = logging.getLogger()
     root_logger.setLevel(getattr(logging, settings.LOG_LEVEL.upper()))
-    root_logger.addHandler(console_handler)
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(error_handler)
+    shutdown_logging()
+    
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    root_logger.addHandler(_queue_handler)
+    _listener = _QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.unregister(shutdown_logging)
+    atexit.register(shutdown_logging)
     
     # 配置第三方库日志级别
     logging.getLogger("uvicorn").setLevel(logging.WARNING)
@@ -57,3 +156,84 @@ def setup_logging():
     
     return root_logger
 
+
+def flush_logging(timeout: float = 5.0):
+    """
+    等待后台线程写完已入队的日志（在应用关闭时调用）
+    
+    uvicorn在关闭后会重新发出收到的SIGTERM结束进程，atexit不一定执行
+    """
+    if _listener is None:
+        return
+    deadline = time.monotonic() + timeout
+    while _listener.queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def shutdown_logging():
+    """写完队列中剩余的日志并停止后台线程"""
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        if _queue_handler.dropped:
+            print(f"{_queue_handler.dropped} log records dropped (log queue full)", file=sys.stderr)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+class _LogRecordStreamHandler(socketserver.StreamRequestHandler):
+    """接收一个worker连接发来的日志记录（4字节长度 + pickle，见 logging.handlers.SocketHandler）"""
+    
+    def handle(self):
+        while True:
+            header = self.rfile.read(4)
+            if len(header) < 4:
+                break
+            length = struct.unpack(">L", header)[0]
+            data = self.rfile.read(length)
+            if len(data) < length:
+                break
+            record = logging.makeLogRecord(pickle.loads(data))
+            for handler in self.server.log_handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+
+class _LogRecordServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = False
+    block_on_close = True  # 关闭时等待所有连接的日志处理完
+
+
+def _shutdown_on_stdin_eof(server: _LogRecordServer):
+    sys.stdin.buffer.read()
+    server.shutdown()
+
+
+def run_log_server(socket_path: str):
+    """
+    日志写入进程：接收所有worker的日志并写入文件（唯一的写入者，负责轮转）
+    
+    只接受本机Unix socket连接，socket文件权限为600。忽略SIGTERM/SIGINT（进程组一起收到信号时
+    worker还在写最后的日志），标准输入的管道被所有持有者（master和worker）关闭后才退出
+    """
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    log_handlers = _file_handlers(_make_formatter())
+    server = _LogRecordServer(socket_path, _LogRecordStreamHandler)
+    server.log_handlers = log_handlers
+    os.chmod(socket_path, 0o600)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    threading.Thread(target=_shutdown_on_stdin_eof, args=(server,), daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        for handler in log_handlers:
+            handler.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
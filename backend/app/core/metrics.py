@@ -0,0 +1,200 @@
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# 多进程部署（gunicorn）时设置 PROMETHEUS_MULTIPROC_DIR，各worker把指标写入该目录，
+# /metrics 汇总所有worker的数据；必须在导入prometheus_client之前设置（见 gunicorn_conf.py）
+
+# HTTP
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP请求耗时（流式响应到最后一个字节）",
+    ["method", "route", "status"],
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "处理中的HTTP请求数",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+
+# 数据库
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "单条SQL执行耗时",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "http_request_db_queries",
+    "每个HTTP请求执行的SQL条数（不含合并提交的写入）",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "http_request_db_seconds",
+    "每个HTTP请求执行SQL的总耗时",
+    ["route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+# Ollama
+_GENERATION_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+OLLAMA_TIME_TO_FIRST_TOKEN = Histogram(
+    "ollama_time_to_first_token_seconds",
+    "流式生成从发出请求到收到第一个token的时间",
+    ["backend"],
+    buckets=_GENERATION_BUCKETS,
+)
+OLLAMA_GENERATION_DURATION = Histogram(
+    "ollama_generation_duration_seconds",
+    "一次Ollama调用的总耗时",
+    ["backend", "mode", "outcome"],
+    buckets=_GENERATION_BUCKETS,
+)
+OLLAMA_REQUESTS_IN_FLIGHT = Gauge(
+    "ollama_requests_in_flight",
+    "进行中的Ollama调用数",
+    ["backend"],
+    multiprocess_mode="livesum",
+)
+
+# 任务队列
+TASK_QUEUE_WAIT = Histogram(
+    "task_queue_wait_seconds",
+    "任务从入队到开始执行的等待时间",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+TASK_EXECUTION_DURATION = Histogram(
+    "task_execution_duration_seconds",
+    "任务执行时间（读取上下文、调用Ollama、保存结果）",
+    ["status"],
+    buckets=_GENERATION_BUCKETS,
+)
+TASKS_QUEUED = Gauge(
+    "tasks_queued",
+    "排队中的任务数（数据库中所有进程共享，各进程领取任务时更新）",
+    multiprocess_mode="livemax",
+)
+TASKS_RUNNING = Gauge(
+    "tasks_running",
+    "执行中的任务数",
+    multiprocess_mode="livesum",
+)
+
+
+class _RequestStats:
+    """当前请求执行的SQL统计"""
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+_request_stats: ContextVar[Optional[_RequestStats]] = ContextVar("request_db_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_query_start
+    operation = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "other"
+    if operation not in ("select", "insert", "update", "delete"):
+        operation = "other"
+    DB_QUERY_DURATION.labels(operation).observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += elapsed
+
+
+def instrument_engine(engine: AsyncEngine):
+    """记录该引擎执行的每条SQL"""
+    if event.contains(engine.sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _route_label(scope: Scope) -> str:
+    """
+    路由模板（如 /api/conversations/{conversation_id}），未匹配任何路由时返回 unmatched
+
+    用模板而不是实际路径作为标签，避免标签数量随ID无限增长；较新的FastAPI中
+    scope["route"].path 不含 include_router 的前缀，用实际路径补上
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if not template:
+        return "unmatched"
+    path = scope.get("path", "")
+    try:
+        rendered = getattr(route, "path_format", template).format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        return template
+    if rendered != path and path.endswith(rendered):
+        return path[:-len(rendered)] + template
+    return template
+
+
+class MetricsMiddleware:
+    """按路由模板（而不是实际路径）记录HTTP请求耗时和每个请求的SQL条数"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        stats = _RequestStats()
+        token = _request_stats.set(stats)
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.labels(method).inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_REQUESTS_IN_PROGRESS.labels(method).dec()
+            _request_stats.reset(token)
+            route_path = _route_label(scope)
+            HTTP_REQUEST_DURATION.labels(method, route_path, str(status_code)).observe(elapsed)
+            DB_QUERIES_PER_REQUEST.labels(route_path).observe(stats.queries)
+            DB_TIME_PER_REQUEST.labels(route_path).observe(stats.seconds)
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """生成Prometheus文本格式的指标（多进程模式下汇总所有worker）"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,98 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+# 单页最大条数
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursorError(ValueError):
+    """游标格式错误"""
+    pass
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    """将 (created_at, id) 编码为不透明游标"""
+    raw = json.dumps([created_at.isoformat(), id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解码游标，格式错误时抛出InvalidCursorError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at_raw, id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(created_at_raw), int(id)
+    except Exception:
+        raise InvalidCursorError("Invalid cursor")
+
+
+async def fetch_page(
+    db: AsyncSession,
+    stmt: Select,
+    created_at_column: Any,
+    id_column: Any,
+    limit: Optional[int] = None,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    newest_first: bool = True
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    基于 (created_at, id) 的键集分页
+
+    未传游标时返回最新的一页；before 向更早方向翻页，after 向更新方向翻页
+
+    Args:
+        db: 数据库会话
+        stmt: 已包含过滤条件的查询（不要包含order_by/limit）
+        created_at_column: 排序用的时间列
+        id_column: 排序用的ID列（保证顺序唯一）
+        limit: 每页条数，None表示不限制
+        before: 返回早于该游标的记录
+        after: 返回晚于该游标的记录
+        newest_first: 结果按时间倒序（True）还是正序（False）排列
+
+    Returns:
+        (当前页记录, 继续向同一方向翻页的游标；没有更多记录时为None)
+    """
+    if before and after:
+        raise InvalidCursorError("Only one of 'before' and 'after' can be given")
+
+    key = tuple_(created_at_column, id_column)
+    forward = after is not None  # 向更新方向翻页
+
+    if before:
+        stmt = stmt.where(key < tuple_(*decode_cursor(before)))
+    if after:
+        stmt = stmt.where(key > tuple_(*decode_cursor(after)))
+
+    if forward:
+        stmt = stmt.order_by(created_at_column.asc(), id_column.asc())
+    else:
+        stmt = stmt.order_by(created_at_column.desc(), id_column.desc())
+
+    if limit is not None:
+        stmt = stmt.limit(limit + 1)  # 多取一条判断是否还有下一页
+
+    result = await db.execute(stmt)
+    if len(stmt.column_descriptions) == 1 and stmt.column_descriptions[0]["entity"] is not None:
+        rows = list(result.scalars().all())  # select(Model)：返回ORM对象
+    else:
+        rows = list(result.all())  # 按列查询：返回Row（可按列名取属性）
+
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, created_at_column.key), getattr(last, id_column.key))
+
+    # 查询顺序与展示顺序不一致时反转
+    if forward == newest_first:
+        rows.reverse()
+
+    return rows, next_cursor
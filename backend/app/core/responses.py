@@ -0,0 +1,35 @@
+import json
+from datetime import date, datetime
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson未安装时退回标准库json
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """序列化为JSON字节串（datetime输出为ISO格式，与Pydantic一致）"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    使用orjson序列化的JSON响应
+
+    直接返回该响应时FastAPI不再按response_model校验和转换内容，
+    用于已在查询中整理好字段的大列表（response_model仍用于生成接口文档）
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,12 +1,17 @@
+import asyncio
+import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Dict, Optional
 from jose import JWTError, jwt
 import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.cache import TTLCache
 from app.core.config import settings
 from app.models.user import User
 from app.core.database import get_db
@@ -17,6 +22,18 @@ logger = logging.getLogger(__name__)
 # OAuth2 token URL
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
+# 已验证的token（sha256 -> 用户ID），缓存到token过期为止
+_token_cache: TTLCache[int] = TTLCache(
+    max_size=settings.AUTH_TOKEN_CACHE_SIZE,
+    ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+)
+
+# 用户身份快照（用户ID -> 字段字典），避免每个请求查询users表
+_user_cache: TTLCache[Dict[str, Any]] = TTLCache(
+    max_size=settings.AUTH_USER_CACHE_SIZE,
+    ttl=settings.AUTH_USER_CACHE_TTL
+)
+
 
 def _prepare_password(password: str) -> bytes:
     """准备密码字节，处理 bcrypt 的 72 字节限制"""
@@ -28,7 +45,7 @@ def _prepare_password(password: str) -> bytes:
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """验证密码"""
+    """验证密码（同步，耗时约100ms以上，异步代码中请使用 password_hasher.verify）"""
     try:
         password_bytes = _prepare_password(plain_password)
         hashed_bytes = hashed_password.encode('utf-8')
@@ -38,14 +55,82 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 
 def get_password_hash(password: str) -> str:
-    """生成密码哈希"""
+    """生成密码哈希（同步，异步代码中请使用 password_hasher.hash）"""
     password_bytes = _prepare_password(password)
     # 生成盐并哈希密码
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password_bytes, salt)
     return hashed.decode('utf-8')
 
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """哈希的cost与当前配置不一致时返回True（格式：$2b$<cost>$<salt+hash>）"""
+    try:
+        return int(hashed_password.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+class PasswordHasherBusyError(Exception):
+    """等待计算的密码哈希过多"""
+    pass
+
+
+class PasswordHasher:
+    """
+    在专用线程池中计算bcrypt，避免阻塞事件循环
+    
+    bcrypt计算时释放GIL，线程池即可并行；线程数限制了同时占用的CPU核数。
+    排队（含正在计算）的请求超过 max_pending 时直接抛出 PasswordHasherBusyError，
+    登录高峰时返回503而不是让所有请求无限排队。
+    """
+    
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+    
+    async def _run(self, func, *args):
+        if self._pending >= self.max_pending:
+            raise PasswordHasherBusyError(f"{self._pending} password hashes pending")
+        
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+    
+    async def hash(self, password: str) -> str:
+        """生成密码哈希"""
+        return await self._run(get_password_hash, password)
+    
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """验证密码"""
+        return await self._run(verify_password, plain_password, hashed_password)
+    
+    def shutdown(self):
+        """关闭线程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+    
+    @property
+    def pending(self) -> int:
+        """排队和正在计算的哈希数"""
+        return self._pending
+
+
+# 创建全局实例
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING
+)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """创建JWT token"""
     to_encode = data.copy()
@@ -57,48 +142,85 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     # jose库会自动将datetime转换为timestamp
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-    logger.debug(f"Created access token for user_id: {data.get('sub')}")
+    logger.debug("Created access token for user_id: %s", data.get('sub'))
     return encoded_jwt
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_db)
-) -> User:
-    """获取当前用户（依赖注入）"""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def decode_access_token(token: str) -> Optional[int]:
+    """解析JWT token，返回用户ID；token无效时返回None（验证结果缓存到token过期）"""
+    token_hash = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    cached_user_id = _token_cache.get(token_hash)
+    if cached_user_id is not None:
+        return cached_user_id
     
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         user_id_raw = payload.get("sub")
         if user_id_raw is None:
             logger.warning("Token missing 'sub' field")
-            raise credentials_exception
+            return None
         
         # 确保user_id是整数类型
         try:
             user_id = int(user_id_raw)
+            _token_cache.set(token_hash, user_id, expires_at=payload.get("exp"))
+            return user_id
         except (ValueError, TypeError) as e:
-            logger.warning(f"Invalid user_id type: {user_id_raw}, error: {e}")
-            raise credentials_exception
+            logger.warning("Invalid user_id type: %s, error: %s", user_id_raw, e)
+            return None
     except JWTError as e:
-        logger.warning(f"JWT decode error: {e}")
-        raise credentials_exception
+        logger.warning("JWT decode error: %s", e)
+        return None
     except Exception as e:
-        logger.error(f"Unexpected error in get_current_user: {e}")
+        logger.error("Unexpected error decoding access token: %s", e)
+        return None
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """获取当前用户（依赖注入）"""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    
+    user_id = decode_access_token(token)
+    if user_id is None:
         raise credentials_exception
     
+    # 优先使用缓存的用户快照（返回未关联会话的User对象，只用于读取字段）
+    snapshot = _user_cache.get(user_id)
+    if snapshot is not None:
+        return User(**snapshot)
+    
     # 从数据库获取用户
-    from sqlalchemy import select
     result = await db.execute(select(User).where(User.id == user_id))
     user = result.scalar_one_or_none()
     
     if user is None:
         raise credentials_exception
     
+    _user_cache.set(user_id, {
+        "id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "hashed_password": user.hashed_password,
+        "created_at": user.created_at,
+    })
+    
     return user
 
+
+def invalidate_user(user_id: int):
+    """用户信息变更或删除后调用，使缓存的用户快照失效"""
+    _user_cache.pop(user_id)
+
+
+def clear_auth_caches():
+    """清空token和用户缓存（例如修改SECRET_KEY后）"""
+    _token_cache.clear()
+    _user_cache.clear()
+
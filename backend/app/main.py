@@ -2,12 +2,19 @@ import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
 from app.core.config import settings
-from app.core.logging_config import setup_logging
-from app.core.database import init_db
-from app.api import auth, conversations, messages, tasks
+from app.core.compression import CompressionMiddleware, parse_content_types
+from app.core.logging_config import flush_logging, setup_logging
+from app.core.database import engine, init_db
+from app.core.metrics import MetricsMiddleware, instrument_engine, render_metrics
+from app.core.responses import ORJSONResponse
+from app.api import auth, conversations, messages, search, tasks
+from app.core.security import password_hasher
+from app.services.ai_service import ai_service
+from app.services.task_service import task_service
+from app.services.context_builder import context_builder
 
 # 配置日志
 logger = setup_logging()
@@ -21,17 +28,29 @@ async def lifespan(app: FastAPI):
     await init_db()
     logger.info("Database initialized")
     
+    # 创建Ollama连接池
+    await ai_service.startup()
+    
+    # 启动任务队列worker
+    await task_service.start()
+    
     yield
     
-    # 关闭时清理资源
+    # 关闭时清理资源（先排空任务队列，再关闭连接池）
     logger.info("Shutting down...")
+    await task_service.shutdown()
+    await context_builder.shutdown(settings.CONTEXT_SUMMARY_SHUTDOWN_TIMEOUT)
+    await ai_service.shutdown()
+    password_hasher.shutdown()
+    flush_logging()
 
 
 # 创建FastAPI应用
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # 配置CORS
@@ -41,14 +60,29 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Idempotent-Replayed"],
+)
+
+# 响应压缩（客户端支持时优先brotli，其次gzip）
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MIN_SIZE,
+    gzip_level=settings.GZIP_COMPRESS_LEVEL,
+    brotli_quality=settings.BROTLI_QUALITY,
+    exclude_content_types=parse_content_types(settings.COMPRESSION_EXCLUDE_CONTENT_TYPES)
 )
 
+# 请求耗时和SQL统计（最外层，包含压缩的耗时）
+if settings.METRICS_ENABLED:
+    instrument_engine(engine)
+    app.add_middleware(MetricsMiddleware)
+
 
 # 异常处理中间件
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """全局异常处理"""
-    logger.error(f"Unhandled exception: {exc}", exc_info=True)
+    logger.error("Unhandled exception: %s", exc, exc_info=True)
     return JSONResponse(
         status_code=500,
         content={"detail": "Internal server error"}
@@ -60,6 +94,7 @@ app.include_router(auth.router, prefix=settings.API_V1_STR, tags=["auth"])
 app.include_router(conversations.router, prefix=settings.API_V1_STR, tags=["conversations"])
 app.include_router(messages.router, prefix=settings.API_V1_STR, tags=["messages"])
 app.include_router(tasks.router, prefix=settings.API_V1_STR, tags=["tasks"])
+app.include_router(search.router, prefix=settings.API_V1_STR, tags=["search"])
 
 
 @app.get("/")
@@ -74,6 +109,14 @@ async def health_check():
     return {"status": "healthy"}
 
 
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        """Prometheus指标（汇总文件在线程池中读取，不阻塞事件循环）"""
+        content, content_type = render_metrics()
+        return Response(content=content, media_type=content_type)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
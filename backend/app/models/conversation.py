@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, Text
 from sqlalchemy.orm import relationship
 
 from app.core.database import Base
@@ -8,13 +8,24 @@ from app.core.database import Base
 class Conversation(Base):
     """对话模型"""
     __tablename__ = "conversations"
+    __table_args__ = (
+        # 用户对话列表：WHERE user_id = ? ORDER BY created_at DESC, id DESC
+        Index("ix_conversations_user_id_created_at", "user_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     title = Column(String, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    summary = Column(Text, nullable=True)  # 早期消息的滚动摘要
+    summary_message_count = Column(Integer, nullable=False, default=0, server_default="0")  # 摘要覆盖的消息数
     
     # 关系
     user = relationship("User", back_populates="conversations")
-    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
+    messages = relationship(
+        "Message",
+        back_populates="conversation",
+        cascade="all, delete-orphan",
+        order_by="Message.created_at"
+    )
 
@@ -1,13 +1,22 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 
 from app.core.database import Base
 
 
 class Message(Base):
-    """消息模型"""
+    """
+    消息模型
+    
+    全文索引（SQLite的messages_fts表 / PostgreSQL的search_vector列）由迁移0005创建（SQLite的表在0007中重建），
+    通过触发器或生成列在数据库内同步，不经过ORM
+    """
     __tablename__ = "messages"
+    __table_args__ = (
+        # 对话内按时间读取/分页：WHERE conversation_id = ? ORDER BY created_at, id
+        Index("ix_messages_conversation_id_created_at", "conversation_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
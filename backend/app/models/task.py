@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 
 from app.core.database import Base
@@ -8,6 +8,12 @@ from app.core.database import Base
 class Task(Base):
     """任务模型（用于长任务处理）"""
     __tablename__ = "tasks"
+    __table_args__ = (
+        # 同一用户的幂等键唯一（重试时返回同一个任务）
+        Index("ix_tasks_user_id_idempotency_key", "user_id", "idempotency_key", unique=True),
+        # 领取任务：WHERE status = 'pending' / 'processing' AND lease_expires_at < ? ORDER BY id
+        Index("ix_tasks_status_id", "status", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -15,6 +21,14 @@ class Task(Base):
     status = Column(String, nullable=False, default="pending")  # pending, processing, completed, failed
     result = Column(Text, nullable=True)  # 任务结果（JSON字符串）
     error_message = Column(Text, nullable=True)  # 错误信息
+    idempotency_key = Column(String(255), nullable=True)  # 客户端提供的Idempotency-Key
+    request_hash = Column(String(64), nullable=True)  # 请求内容（对话ID + 消息）的sha256
+    conversation_id = Column(Integer, nullable=True)  # 任务输入：对话ID
+    user_message = Column(Text, nullable=True)  # 任务输入：用户消息（领取任务的进程据此执行）
+    user_message_id = Column(Integer, nullable=True)  # 已保存的用户消息ID（重新执行时不再保存）
+    lease_owner = Column(String(128), nullable=True)  # 持有租约的worker
+    lease_expires_at = Column(DateTime, nullable=True)  # 租约到期时间，到期未续约的任务可被其他worker领取
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")  # 被领取执行的次数
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -15,8 +15,8 @@ class ConversationCreate(ConversationBase):
     pass
 
 
-class ConversationResponse(ConversationBase):
-    """对话响应模型"""
+class ConversationListItemResponse(ConversationBase):
+    """对话列表项（包含完整消息；列表的分页游标在响应头 X-Next-Cursor 中）"""
     id: int
     user_id: int
     created_at: datetime
@@ -25,3 +25,25 @@ class ConversationResponse(ConversationBase):
     class Config:
         from_attributes = True
 
+
+class ConversationResponse(ConversationListItemResponse):
+    """对话响应模型"""
+    next_cursor: Optional[str] = None  # 分页时继续翻页的游标
+
+
+class MessagePreview(BaseModel):
+    """最后一条消息预览（内容截断）"""
+    id: int
+    role: str
+    content: str
+    created_at: datetime
+
+
+class ConversationSummaryResponse(ConversationBase):
+    """对话摘要响应模型（不包含完整消息）"""
+    id: int
+    user_id: int
+    created_at: datetime
+    message_count: int
+    last_message: Optional[MessagePreview] = None
+
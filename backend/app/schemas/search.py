@@ -0,0 +1,21 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class SearchResult(BaseModel):
+    """搜索结果（一条匹配的消息）"""
+    id: int
+    conversation_id: int
+    conversation_title: str
+    role: str
+    created_at: datetime
+    snippet: str  # 转义后的HTML，匹配部分用<mark>标记
+    score: float  # 越大越相关
+
+
+class SearchResponse(BaseModel):
+    """搜索响应模型"""
+    query: str
+    results: List[SearchResult]
+    next_offset: Optional[int] = None  # 下一页的offset，没有更多结果时为None
@@ -1,20 +1,70 @@
+import json
 import logging
+import time
 import aiohttp
-from typing import List, Dict, Optional
-from aiohttp import ClientError, ClientTimeout
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Dict, Optional
+from aiohttp import ClientConnectorError, ClientError, ClientTimeout, TCPConnector
 
 from app.core.config import settings
+from app.core.metrics import OLLAMA_GENERATION_DURATION, OLLAMA_REQUESTS_IN_FLIGHT, OLLAMA_TIME_TO_FIRST_TOKEN
+from app.services.generation_cache import generation_cache
+from app.services.ollama_pool import OllamaBackend, OllamaBackendPool, parse_backend_urls
 
 logger = logging.getLogger(__name__)
 
 
 class AIService:
-    """AI服务（调用Ollama API）"""
+    """AI服务（调用Ollama API，配置多个后端时按负载分配请求）"""
     
     def __init__(self):
-        self.api_url = settings.OLLAMA_API_URL
         self.model = settings.OLLAMA_MODEL
         self.timeout = ClientTimeout(total=300)  # 5分钟超时
+        self.pool = OllamaBackendPool(
+            parse_backend_urls(settings.OLLAMA_API_URLS, settings.OLLAMA_API_URL),
+            max_concurrency=settings.OLLAMA_BACKEND_MAX_CONCURRENCY,
+            failure_threshold=settings.OLLAMA_EJECT_AFTER_FAILURES,
+            ejection_time=settings.OLLAMA_EJECT_SECONDS,
+            health_check_interval=settings.OLLAMA_HEALTH_CHECK_INTERVAL,
+            acquire_timeout=settings.OLLAMA_BACKEND_ACQUIRE_TIMEOUT
+        )
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    async def startup(self):
+        """创建共享的HTTP会话、打开生成结果缓存并启动后端健康检查（在应用启动时调用）"""
+        await generation_cache.startup()
+        if self._session is not None and not self._session.closed:
+            return
+        
+        connector = TCPConnector(
+            limit=settings.OLLAMA_POOL_SIZE,
+            limit_per_host=settings.OLLAMA_POOL_SIZE_PER_HOST,
+            keepalive_timeout=settings.OLLAMA_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=settings.OLLAMA_DNS_CACHE_TTL,
+        )
+        self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        logger.info(
+            "Ollama HTTP session created (pool size: %s, per host: %s, backends: %s)",
+            settings.OLLAMA_POOL_SIZE,
+            settings.OLLAMA_POOL_SIZE_PER_HOST,
+            ", ".join(backend.url for backend in self.pool.backends)
+        )
+        self.pool.start(self.check_ollama_available)
+    
+    async def shutdown(self):
+        """停止健康检查，关闭共享的HTTP会话和生成结果缓存（在应用关闭时调用）"""
+        await self.pool.stop()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("Ollama HTTP session closed")
+        self._session = None
+        await generation_cache.shutdown()
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取共享会话（未启动时自动创建，便于在应用生命周期外使用）"""
+        if self._session is None or self._session.closed:
+            await self.startup()
+        return self._session
     
     async def generate_response(
         self,
@@ -31,52 +81,195 @@ class AIService:
         Returns:
             AI生成的响应文本
         """
-        try:
-            # 构建请求体
-            all_messages = []
-            if conversation_history:
-                all_messages.extend(conversation_history)
-            all_messages.extend(messages)
-            
-            payload = {
-                "model": self.model,
-                "messages": all_messages,
-                "stream": False  # 非流式响应
-            }
-            
-            url = f"{self.api_url}/api/chat"
-            
-            logger.info(f"Calling Ollama API: {url} with model {self.model}")
+        all_messages = self._build_messages(messages, conversation_history)
+        cache_key = generation_cache.make_key(self.model, all_messages)
+        cached = await generation_cache.get(cache_key)
+        if cached is not None:
+            logger.info("AI response served from generation cache, length: %s", len(cached))
+            return cached
+        
+        # 构建请求体
+        payload = {
+            "model": self.model,
+            "messages": all_messages,
+            "stream": False  # 非流式响应
+        }
+        
+        attempted: List[OllamaBackend] = []
+        while True:
+            try:
+                async with self._lease(attempted, "chat") as backend:
+                    url = f"{backend.url}/api/chat"
+                    
+                    logger.info("Calling Ollama API: %s with model %s", url, self.model)
+                    
+                    session = await self._get_session()
+                    async with session.post(url, json=payload) as response:
+                        if response.status == 200:
+                            result = await response.json()
+                            ai_response = result.get("message", {}).get("content", "")
+                            logger.info("AI response received, length: %s", len(ai_response))
+                            await generation_cache.set(cache_key, ai_response)
+                            return ai_response
+                        else:
+                            error_text = await response.text()
+                            logger.error("Ollama API error: %s - %s", response.status, error_text)
+                            raise Exception(f"Ollama API error: {response.status}")
             
-            async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                async with session.post(url, json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        ai_response = result.get("message", {}).get("content", "")
-                        logger.info(f"AI response received, length: {len(ai_response)}")
-                        return ai_response
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Ollama API error: {response.status} - {error_text}")
-                        raise Exception(f"Ollama API error: {response.status}")
+            except ClientConnectorError as e:
+                if self._can_retry(attempted, e):
+                    continue
+                logger.error("Network error calling Ollama API: %s", e, exc_info=True)
+                raise Exception(f"Network error: {str(e)}")
+            except ClientError as e:
+                logger.error("Network error calling Ollama API: %s", e, exc_info=True)
+                raise Exception(f"Network error: {str(e)}")
+            except Exception as e:
+                logger.error("Error generating AI response: %s", e, exc_info=True)
+                raise
+    
+    async def stream_response(
+        self,
+        messages: List[Dict[str, str]],
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ) -> AsyncIterator[str]:
+        """
+        流式生成AI响应（逐个token返回）
         
-        except ClientError as e:
-            logger.error(f"Network error calling Ollama API: {e}", exc_info=True)
-            raise Exception(f"Network error: {str(e)}")
-        except Exception as e:
-            logger.error(f"Error generating AI response: {e}", exc_info=True)
-            raise
+        Ollama流式接口返回NDJSON，每行一个JSON对象，最后一行 done=true
+        
+        Args:
+            messages: 当前消息列表 [{"role": "user", "content": "..."}]
+            conversation_history: 历史对话（可选）
+        
+        Yields:
+            AI生成的文本片段（命中生成结果缓存时一次返回全部内容）
+        """
+        all_messages = self._build_messages(messages, conversation_history)
+        cache_key = generation_cache.make_key(self.model, all_messages)
+        cached = await generation_cache.get(cache_key)
+        if cached is not None:
+            logger.info("AI stream served from generation cache, length: %s", len(cached))
+            yield cached
+            return
+        
+        payload = {
+            "model": self.model,
+            "messages": all_messages,
+            "stream": True  # 流式响应
+        }
+        
+        attempted: List[OllamaBackend] = []
+        while True:
+            try:
+                async with self._lease(attempted, "stream") as backend:
+                    url = f"{backend.url}/api/chat"
+                    
+                    logger.info("Calling Ollama streaming API: %s with model %s", url, self.model)
+                    
+                    started_at = time.monotonic()
+                    session = await self._get_session()
+                    async with session.post(url, json=payload) as response:
+                        if response.status != 200:
+                            error_text = await response.text()
+                            logger.error("Ollama API error: %s - %s", response.status, error_text)
+                            raise Exception(f"Ollama API error: {response.status}")
+                        
+                        chunks: List[str] = []
+                        completed = False
+                        async for line in response.content:
+                            line = line.strip()
+                            if not line:
+                                continue
+                            
+                            chunk = json.loads(line)
+                            if chunk.get("error"):
+                                raise Exception(f"Ollama API error: {chunk['error']}")
+                            
+                            content = chunk.get("message", {}).get("content", "")
+                            if content:
+                                if not chunks:
+                                    OLLAMA_TIME_TO_FIRST_TOKEN.labels(backend.url).observe(time.monotonic() - started_at)
+                                chunks.append(content)
+                                yield content
+                            
+                            if chunk.get("done"):
+                                completed = True
+                                break
+                        
+                        ai_response = "".join(chunks)
+                        logger.info("AI stream finished, length: %s", len(ai_response))
+                        # 只缓存完整结束的生成结果
+                        if completed:
+                            await generation_cache.set(cache_key, ai_response)
+                        return
+            
+            except ClientConnectorError as e:
+                # 连接失败发生在返回任何内容之前
+                if self._can_retry(attempted, e):
+                    continue
+                logger.error("Network error calling Ollama API: %s", e, exc_info=True)
+                raise Exception(f"Network error: {str(e)}")
+            except ClientError as e:
+                logger.error("Network error calling Ollama API: %s", e, exc_info=True)
+                raise Exception(f"Network error: {str(e)}")
     
-    async def check_ollama_available(self) -> bool:
-        """检查Ollama服务是否可用"""
+    @asynccontextmanager
+    async def _lease(self, attempted: List[OllamaBackend], mode: str) -> AsyncIterator[OllamaBackend]:
+        """从后端池占用一个后端（加入 attempted），并记录调用耗时"""
+        async with self.pool.lease(exclude=attempted) as backend:
+            attempted.append(backend)
+            in_flight = OLLAMA_REQUESTS_IN_FLIGHT.labels(backend.url)
+            in_flight.inc()
+            started_at = time.monotonic()
+            outcome = "cancelled"
+            try:
+                yield backend
+                outcome = "success"
+            except Exception:
+                outcome = "error"
+                raise
+            finally:
+                in_flight.dec()
+                OLLAMA_GENERATION_DURATION.labels(backend.url, mode, outcome).observe(time.monotonic() - started_at)
+    
+    def _can_retry(self, attempted: List[OllamaBackend], error: Exception) -> bool:
+        """连接失败时请求还没有发出，还有其他后端时换一个重试"""
+        if len(attempted) >= len(self.pool.backends):
+            return False
+        logger.warning("Cannot connect to Ollama backend %s, trying another backend: %s", attempted[-1].url, error)
+        return True
+    
+    async def check_ollama_available(self, api_url: Optional[str] = None) -> bool:
+        """
+        检查Ollama服务是否可用
+        
+        Args:
+            api_url: 要检查的后端地址；为空时检查所有后端并更新健康状态，任一可用即返回True
+        """
+        if api_url is None:
+            await self.pool.check_health(self.check_ollama_available)
+            return self.pool.is_any_available()
         try:
-            url = f"{self.api_url}/api/tags"
-            async with aiohttp.ClientSession(timeout=ClientTimeout(total=5)) as session:
-                async with session.get(url) as response:
-                    return response.status == 200
+            url = f"{api_url}/api/tags"
+            session = await self._get_session()
+            async with session.get(url, timeout=ClientTimeout(total=5)) as response:
+                return response.status == 200
         except Exception as e:
-            logger.warning(f"Ollama service check failed: {e}")
+            logger.debug("Ollama service check failed for %s: %s", api_url, e)
             return False
+    
+    @staticmethod
+    def _build_messages(
+        messages: List[Dict[str, str]],
+        conversation_history: Optional[List[Dict[str, str]]] = None
+    ) -> List[Dict[str, str]]:
+        """拼接历史对话与当前消息"""
+        all_messages = []
+        if conversation_history:
+            all_messages.extend(conversation_history)
+        all_messages.extend(messages)
+        return all_messages
 
 
 # 创建全局实例
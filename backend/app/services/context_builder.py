@@ -0,0 +1,199 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.conversation import Conversation
+from app.services.ai_service import ai_service
+from app.services.context_cache import context_cache
+
+logger = logging.getLogger(__name__)
+
+# 每条消息的固定开销（角色标记等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "你是对话摘要助手。请把下面的对话（以及已有的摘要）压缩成一段简洁的摘要，"
+    "保留用户的目标、关键事实、结论和未解决的问题，不要添加对话中没有的信息。只输出摘要内容。"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中日韩字符按1个token，其他字符按4个字符1个token"""
+    cjk = sum(1 for ch in text if "\u2e80" <= ch <= "\u9fff" or "\uac00" <= ch <= "\ud7af")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    """估算单条消息的token数"""
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextBuilder:
+    """
+    上下文构建（在TaskService与AIService之间）
+    
+    在token预算内组装发送给Ollama的历史：系统提示词 + 早期对话摘要 + 尽可能多的最近消息。
+    超出预算时，把较早的消息交给后台生成滚动摘要并保存到对话中，
+    摘要覆盖的消息数记录在 Conversation.summary_message_count。
+    """
+    
+    def __init__(self, token_budget: int, summary_enabled: bool, summary_target_ratio: float):
+        self.token_budget = token_budget
+        self.summary_enabled = summary_enabled
+        self.summary_target_ratio = summary_target_ratio
+        self._summarizing: Set[int] = set()
+        self._background_tasks: Set[asyncio.Task] = set()
+    
+    async def build(
+        self,
+        db: AsyncSession,
+        conversation: Conversation,
+        user_message: str
+    ) -> List[Dict[str, str]]:
+        """
+        构建本轮请求的历史消息（不包含当前用户消息）
+        
+        Args:
+            db: 数据库会话
+            conversation: 对话
+            user_message: 当前用户消息（计入预算）
+        
+        Returns:
+            [{"role": "...", "content": "..."}]
+        """
+        history = await context_cache.get_history(db, conversation.id)
+        
+        prefix: List[Dict[str, str]] = []
+        if settings.OLLAMA_SYSTEM_PROMPT:
+            prefix.append({"role": "system", "content": settings.OLLAMA_SYSTEM_PROMPT})
+        
+        covered = min(conversation.summary_message_count or 0, len(history))
+        if conversation.summary and covered:
+            prefix.append({"role": "system", "content": f"之前对话的摘要：\n{conversation.summary}"})
+        
+        uncovered = history[covered:]
+        available = (
+            self.token_budget
+            - sum(message_tokens(m) for m in prefix)
+            - estimate_tokens(user_message) - MESSAGE_OVERHEAD_TOKENS
+        )
+        
+        # 从最新的消息开始向前取，直到超出预算
+        window_start = len(uncovered)
+        used = 0
+        while window_start > 0:
+            cost = message_tokens(uncovered[window_start - 1])
+            if used + cost > available:
+                break
+            used += cost
+            window_start -= 1
+        
+        if window_start > 0:
+            logger.info(
+                "Conversation %s: %s older messages exceed the %s-token budget",
+                conversation.id, window_start, self.token_budget
+            )
+            if self.summary_enabled:
+                self._schedule_summary(conversation, covered, uncovered, available)
+        
+        return prefix + uncovered[window_start:]
+    
+    def _schedule_summary(
+        self,
+        conversation: Conversation,
+        covered: int,
+        uncovered: List[Dict[str, str]],
+        available: int
+    ):
+        """后台把较早的消息并入摘要，使剩余消息只占预算的一部分，避免每轮都重新摘要"""
+        if conversation.id in self._summarizing:
+            return
+        
+        target = int(available * self.summary_target_ratio)
+        keep_start = len(uncovered)
+        used = 0
+        while keep_start > 0 and used + message_tokens(uncovered[keep_start - 1]) <= target:
+            used += message_tokens(uncovered[keep_start - 1])
+            keep_start -= 1
+        if keep_start == 0:
+            return
+        
+        self._summarizing.add(conversation.id)
+        task = asyncio.create_task(self._summarize(
+            conversation_id=conversation.id,
+            previous_summary=conversation.summary if covered else None,
+            base_count=conversation.summary_message_count or 0,
+            messages=uncovered[:keep_start],
+            new_count=covered + keep_start
+        ))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _summarize(
+        self,
+        conversation_id: int,
+        previous_summary: Optional[str],
+        base_count: int,
+        messages: List[Dict[str, str]],
+        new_count: int
+    ):
+        """生成并保存滚动摘要"""
+        from app.core.database import AsyncSessionLocal
+        
+        try:
+            transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+            if previous_summary:
+                transcript = f"已有摘要：\n{previous_summary}\n\n新的对话：\n{transcript}"
+            
+            summary = await ai_service.generate_response(
+                messages=[{"role": "user", "content": transcript}],
+                conversation_history=[{"role": "system", "content": SUMMARY_PROMPT}]
+            )
+            
+            async with AsyncSessionLocal() as db:
+                # 只有摘要基于的版本未被其他进程更新时才写入
+                result = await db.execute(
+                    update(Conversation)
+                    .where(
+                        Conversation.id == conversation_id,
+                        Conversation.summary_message_count == base_count
+                    )
+                    .values(summary=summary.strip(), summary_message_count=new_count)
+                )
+                await db.commit()
+            
+            if result.rowcount:
+                logger.info("Conversation %s summary updated, covers %s messages", conversation_id, new_count)
+        except Exception as e:
+            logger.error("Failed to summarize conversation %s: %s", conversation_id, e, exc_info=True)
+        finally:
+            self._summarizing.discard(conversation_id)
+    
+    async def shutdown(self, timeout: float):
+        """
+        等待进行中的摘要任务结束
+        
+        Args:
+            timeout: 等待的最长时间（秒），超时的摘要被取消（之后构建上下文时重新生成）
+        """
+        if not self._background_tasks:
+            return
+        
+        _, pending = await asyncio.wait(list(self._background_tasks), timeout=timeout)
+        if pending:
+            logger.warning("Cancelling %s conversation summaries still running after %ss", len(pending), timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+# 创建全局实例
+context_builder = ContextBuilder(
+    token_budget=settings.CONTEXT_TOKEN_BUDGET,
+    summary_enabled=settings.CONTEXT_SUMMARY_ENABLED,
+    summary_target_ratio=settings.CONTEXT_SUMMARY_TARGET_RATIO
+)
@@ -0,0 +1,124 @@
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.message import Message
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _CachedContext:
+    """单个对话的缓存上下文"""
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    last_id: int = 0  # 已缓存的最大消息ID
+    touched_at: float = field(default_factory=time.monotonic)
+
+
+class ConversationContextCache:
+    """
+    对话上下文缓存（LRU + TTL）
+    
+    缓存每个对话的历史消息（Ollama消息格式）。每次读取时只从数据库增量加载ID大于
+    已缓存最大ID的新消息，并用消息总数校验缓存是否完整——其他worker进程写入的消息
+    会被增量补齐，无法补齐时（例如并发写入造成的空洞）整体重新加载。
+    """
+    
+    def __init__(self, max_conversations: int, ttl: float):
+        self.max_conversations = max_conversations
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, _CachedContext]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def _get_entry(self, conversation_id: int) -> Optional[_CachedContext]:
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.touched_at > self.ttl:
+            del self._entries[conversation_id]
+            return None
+        entry.touched_at = time.monotonic()
+        self._entries.move_to_end(conversation_id)
+        return entry
+    
+    def _put_entry(self, conversation_id: int, entry: _CachedContext):
+        self._entries[conversation_id] = entry
+        self._entries.move_to_end(conversation_id)
+        while len(self._entries) > self.max_conversations:
+            self._entries.popitem(last=False)
+    
+    async def get_history(self, db: AsyncSession, conversation_id: int) -> List[Dict[str, str]]:
+        """
+        获取对话历史（返回副本，调用方可以自由修改）
+        
+        Args:
+            db: 数据库会话
+            conversation_id: 对话ID
+        
+        Returns:
+            [{"role": "...", "content": "..."}]
+        """
+        entry = self._get_entry(conversation_id)
+        if entry is None:
+            self.misses += 1
+            entry = _CachedContext()
+        else:
+            self.hits += 1
+        
+        # 增量加载新消息
+        result = await db.execute(
+            select(Message.id, Message.role, Message.content)
+            .where(Message.conversation_id == conversation_id, Message.id > entry.last_id)
+            .order_by(Message.created_at, Message.id)
+        )
+        new_rows = result.all()
+        
+        if entry.last_id:
+            # 校验消息总数，不一致说明缓存有空洞，整体重新加载
+            count_result = await db.execute(
+                select(func.count(Message.id)).where(Message.conversation_id == conversation_id)
+            )
+            if count_result.scalar_one() != len(entry.messages) + len(new_rows):
+                logger.info("Context cache for conversation %s is stale, reloading", conversation_id)
+                self._entries.pop(conversation_id, None)
+                return await self.get_history(db, conversation_id)
+        
+        for msg_id, role, content in new_rows:
+            # 并发读取同一对话时，其他协程可能已经追加了这些消息
+            if msg_id <= entry.last_id:
+                continue
+            entry.messages.append({"role": role, "content": content})
+            entry.last_id = msg_id
+        
+        self._put_entry(conversation_id, entry)
+        return list(entry.messages)
+    
+    def append(self, conversation_id: int, message_id: int, role: str, content: str):
+        """消息保存后追加到缓存（对话未缓存时忽略）"""
+        entry = self._get_entry(conversation_id)
+        if entry is None or message_id <= entry.last_id:
+            return
+        entry.messages.append({"role": role, "content": content})
+        entry.last_id = message_id
+    
+    def invalidate(self, conversation_id: int):
+        """使对话缓存失效"""
+        self._entries.pop(conversation_id, None)
+    
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+
+
+# 创建全局实例
+context_cache = ConversationContextCache(
+    max_conversations=settings.CONTEXT_CACHE_MAX_CONVERSATIONS,
+    ttl=settings.CONTEXT_CACHE_TTL
+)
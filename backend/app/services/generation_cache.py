@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_messages(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """规范化消息列表（角色小写，内容统一换行符、Unicode NFC并去除首尾空白）"""
+    return [
+        {
+            "role": message["role"].strip().lower(),
+            "content": unicodedata.normalize(
+                "NFC", message["content"].replace("\r\n", "\n")
+            ).strip(),
+        }
+        for message in messages
+    ]
+
+
+class GenerationCache:
+    """
+    Ollama生成结果的精确匹配缓存（默认关闭）
+    
+    键为模型名 + 规范化消息列表的sha256，只有输入完全相同时才命中。
+    内存中按LRU + TTL淘汰，总大小不超过 max_bytes；配置 disk_path 时同时写入
+    SQLite文件，内存未命中时从磁盘读取，重启后仍然有效（多个worker进程可共用同一文件）。
+    """
+    
+    DISK_RESYNC_WRITES = 100  # 每写入这么多次重新统计一次磁盘占用（计入其他进程的写入）
+    
+    def __init__(
+        self,
+        enabled: bool,
+        max_bytes: int,
+        ttl: float,
+        disk_path: str = "",
+        disk_max_bytes: int = 0
+    ):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()  # key -> (过期时间, 内容, 字节数)
+        self._bytes = 0
+        self._disk: Optional[sqlite3.Connection] = None
+        self._disk_executor: Optional[ThreadPoolExecutor] = None
+        self._disk_bytes = 0  # 磁盘缓存的累计字节数（写入和淘汰时更新，定期重新统计）
+        self._disk_writes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]]) -> str:
+        """根据模型名和消息列表生成缓存键"""
+        raw = json.dumps(
+            {"model": model, "messages": normalize_messages(messages)},
+            ensure_ascii=False,
+            separators=(",", ":"),
+            sort_keys=True
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    async def get(self, key: str) -> Optional[str]:
+        """读取缓存的生成结果，未命中返回None"""
+        if not self.enabled:
+            return None
+        
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, content, _ = entry
+            if now < expires_at:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return content
+            self._remove(key)
+        
+        if self._disk is not None:
+            try:
+                row = await self._run_disk(self._disk_get, key, now)
+            except Exception as e:
+                # 磁盘缓存不可用（例如其他进程长时间持有锁）时按未命中处理
+                logger.warning("Failed to read generation cache from disk: %s", e)
+                row = None
+            if row is not None:
+                expires_at, content = row
+                self._store(key, content, expires_at)
+                self.hits += 1
+                self.disk_hits += 1
+                return content
+        
+        self.misses += 1
+        return None
+    
+    async def set(self, key: str, content: str):
+        """写入生成结果"""
+        if not self.enabled or not content:
+            return
+        
+        expires_at = time.time() + self.ttl
+        self._store(key, content, expires_at)
+        if self._disk is not None:
+            try:
+                await self._run_disk(self._disk_set, key, content, expires_at)
+            except Exception as e:
+                logger.warning("Failed to write generation cache to disk: %s", e)
+    
+    def _store(self, key: str, content: str, expires_at: float):
+        size = len(content.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (expires_at, content, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+    
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+    
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+    
+    async def _run_disk(self, func, *args):
+        """在单独的线程中执行SQLite操作（连接只在该线程使用）"""
+        return await asyncio.get_running_loop().run_in_executor(self._disk_executor, func, *args)
+    
+    def _disk_open(self):
+        self._disk = sqlite3.connect(self.disk_path, timeout=5, check_same_thread=False)
+        self._disk.execute("PRAGMA journal_mode = WAL")
+        self._disk.execute(
+            "CREATE TABLE IF NOT EXISTS generations ("
+            "key TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._disk.execute("CREATE INDEX IF NOT EXISTS ix_generations_accessed_at ON generations (accessed_at)")
+        self._disk.execute("DELETE FROM generations WHERE expires_at <= ?", (time.time(),))
+        self._disk.commit()
+        self._disk_bytes = self._disk.execute("SELECT COALESCE(SUM(size), 0) FROM generations").fetchone()[0]
+    
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        row = self._disk.execute(
+            "SELECT expires_at, content FROM generations WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is not None:
+            try:
+                self._disk.execute("UPDATE generations SET accessed_at = ? WHERE key = ?", (now, key))
+                self._disk.commit()
+            except sqlite3.Error as e:
+                # 只影响淘汰顺序，读到的结果仍然可用
+                self._disk.rollback()
+                logger.debug("Failed to update generation cache access time: %s", e)
+        return row
+    
+    def _disk_set(self, key: str, content: str, expires_at: float):
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        try:
+            replaced = self._disk.execute("SELECT size FROM generations WHERE key = ?", (key,)).fetchone()
+            self._disk.execute(
+                "INSERT OR REPLACE INTO generations (key, content, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, content, size, expires_at, now)
+            )
+            total = self._disk_bytes + size - (replaced[0] if replaced else 0)
+            writes = self._disk_writes + 1
+            # 按累计字节数判断容量；其他进程也会写入同一文件，超出上限或每 DISK_RESYNC_WRITES 次写入时重新统计
+            if total > self.disk_max_bytes or writes % self.DISK_RESYNC_WRITES == 0:
+                total = self._disk.execute("SELECT COALESCE(SUM(size), 0) FROM generations").fetchone()[0]
+            if total > self.disk_max_bytes:
+                total = self._disk_evict(now)
+            self._disk.commit()
+        except sqlite3.Error:
+            self._disk.rollback()
+            raise
+        # 提交成功后才更新累计值，回滚时保持与文件一致
+        self._disk_bytes = total
+        self._disk_writes = writes
+    
+    def _disk_evict(self, now: float) -> int:
+        """删除过期和最久未访问的条目直到不超过磁盘容量，返回剩余字节数"""
+        self._disk.execute("DELETE FROM generations WHERE expires_at <= ?", (now,))
+        rows = self._disk.execute("SELECT key, size FROM generations ORDER BY accessed_at").fetchall()
+        total = sum(size for _, size in rows)
+        stale = []
+        for stale_key, size in rows:
+            if total <= self.disk_max_bytes:
+                break
+            stale.append((stale_key,))
+            total -= size
+        self._disk.executemany("DELETE FROM generations WHERE key = ?", stale)
+        return total
+    
+    async def startup(self):
+        """打开磁盘缓存（在应用启动时调用）"""
+        if not self.enabled or not self.disk_path or self._disk is not None:
+            return
+        self._disk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="generation-cache")
+        try:
+            await self._run_disk(self._disk_open)
+            logger.info("Generation cache disk store opened: %s", self.disk_path)
+        except Exception as e:
+            logger.error("Failed to open generation cache disk store, using memory only: %s", e)
+            self._disk = None
+    
+    async def shutdown(self):
+        """关闭磁盘缓存"""
+        if self._disk is not None:
+            await self._run_disk(self._disk.close)
+            self._disk = None
+        if self._disk_executor is not None:
+            self._disk_executor.shutdown(wait=True)
+            self._disk_executor = None
+        if self.enabled:
+            logger.info("Generation cache stats: %s", self.stats())
+
+
+# 创建全局实例
+generation_cache = GenerationCache(
+    enabled=settings.GENERATION_CACHE_ENABLED,
+    max_bytes=settings.GENERATION_CACHE_MAX_BYTES,
+    ttl=settings.GENERATION_CACHE_TTL,
+    disk_path=settings.GENERATION_CACHE_PATH,
+    disk_max_bytes=settings.GENERATION_CACHE_DISK_MAX_BYTES
+)
@@ -0,0 +1,232 @@
+import asyncio
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class NoBackendAvailableError(Exception):
+    """等待超时仍没有可用的Ollama后端"""
+    pass
+
+
+def parse_backend_urls(urls: str, default: str) -> List[str]:
+    """解析逗号分隔的后端地址（去除末尾斜杠和重复项），为空时使用 default"""
+    result: List[str] = []
+    for url in (urls or default).split(","):
+        url = url.strip().rstrip("/")
+        if url and url not in result:
+            result.append(url)
+    return result
+
+
+class OllamaBackend:
+    """单个Ollama后端的状态"""
+    
+    def __init__(self, url: str, max_concurrency: int):
+        self.url = url
+        self.max_concurrency = max_concurrency  # 0为不限制
+        self.in_flight = 0
+        self.healthy = True  # 最近一次健康检查的结果
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0  # 被动剔除的截止时间（monotonic）
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+    
+    def has_capacity(self) -> bool:
+        return self.max_concurrency <= 0 or self.in_flight < self.max_concurrency
+    
+    def is_available(self, now: float) -> bool:
+        """健康且没有被剔除"""
+        return self.healthy and now >= self.ejected_until
+    
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "available": self.is_available(now),
+            "healthy": self.healthy,
+            "ejected_for": max(0.0, self.ejected_until - now),
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+        }
+
+
+class OllamaBackendPool:
+    """
+    Ollama后端池
+    
+    - 路由：在可用且未达到并发上限的后端中选择进行中请求最少的一个（相同时轮流选择）
+    - 主动健康检查：每 health_check_interval 秒探测一次，失败的后端不再分配请求，恢复后重新加入
+    - 被动剔除：连续失败 failure_threshold 次（连接错误、超时、非200响应）的后端
+      在 ejection_time 秒内不分配请求
+    - 所有后端都不可用时仍按进行中请求数分配，而不是直接拒绝（避免误判导致全部不可用）
+    - 所有后端都达到并发上限时等待，超过 acquire_timeout 秒抛出 NoBackendAvailableError
+    
+    状态只在当前进程内统计，多worker部署时各进程分别路由。
+    """
+    
+    def __init__(
+        self,
+        urls: List[str],
+        max_concurrency: int = 0,
+        failure_threshold: int = 3,
+        ejection_time: float = 30.0,
+        health_check_interval: float = 10.0,
+        acquire_timeout: float = 60.0
+    ):
+        if not urls:
+            raise ValueError("At least one Ollama backend URL is required")
+        self.backends = [OllamaBackend(url, max_concurrency) for url in urls]
+        self.failure_threshold = failure_threshold
+        self.ejection_time = ejection_time
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self._rotation = itertools.count()
+        self._changed: Optional[asyncio.Event] = None  # 有后端释放或健康状态变化时触发
+        self._health_task: Optional[asyncio.Task] = None
+    
+    def _pick(self, exclude: Optional[List[OllamaBackend]] = None) -> Optional[OllamaBackend]:
+        """选择进行中请求最少的后端，都达到并发上限时返回None"""
+        now = time.monotonic()
+        backends = self.backends
+        if exclude:
+            backends = [backend for backend in backends if backend not in exclude] or self.backends
+        candidates = [backend for backend in backends if backend.is_available(now)]
+        if not candidates:
+            candidates = backends
+        candidates = [backend for backend in candidates if backend.has_capacity()]
+        if not candidates:
+            return None
+        least = min(backend.in_flight for backend in candidates)
+        candidates = [backend for backend in candidates if backend.in_flight == least]
+        return candidates[next(self._rotation) % len(candidates)]
+    
+    async def acquire(self, exclude: Optional[List[OllamaBackend]] = None) -> OllamaBackend:
+        """
+        分配一个后端（调用方完成后必须调用 release）
+        
+        Args:
+            exclude: 本次请求已经失败过的后端，还有其他后端时不再选择
+        """
+        deadline = time.monotonic() + self.acquire_timeout
+        backend = self._pick(exclude)
+        while backend is None:
+            if self._changed is None:
+                self._changed = asyncio.Event()
+            changed = self._changed
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise NoBackendAvailableError(
+                    f"All Ollama backends are busy (waited {self.acquire_timeout:.0f}s)"
+                )
+            backend = self._pick(exclude)
+        backend.in_flight += 1
+        backend.requests += 1
+        return backend
+    
+    def release(self, backend: OllamaBackend, success: Optional[bool]):
+        """
+        归还后端
+        
+        Args:
+            success: 请求是否成功；None表示结果与后端无关（如客户端中途断开），不计入统计
+        """
+        backend.in_flight -= 1
+        if success:
+            backend.consecutive_failures = 0
+        elif success is not None:
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            if backend.consecutive_failures >= self.failure_threshold:
+                self._eject(backend)
+        self._notify()
+    
+    def _notify(self):
+        """唤醒等待中的 acquire"""
+        if self._changed is not None:
+            self._changed.set()
+            self._changed = None
+    
+    def _eject(self, backend: OllamaBackend):
+        now = time.monotonic()
+        if now < backend.ejected_until:
+            return
+        backend.ejected_until = now + self.ejection_time
+        backend.ejections += 1
+        backend.consecutive_failures = 0
+        logger.warning(
+            "Ollama backend %s ejected for %.0fs after %s consecutive failures",
+            backend.url, self.ejection_time, self.failure_threshold
+        )
+    
+    @asynccontextmanager
+    async def lease(self, exclude: Optional[List[OllamaBackend]] = None) -> AsyncIterator[OllamaBackend]:
+        """
+        在上下文中占用一个后端
+        
+        上下文内抛出的异常都记为该后端的失败；取消和生成器关闭（客户端断开）不计入
+        """
+        backend = await self.acquire(exclude)
+        success: Optional[bool] = None
+        try:
+            yield backend
+            success = True
+        except Exception:
+            success = False
+            raise
+        finally:
+            self.release(backend, success)
+    
+    def is_any_available(self) -> bool:
+        now = time.monotonic()
+        return any(backend.is_available(now) for backend in self.backends)
+    
+    def stats(self) -> List[Dict[str, Any]]:
+        """各后端的状态"""
+        now = time.monotonic()
+        return [backend.stats(now) for backend in self.backends]
+    
+    async def check_health(self, probe: Callable[[str], Awaitable[bool]]):
+        """探测所有后端并更新健康状态"""
+        results = await asyncio.gather(*(probe(backend.url) for backend in self.backends))
+        for backend, healthy in zip(self.backends, results):
+            if healthy != backend.healthy:
+                if healthy:
+                    logger.info("Ollama backend %s is healthy again", backend.url)
+                else:
+                    logger.warning("Ollama backend %s failed health check", backend.url)
+            backend.healthy = healthy
+        self._notify()
+    
+    async def _health_loop(self, probe: Callable[[str], Awaitable[bool]]):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            try:
+                await self.check_health(probe)
+            except Exception as e:
+                logger.error("Ollama health check failed: %s", e, exc_info=True)
+    
+    def start(self, probe: Callable[[str], Awaitable[bool]]):
+        """启动后台健康检查（interval<=0时不启动）"""
+        if self.health_check_interval <= 0 or self._health_task is not None:
+            return
+        self._health_task = asyncio.create_task(self._health_loop(probe))
+    
+    async def stop(self):
+        """停止后台健康检查"""
+        if self._health_task is None:
+            return
+        self._health_task.cancel()
+        try:
+            await self._health_task
+        except asyncio.CancelledError:
+            pass
+        self._health_task = None
@@ -0,0 +1,216 @@
+import html
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import column, func, literal_column, select, table
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.conversation import Conversation
+from app.models.message import Message
+
+# 片段中标记匹配位置的控制字符（转义HTML后替换为<mark>，避免消息内容中的HTML被渲染）
+_MARK_START = "\x02"
+_MARK_STOP = "\x03"
+_ELLIPSIS = "…"
+
+# 最多使用的搜索词数
+MAX_TERMS = 10
+
+# trigram分词按3个字符建索引，更短的词无法通过FTS5匹配，改用LIKE
+MIN_FTS_TERM_LENGTH = 3
+
+# 片段长度（FTS5按token计，trigram下约等于字符数；LIKE回退按字符计）
+SNIPPET_TOKENS = 48
+SNIPPET_CHARS = 80
+
+# PostgreSQL ts_headline 参数
+_HEADLINE_OPTIONS = (
+    f"StartSel={_MARK_START}, StopSel={_MARK_STOP}, MaxWords=24, MinWords=8, "
+    f"MaxFragments=2, FragmentDelimiter=\" {_ELLIPSIS} \""
+)
+
+# 由迁移0005/0007创建的FTS5表（外部内容表，rowid即messages.id，user_id为所属对话的用户，不参与索引）
+_messages_fts = table("messages_fts", column("rowid"), column("user_id"))
+_fts = literal_column("messages_fts")
+
+# 由迁移0005创建的PostgreSQL生成列
+_search_vector = literal_column("messages.search_vector")
+
+_RESULT_COLUMNS = (
+    Message.id,
+    Message.conversation_id,
+    Conversation.title.label("conversation_title"),
+    Message.role,
+    Message.created_at,
+)
+
+
+def parse_terms(query: str) -> List[str]:
+    """按空白拆分搜索词（去重，最多 MAX_TERMS 个）"""
+    terms: List[str] = []
+    for term in query.split():
+        if term.lower() not in (existing.lower() for existing in terms):
+            terms.append(term)
+    return terms[:MAX_TERMS]
+
+
+def fts5_query(terms: List[str]) -> str:
+    """把搜索词转换为FTS5查询：每个词作为短语（转义双引号，不解析运算符），全部匹配"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _highlight(snippet: str) -> str:
+    """转义HTML并把匹配标记替换为<mark>"""
+    return html.escape(snippet).replace(_MARK_START, "<mark>").replace(_MARK_STOP, "</mark>")
+
+
+def make_snippet(content: str, terms: List[str]) -> str:
+    """截取第一个匹配词附近的内容并高亮所有匹配（LIKE回退时使用）"""
+    pattern = re.compile("|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)), re.IGNORECASE)
+    first = pattern.search(content)
+    start = max(0, first.start() - SNIPPET_CHARS // 4) if first else 0
+    end = min(len(content), start + SNIPPET_CHARS)
+    window = pattern.sub(lambda match: _MARK_START + match.group(0) + _MARK_STOP, content[start:end])
+    return (_ELLIPSIS if start > 0 else "") + _highlight(window) + (_ELLIPSIS if end < len(content) else "")
+
+
+class SearchService:
+    """
+    消息全文搜索（只搜索当前用户的对话）
+    
+    - SQLite：FTS5（trigram分词）按bm25排序；短于3个字符的词用LIKE在候选结果中过滤，
+      全部是短词时退化为LIKE扫描该用户的消息
+    - PostgreSQL：tsvector生成列 + GIN索引，websearch_to_tsquery解析查询，按ts_rank_cd排序
+    - 其他数据库：LIKE扫描，按时间倒序
+    
+    片段为转义后的HTML，匹配部分用<mark>标记；分数越大越相关（LIKE扫描时为0）
+    """
+    
+    async def search(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        query: str,
+        limit: int,
+        offset: int = 0
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        搜索消息
+        
+        Returns:
+            (当前页结果, 下一页的offset；没有更多结果时为None)
+        """
+        terms = parse_terms(query)
+        if not terms:
+            return [], None
+        
+        dialect = db.bind.dialect.name
+        long_terms = [term for term in terms if len(term) >= MIN_FTS_TERM_LENGTH]
+        if dialect == "sqlite" and long_terms:
+            rows = await self._search_sqlite(db, user_id, terms, long_terms, limit + 1, offset)
+        elif dialect == "postgresql":
+            rows = await self._search_postgresql(db, user_id, query, limit + 1, offset)
+        else:
+            rows = await self._search_like(db, user_id, terms, limit + 1, offset)
+        
+        next_offset = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_offset = offset + limit
+        return rows, next_offset
+    
+    async def _search_sqlite(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        terms: List[str],
+        long_terms: List[str],
+        limit: int,
+        offset: int
+    ) -> List[Dict[str, Any]]:
+        rank = func.bm25(_fts)
+        stmt = (
+            select(
+                *_RESULT_COLUMNS,
+                func.snippet(_fts, 0, _MARK_START, _MARK_STOP, _ELLIPSIS, SNIPPET_TOKENS).label("snippet"),
+                (-rank).label("score")
+            )
+            .select_from(_messages_fts)
+            .join(Message, Message.id == _messages_fts.c.rowid)
+            .join(Conversation, Conversation.id == Message.conversation_id)
+            # 在FTS行上按用户过滤，排序和分页只针对当前用户的匹配
+            .where(_fts.op("MATCH")(fts5_query(long_terms)), _messages_fts.c.user_id == user_id)
+            .where(Conversation.user_id == user_id)
+            .where(*(
+                Message.content.icontains(term, autoescape=True)
+                for term in terms if len(term) < MIN_FTS_TERM_LENGTH
+            ))
+            .order_by(rank, Message.id.desc())
+            .limit(limit)
+            .offset(offset)
+        )
+        result = await db.execute(stmt)
+        return [{**row._asdict(), "snippet": _highlight(row.snippet)} for row in result.all()]
+    
+    async def _search_postgresql(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        query: str,
+        limit: int,
+        offset: int
+    ) -> List[Dict[str, Any]]:
+        tsquery = func.websearch_to_tsquery("simple", query)
+        # 先排序分页，只为当前页生成片段（ts_headline需要重新分析全文）
+        rank = func.ts_rank_cd(_search_vector, tsquery)
+        page = (
+            select(Message.id, rank.label("score"))
+            .join(Conversation, Conversation.id == Message.conversation_id)
+            .where(Conversation.user_id == user_id, _search_vector.op("@@")(tsquery))
+            .order_by(rank.desc(), Message.id.desc())
+            .limit(limit)
+            .offset(offset)
+            .subquery()
+        )
+        stmt = (
+            select(
+                *_RESULT_COLUMNS,
+                func.ts_headline("simple", Message.content, tsquery, _HEADLINE_OPTIONS).label("snippet"),
+                page.c.score
+            )
+            .select_from(page)
+            .join(Message, Message.id == page.c.id)
+            .join(Conversation, Conversation.id == Message.conversation_id)
+            .order_by(page.c.score.desc(), Message.id.desc())
+        )
+        result = await db.execute(stmt)
+        return [{**row._asdict(), "snippet": _highlight(row.snippet)} for row in result.all()]
+    
+    async def _search_like(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        terms: List[str],
+        limit: int,
+        offset: int
+    ) -> List[Dict[str, Any]]:
+        stmt = (
+            select(*_RESULT_COLUMNS, Message.content)
+            .join(Conversation, Conversation.id == Message.conversation_id)
+            .where(Conversation.user_id == user_id)
+            .where(*(Message.content.icontains(term, autoescape=True) for term in terms))
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(limit)
+            .offset(offset)
+        )
+        result = await db.execute(stmt)
+        results = []
+        for row in result.all():
+            item = row._asdict()
+            content = item.pop("content")
+            results.append({**item, "snippet": make_snippet(content, terms), "score": 0.0})
+        return results
+
+
+# 创建全局实例
+search_service = SearchService()
@@ -0,0 +1,75 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Optional, Tuple
+
+
+class SingleFlight:
+    """
+    进程内重复请求合并（single-flight）
+
+    键第一次出现时登记一个future，由第一个调用方在创建完成后设置结果（如task_id）；
+    有效期内相同键的调用等待并复用这个结果，而不是重复创建。
+    第一个调用方失败时后续调用方各自重新创建。
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, str, asyncio.Future]]" = OrderedDict()
+
+    async def run(
+        self,
+        key: Hashable,
+        ttl: float,
+        fingerprint: str,
+        create: Callable[[], Awaitable[Tuple[str, bool]]],
+        reusable: Callable[[str], bool],
+        on_mismatch: Optional[Callable[[], Exception]] = None
+    ) -> Tuple[str, bool]:
+        """
+        执行或复用
+
+        Args:
+            key: 合并键
+            ttl: 登记后多久内可以复用（秒）
+            fingerprint: 请求内容摘要，同一个键对应不同内容时调用 on_mismatch
+            create: 实际创建的协程函数，返回 (结果, 是否复用了已有结果)
+            reusable: 判断已有结果是否仍可复用（例如任务未失败）
+            on_mismatch: 返回要抛出的异常；为None时按新请求处理
+
+        Returns:
+            (结果, 是否复用了已有结果)
+        """
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            _, entry_fingerprint, future = entry
+            if entry_fingerprint != fingerprint:
+                if on_mismatch is not None:
+                    raise on_mismatch()
+            else:
+                result = await asyncio.shield(future)
+                if result is not None and reusable(result):
+                    return result, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = (now + ttl, fingerprint, future)
+        self._entries.move_to_end(key)
+        self._prune(now)
+        try:
+            result, reused = await create()
+        except BaseException:
+            future.set_result(None)  # 等待中的调用方改为各自创建
+            if self._entries.get(key, (None, None, None))[2] is future:
+                del self._entries[key]
+            raise
+        future.set_result(result)
+        return result, reused
+
+    def _prune(self, now: float):
+        """从最早登记的条目开始删除已过期的条目，超出容量时删除最早的条目"""
+        while self._entries:
+            expires_at = next(iter(self._entries.values()))[0]
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
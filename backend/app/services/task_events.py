@@ -0,0 +1,48 @@
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Set
+
+logger = logging.getLogger(__name__)
+
+# 任务的终止状态
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+class TaskEventHub:
+    """
+    进程内任务状态发布/订阅中心
+    
+    TaskService在任务状态变化并提交后发布事件，WebSocket和长轮询接口订阅后立即收到通知。
+    只在同一进程内有效，订阅方需要配合定期查询数据库兜底（任务可能在其他worker进程执行）。
+    """
+    
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+    
+    @contextmanager
+    def subscribe(self, task_id: str) -> Iterator[asyncio.Queue]:
+        """订阅任务状态变化，退出上下文时自动取消订阅"""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(task_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[task_id]
+    
+    def publish(self, task_id: str, event: Dict[str, Any]):
+        """发布任务状态（TaskResponse格式的字典）"""
+        subscribers = self._subscribers.get(task_id)
+        if not subscribers:
+            return
+        for queue in subscribers:
+            queue.put_nowait(event)
+        logger.debug("Task %s event '%s' delivered to %s subscribers", task_id, event.get('status'), len(subscribers))
+
+
+# 创建全局实例
+task_events = TaskEventHub()
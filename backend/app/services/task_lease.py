@@ -0,0 +1,275 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.message import Message
+from app.models.task import Task
+from app.services.write_batcher import write_batcher
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLostError(Exception):
+    """租约已过期并被其他worker领取（或任务已结束），当前worker不能再写入该任务"""
+    pass
+
+
+@dataclass
+class LeasedTask:
+    """领取到的任务"""
+    id: int
+    task_id: str
+    user_id: int
+    conversation_id: int
+    user_message: str
+    user_message_id: Optional[int]  # 之前的执行已保存的用户消息
+    attempts: int  # 包括本次在内的执行次数
+    created_at: datetime
+    updated_at: datetime
+
+
+_LEASED_COLUMNS = (
+    Task.id, Task.task_id, Task.user_id, Task.conversation_id, Task.user_message,
+    Task.user_message_id, Task.attempts, Task.created_at, Task.updated_at,
+)
+
+
+class TaskLeases:
+    """
+    基于tasks表的任务租约
+    
+    worker通过一条 UPDATE ... RETURNING 把待执行的任务标记为processing并写入自己的标识和
+    租约到期时间，同一任务只会被一个worker领取；执行期间定期续约。worker崩溃或重启后
+    租约不再续期，到期后任务可被任何worker重新领取，执行次数达到上限的任务标记为失败。
+    
+    执行结果的写入都以“仍持有租约”为条件（fencing），租约已被其他worker接管时抛出
+    LeaseLostError并回滚，迟到的worker不会覆盖结果或重复保存消息。
+    所有写入都通过 write_batcher 与其他写入合并提交。
+    """
+    
+    def __init__(self, lease_seconds: float, max_attempts: int):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+    
+    def _expires_at(self, now: datetime) -> datetime:
+        return now + timedelta(seconds=self.lease_seconds)
+    
+    def leased_values(self, owner: str, now: datetime) -> Dict[str, Any]:
+        """新建任务时直接由owner领取（创建任务的进程有空闲执行槽时，省去一次领取）"""
+        return {
+            "status": "processing",
+            "lease_owner": owner,
+            "lease_expires_at": self._expires_at(now),
+            "attempts": 1
+        }
+    
+    @staticmethod
+    def leased_task(task: Task) -> LeasedTask:
+        """由已领取的任务记录生成LeasedTask"""
+        return LeasedTask(**{column.key: getattr(task, column.key) for column in _LEASED_COLUMNS})
+    
+    def _claimable(self, now: datetime):
+        """可领取的任务：待执行，或租约已过期且未达到执行次数上限"""
+        return and_(
+            Task.user_message.is_not(None),
+            or_(
+                Task.status == "pending",
+                and_(
+                    Task.status == "processing",
+                    Task.lease_expires_at < now,
+                    Task.attempts < self.max_attempts
+                )
+            )
+        )
+    
+    def _abandoned(self, now: datetime):
+        """租约已过期且执行次数已达上限的任务"""
+        return and_(
+            Task.status == "processing",
+            Task.lease_expires_at < now,
+            Task.attempts >= self.max_attempts
+        )
+    
+    async def claim(self, owner: str, limit: int) -> Tuple[List[LeasedTask], int]:
+        """
+        领取最多limit个任务（按用户轮流：先取每个用户最早的任务，避免单个用户饿死其他用户）
+        
+        同时把租约过期且执行次数已达上限的任务标记为失败。先用只读查询检查，
+        没有可领取的任务时不开启写事务（空闲轮询不占用SQLite的写锁）
+        
+        Returns:
+            (领取到的任务, 可领取的任务总数)
+        """
+        from app.core.database import AsyncSessionLocal
+        
+        now = datetime.utcnow()
+        async with AsyncSessionLocal() as db:
+            available, abandoned = (await db.execute(
+                select(
+                    func.count(Task.id).filter(self._claimable(now)),
+                    func.count(Task.id).filter(self._abandoned(now))
+                ).where(Task.status.in_(("pending", "processing")))
+            )).one()
+        if not available and not abandoned:
+            return [], 0
+        
+        async def operation(db: AsyncSession) -> List[LeasedTask]:
+            now = datetime.utcnow()
+            if abandoned:
+                reaped = await db.execute(
+                    update(Task)
+                    .where(self._abandoned(now))
+                    .values(
+                        status="failed",
+                        error_message=f"Task abandoned after {self.max_attempts} attempts",
+                        lease_owner=None,
+                        lease_expires_at=None,
+                        updated_at=now
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                if reaped.rowcount:
+                    logger.warning(
+                        "%s tasks marked as failed: lease expired after %s attempts",
+                        reaped.rowcount, self.max_attempts
+                    )
+            if not available or limit <= 0:
+                return []
+            
+            user_rank = func.row_number().over(partition_by=Task.user_id, order_by=Task.id)
+            candidates = select(Task.id, user_rank.label("user_rank")).where(self._claimable(now)).subquery()
+            ids = select(candidates.c.id).order_by(candidates.c.user_rank, candidates.c.id).limit(limit)
+            # 外层条件再检查一次：并发领取时（PostgreSQL）行被其他事务更新后重新判断
+            result = await db.execute(
+                update(Task)
+                .where(Task.id.in_(ids), self._claimable(now))
+                .values(
+                    status="processing",
+                    lease_owner=owner,
+                    lease_expires_at=self._expires_at(now),
+                    attempts=Task.attempts + 1,
+                    updated_at=now
+                )
+                .returning(*_LEASED_COLUMNS)
+                .execution_options(synchronize_session=False)
+            )
+            return sorted((LeasedTask(**row._asdict()) for row in result.all()), key=lambda task: task.id)
+        
+        return await write_batcher.execute(operation), available
+    
+    async def renew(self, owner: str, task_ids: List[str]) -> Set[str]:
+        """续约，返回仍持有租约的任务ID"""
+        if not task_ids:
+            return set()
+        
+        async def operation(db: AsyncSession) -> Set[str]:
+            now = datetime.utcnow()
+            result = await db.execute(
+                update(Task)
+                .where(Task.task_id.in_(task_ids), Task.lease_owner == owner, Task.status == "processing")
+                .values(lease_expires_at=self._expires_at(now))
+                .returning(Task.task_id)
+                .execution_options(synchronize_session=False)
+            )
+            return set(result.scalars().all())
+        
+        return await write_batcher.execute(operation)
+    
+    async def release(self, owner: str, task_ids: List[str]):
+        """放回未执行完的任务（关闭时），其他worker可以立即领取；主动放回不计入执行次数"""
+        if not task_ids:
+            return
+        
+        async def operation(db: AsyncSession):
+            await db.execute(
+                update(Task)
+                .where(Task.task_id.in_(task_ids), Task.lease_owner == owner, Task.status == "processing")
+                .values(
+                    status="pending",
+                    lease_owner=None,
+                    lease_expires_at=None,
+                    attempts=Task.attempts - 1,
+                    updated_at=datetime.utcnow()
+                )
+                .execution_options(synchronize_session=False)
+            )
+        
+        await write_batcher.execute(operation)
+    
+    async def _fenced_update(self, db: AsyncSession, owner: str, task_id: str, **values: Any):
+        """仍持有租约时更新任务，否则抛出LeaseLostError（所在事务随之回滚）"""
+        result = await db.execute(
+            update(Task)
+            .where(Task.task_id == task_id, Task.lease_owner == owner, Task.status == "processing")
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            raise LeaseLostError(f"Lease on task {task_id} was lost")
+    
+    async def save_message(
+        self,
+        owner: str,
+        task_id: str,
+        message: Callable[[], Message],
+        task_values: Callable[[Message], Dict[str, Any]],
+        finish: bool = False
+    ) -> Message:
+        """
+        在同一事务中保存消息并更新任务（持有租约时）
+        
+        Args:
+            message: 创建消息对象的函数（批次失败重新执行时创建新对象）
+            task_values: 根据保存后的消息（已分配ID）生成要更新的任务字段
+            finish: 同时结束任务并释放租约
+        """
+        async def operation(db: AsyncSession) -> Message:
+            instance = message()
+            db.add(instance)
+            await db.flush()
+            values = task_values(instance)
+            if finish:
+                values.update(self._finished_values())
+            await self._fenced_update(db, owner, task_id, **values)
+            return instance
+        
+        return await write_batcher.execute(operation)
+    
+    async def finish(self, owner: str, task_id: str, **values: Any):
+        """结束任务（写入结果或错误并释放租约）"""
+        async def operation(db: AsyncSession):
+            await self._fenced_update(db, owner, task_id, **values, **self._finished_values())
+        
+        await write_batcher.execute(operation)
+    
+    @staticmethod
+    def _finished_values() -> Dict[str, Any]:
+        return {"lease_owner": None, "lease_expires_at": None, "updated_at": datetime.utcnow()}
+    
+    @staticmethod
+    async def count_unfinished(db: AsyncSession, user_id: int) -> Tuple[int, int]:
+        """
+        未结束的任务数：(所有用户待执行的任务, 该用户待执行和执行中的任务)
+        
+        单个用户的上限包括执行中的任务：创建时直接领取的任务（见 TaskWorker.reserve）
+        不经过pending状态，只统计pending时单个用户可以占满所有执行槽而不受限制
+        """
+        result = await db.execute(
+            select(
+                func.count(Task.id).filter(Task.status == "pending"),
+                func.count(Task.id).filter(Task.user_id == user_id)
+            ).where(Task.status.in_(("pending", "processing")))
+        )
+        pending, for_user = result.one()
+        return pending, for_user
+
+# 创建全局实例
+task_leases = TaskLeases(
+    lease_seconds=settings.TASK_LEASE_SECONDS,
+    max_attempts=settings.TASK_MAX_ATTEMPTS
+)
@@ -1,177 +1,634 @@
 import asyncio
+import hashlib
 import logging
+import os
+import socket
+import time
 import uuid
 import json
-from typing import Optional
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 
+from app.core.config import settings
+from app.core.metrics import TASK_EXECUTION_DURATION, TASK_QUEUE_WAIT, TASKS_QUEUED, TASKS_RUNNING
 from app.models.task import Task
 from app.models.message import Message
 from app.models.conversation import Conversation
 from app.services.ai_service import ai_service
+from app.services.context_builder import context_builder
+from app.services.context_cache import context_cache
+from app.services.single_flight import SingleFlight
+from app.services.task_events import task_events, TERMINAL_STATUSES
+from app.services.task_lease import LeasedTask, LeaseLostError, task_leases
+from app.services.task_store import task_store, TaskState
+from app.services.write_batcher import write_batcher
 
 logger = logging.getLogger(__name__)
 
 
+class TaskQueueFullError(Exception):
+    """任务队列已满（per_user=True 表示单个用户的排队数已达上限）"""
+    
+    def __init__(self, message: str, per_user: bool = False):
+        super().__init__(message)
+        self.per_user = per_user
+
+
+class IdempotencyKeyConflictError(Exception):
+    """同一个Idempotency-Key被用于不同的请求内容"""
+    pass
+
+
+def request_hash(conversation_id: int, user_message: str) -> str:
+    """请求内容摘要（用于识别重复提交）"""
+    return hashlib.sha256(f"{conversation_id}\n{user_message}".encode("utf-8")).hexdigest()
+
+
+class TaskWorker:
+    """
+    从tasks表领取并执行任务的worker（每个进程一个）
+    
+    有空闲执行槽时领取任务（按用户轮流，见 TaskLeases.claim），执行期间每1/3租约时长续约；
+    续约发现租约已被其他进程接管时取消本地执行。没有任务时每 poll_interval 秒查询一次，
+    本进程创建任务或有任务结束时立即领取；有空闲执行槽且上次领取时没有剩余排队任务时，
+    本进程新建的任务在写入时直接领取（见 reserve / adopt），省去一次领取事务。API进程和独立的worker进程（python -m app.worker）
+    使用同一套逻辑，进程崩溃或重启后其租约到期，任务由其他进程重新执行。
+    """
+    
+    def __init__(self, concurrency: int, poll_interval: float):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.owner = ""
+        self._running: Dict[str, asyncio.Task] = {}
+        self._reserved = 0
+        self._backlog = 0
+        self._handler: Optional[Callable[[LeasedTask], Awaitable[None]]] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._claimer: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._closing = False
+    
+    @property
+    def running(self) -> int:
+        """执行中的任务数"""
+        return len(self._running)
+    
+    def is_running(self, task_id: str) -> bool:
+        """任务是否正在本进程执行"""
+        return task_id in self._running
+    
+    def has_free_slot(self) -> bool:
+        """是否有空闲执行槽"""
+        limit = self.concurrency if self._claimer is not None else settings.STREAM_MAX_CONCURRENCY
+        return not self._closing and len(self._running) + self._reserved < limit
+    
+    def acquire_slot(self) -> bool:
+        """
+        占用一个执行槽（流式响应与任务共用 TASK_WORKERS 个执行槽；本进程不执行任务时
+        流式响应数由 STREAM_MAX_CONCURRENCY 限制），没有空闲执行槽时返回False
+        """
+        if not self.has_free_slot():
+            return False
+        self._reserved += 1
+        return True
+    
+    def release_slot(self):
+        """释放 acquire_slot 占用的执行槽"""
+        self._reserved -= 1
+        self.notify()
+    
+    def reserve(self) -> Optional[str]:
+        """
+        为本进程新建的任务预留执行槽（有空闲执行槽且没有已知的排队任务时）
+        
+        Returns:
+            预留成功时返回租约标识，任务记录直接以该标识领取后交给 adopt；否则返回None
+        """
+        if self._claimer is None or self._backlog > 0 or not self.acquire_slot():
+            return None
+        return self.owner
+    
+    async def adopt(self, job: Optional[LeasedTask]):
+        """执行创建时已领取的任务，并释放预留的执行槽（任务记录写入失败时job为None）"""
+        if job is None:
+            self.release_slot()
+            return
+        self._reserved -= 1
+        if self._closing:
+            # 写入期间开始关闭：放回任务，由其他进程执行
+            await task_leases.release(self.owner, [job.task_id])
+        else:
+            self._running[job.task_id] = asyncio.create_task(self._run(job, self._handler))
+    
+    def notify(self):
+        """唤醒领取循环（有新任务或空闲执行槽）"""
+        if self._wake is not None:
+            self._wake.set()
+    
+    async def start(self, handler: Callable[[LeasedTask], Awaitable[None]]):
+        """启动领取和续约协程（concurrency<=0时本进程不执行任务）"""
+        if self._claimer is not None or self.concurrency <= 0:
+            return
+        
+        # 每次启动使用新的标识（fork后的进程、重启后的进程不会沿用之前的租约）
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._closing = False
+        self._handler = handler
+        self._wake = asyncio.Event()
+        self._claimer = asyncio.create_task(self._claim_loop(handler))
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+        logger.info(
+            "Task worker %s started (concurrency %s, lease %ss)",
+            self.owner, self.concurrency, task_leases.lease_seconds
+        )
+    
+    async def _claim_loop(self, handler: Callable[[LeasedTask], Awaitable[None]]):
+        while not self._closing:
+            self._wake.clear()
+            free = self.concurrency - len(self._running) - self._reserved
+            claimed: List[LeasedTask] = []
+            try:
+                # 没有空闲执行槽时也查询一次：更新排队数，回收执行次数已达上限的任务
+                claimed, available = await task_leases.claim(self.owner, free)
+                self._backlog = available - len(claimed)
+                TASKS_QUEUED.set(self._backlog)
+            except Exception as e:
+                logger.error("Failed to claim tasks: %s", e, exc_info=True)
+            for job in claimed:
+                self._running[job.task_id] = asyncio.create_task(self._run(job, handler))
+            if claimed and len(claimed) == free:
+                continue  # 可能还有待执行的任务
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def _run(self, job: LeasedTask, handler: Callable[[LeasedTask], Awaitable[None]]):
+        TASKS_RUNNING.inc()
+        wait_time = max(0.0, (datetime.utcnow() - job.created_at).total_seconds())
+        if job.attempts == 1:
+            TASK_QUEUE_WAIT.observe(wait_time)
+        logger.info("Worker picked task %s (attempt %s, waited %.3fs)", job.task_id, job.attempts, wait_time)
+        try:
+            await handler(job)
+        except asyncio.CancelledError:
+            logger.warning("Task %s interrupted in this worker", job.task_id)
+        except Exception as e:
+            logger.error("Worker failed on task %s: %s", job.task_id, e, exc_info=True)
+        finally:
+            self._running.pop(job.task_id, None)
+            TASKS_RUNNING.dec()
+            self.notify()
+    
+    async def _heartbeat_loop(self):
+        """续约执行中的任务，租约已被接管的任务停止执行"""
+        while True:
+            await asyncio.sleep(task_leases.lease_seconds / 3)
+            task_ids = list(self._running)
+            if not task_ids:
+                continue
+            try:
+                held = await task_leases.renew(self.owner, task_ids)
+            except Exception as e:
+                logger.error("Failed to renew task leases: %s", e, exc_info=True)
+                continue
+            for task_id in task_ids:
+                running = self._running.get(task_id)
+                if task_id not in held and running is not None:
+                    logger.warning("Lease on task %s was lost, stopping it", task_id)
+                    running.cancel()
+    
+    async def stop(self, timeout: float):
+        """
+        停止领取新任务，等待执行中的任务完成后关闭
+        
+        Args:
+            timeout: 等待的最长时间（秒），超时的任务被取消并放回，由其他进程重新执行
+        """
+        if self._claimer is None:
+            return
+        
+        self._closing = True
+        self._claimer.cancel()
+        await asyncio.gather(self._claimer, return_exceptions=True)
+        self._claimer = None
+        
+        running = list(self._running.values())
+        if running:
+            logger.info("Waiting for %s running tasks...", len(running))
+            # 等待期间继续续约
+            _, pending = await asyncio.wait(running, timeout=timeout)
+            if pending:
+                logger.warning("%s tasks still running after %ss, handing them back", len(pending), timeout)
+                task_ids = list(self._running)
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                try:
+                    await task_leases.release(self.owner, task_ids)
+                except Exception as e:
+                    logger.error("Failed to release task leases: %s", e, exc_info=True)
+        
+        self._heartbeat.cancel()
+        await asyncio.gather(self._heartbeat, return_exceptions=True)
+        self._heartbeat = None
+
+
 class TaskService:
     """任务服务（处理长任务）"""
     
     @staticmethod
     async def create_task(
-        db: AsyncSession,
         user_id: int,
         conversation_id: int,
-        user_message: str
-    ) -> str:
+        user_message: str,
+        idempotency_key: Optional[str] = None
+    ) -> Tuple[str, bool]:
         """
         创建任务并立即返回task_id
         
+        重复提交不会创建新任务：
+        - 提供idempotency_key时，同一用户同一个键总是返回同一个任务（跨进程、重启后仍有效），
+          键对应的内容不同时抛出IdempotencyKeyConflictError
+        - 否则 TASK_DEDUP_WINDOW 秒内同一对话的相同内容复用未失败的任务（进程内）
+        
         Args:
-            db: 数据库会话
             user_id: 用户ID
             conversation_id: 对话ID
             user_message: 用户消息
+            idempotency_key: 客户端提供的幂等键（可选）
         
         Returns:
-            task_id: 任务ID
+            (task_id, 是否复用了已有任务)
         """
+        fingerprint = request_hash(conversation_id, user_message)
+        
+        async def create() -> Tuple[str, bool]:
+            return await TaskService._create_task(user_id, conversation_id, user_message, fingerprint, idempotency_key)
+        
+        if idempotency_key:
+            task_id, reused = await task_single_flight.run(
+                ("idempotency", user_id, idempotency_key),
+                ttl=settings.TASK_IDEMPOTENCY_TTL,
+                fingerprint=fingerprint,
+                create=create,
+                reusable=lambda _: True,  # 幂等重放：无论任务状态都返回同一个任务
+                on_mismatch=lambda: IdempotencyKeyConflictError("Idempotency key was used with a different request")
+            )
+        elif settings.TASK_DEDUP_WINDOW > 0:
+            task_id, reused = await task_single_flight.run(
+                ("content", user_id, fingerprint),
+                ttl=settings.TASK_DEDUP_WINDOW,
+                fingerprint=fingerprint,
+                create=create,
+                reusable=TaskService._is_reusable
+            )
+        else:
+            task_id, reused = await create()
+        
+        if reused:
+            logger.info("Duplicate message for conversation %s attached to task %s", conversation_id, task_id)
+        return task_id, reused
+    
+    @staticmethod
+    def _is_reusable(task_id: str) -> bool:
+        """重复提交可以复用的任务：仍在内存中且尚未结束（已完成的任务不复用，再次发送即新的提问）"""
+        state = task_store.get(task_id)
+        return state is not None and state.status in ("pending", "processing")
+    
+    @staticmethod
+    async def _find_idempotent_task(user_id: int, idempotency_key: str) -> Optional[Task]:
+        from app.core.database import AsyncSessionLocal
+        
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Task).where(Task.user_id == user_id, Task.idempotency_key == idempotency_key)
+            )
+            return result.scalar_one_or_none()
+    
+    @staticmethod
+    def _replay(task: Task, fingerprint: str) -> Tuple[str, bool]:
+        if task.request_hash != fingerprint:
+            raise IdempotencyKeyConflictError("Idempotency key was used with a different request")
+        return task.task_id, True
+    
+    @staticmethod
+    async def _create_task(
+        user_id: int,
+        conversation_id: int,
+        user_message: str,
+        fingerprint: str,
+        idempotency_key: Optional[str]
+    ) -> Tuple[str, bool]:
+        """写入任务记录并加入队列（幂等键已存在时返回已有任务）"""
+        if idempotency_key:
+            existing = await TaskService._find_idempotent_task(user_id, idempotency_key)
+            if existing is not None:
+                return TaskService._replay(existing, fingerprint)
+        
+        # 队列已满时直接拒绝，避免创建无法执行的任务记录（插入时会在同一事务中再检查一次）
+        await TaskService._check_capacity(user_id)
+        
         # 生成唯一任务ID
         task_id = str(uuid.uuid4())
         
-        # 创建任务记录
+        # 创建任务记录（与其他并发写入合并提交），任何进程的worker都可以领取执行；
+        # 本进程有空闲执行槽时直接以本进程的租约写入并开始执行，不再经过一次领取
+        owner = task_worker.reserve()
+        lease = task_leases.leased_values(owner, datetime.utcnow()) if owner else {"status": "pending"}
         task = Task(
             user_id=user_id,
             task_id=task_id,
-            status="pending",
-            result=None
+            result=None,
+            idempotency_key=idempotency_key,
+            request_hash=fingerprint,
+            conversation_id=conversation_id,
+            user_message=user_message,
+            **lease
         )
         
-        db.add(task)
-        await db.commit()
-        await db.refresh(task)
+        async def insert_within_capacity(db: AsyncSession):
+            # 统计和插入在同一事务中，同一批次里先插入的任务已flush，并发创建不会超过上限；
+            # 超过上限时返回错误而不是抛出，避免整批回滚
+            error = await TaskService._capacity_error(db, user_id)
+            if error is not None:
+                return error
+            return await write_batcher.insert(db, task)
         
-        logger.info(f"Task created: {task_id} for user {user_id}")
+        try:
+            result = await write_batcher.execute(insert_within_capacity)
+            if isinstance(result, TaskQueueFullError):
+                raise result
+        except IntegrityError:
+            if owner:
+                await task_worker.adopt(None)
+            # 其他进程同时用同一个幂等键创建了任务
+            existing = await TaskService._find_idempotent_task(user_id, idempotency_key) if idempotency_key else None
+            if existing is None:
+                raise
+            return TaskService._replay(existing, fingerprint)
+        except BaseException:
+            if owner:
+                await task_worker.adopt(None)
+            raise
+        task_store.track(TaskState.from_task(task))
+        if owner:
+            await task_worker.adopt(task_leases.leased_task(task))
+        else:
+            task_worker.notify()
         
-        # 后台异步执行任务
-        asyncio.create_task(
-            TaskService._execute_task(db, task_id, conversation_id, user_message)
-        )
+        logger.info("Task created: %s for user %s", task_id, user_id)
+        return task_id, False
+    
+    @staticmethod
+    async def _check_capacity(user_id: int):
+        """排队任务数（所有进程合计）或该用户未结束的任务数达到上限时抛出TaskQueueFullError"""
+        from app.core.database import AsyncSessionLocal
         
-        return task_id
+        async with AsyncSessionLocal() as db:
+            error = await TaskService._capacity_error(db, user_id)
+        if error is not None:
+            raise error
     
     @staticmethod
-    async def _execute_task(
-        db: AsyncSession,
-        task_id: str,
+    async def _capacity_error(db: AsyncSession, user_id: int) -> Optional[TaskQueueFullError]:
+        """在给定会话中统计未结束的任务，达到上限时返回对应的TaskQueueFullError"""
+        total, for_user = await task_leases.count_unfinished(db, user_id)
+        if total >= settings.TASK_QUEUE_MAX_SIZE:
+            return TaskQueueFullError(f"Task queue is full ({settings.TASK_QUEUE_MAX_SIZE} jobs)")
+        if for_user >= settings.TASK_QUEUE_MAX_PER_USER:
+            return TaskQueueFullError(
+                f"Too many unfinished tasks for user {user_id} ({settings.TASK_QUEUE_MAX_PER_USER} jobs)",
+                per_user=True
+            )
+        return None
+    
+    @staticmethod
+    async def start(concurrency: Optional[int] = None):
+        """
+        启动写入合并和任务worker（在应用启动时调用）
+        
+        Args:
+            concurrency: 并发执行的任务数，默认为 TASK_WORKERS
+        """
+        await write_batcher.start()
+        if concurrency is not None:
+            task_worker.concurrency = concurrency
+        await task_worker.start(TaskService._execute_task)
+    
+    @staticmethod
+    async def shutdown():
+        """等待执行中的任务（在应用关闭时调用），超时的任务放回由其他进程执行，最后提交待写入的数据"""
+        await task_worker.stop(settings.TASK_QUEUE_DRAIN_TIMEOUT)
+        await write_batcher.stop()
+    
+    @staticmethod
+    async def _execute_task(job: LeasedTask):
+        """
+        执行领取到的任务（worker回调）
+        
+        数据库操作拆成几个短事务（读取上下文 / 保存用户消息 / 保存AI响应），
+        调用Ollama期间不持有数据库连接；消息和任务状态在同一事务中写入（以持有租约为条件），
+        并与其他任务的写入合并提交。重新执行时不重复保存之前已保存的用户消息。
+        
+        Args:
+            job: 领取到的任务
+        """
+        task_id = job.task_id
+        owner = task_worker.owner
+        started_at = time.monotonic()
+        task_store.track(TaskState(
+            id=job.id,
+            task_id=task_id,
+            user_id=job.user_id,
+            status="processing",
+            created_at=job.created_at,
+            updated_at=job.updated_at
+        ))
+        TaskService._update_state(task_id, status="processing")
+        try:
+            logger.info("Task %s started processing", task_id)
+            
+            conversation_history = await TaskService._build_context(job.conversation_id, job.user_message)
+            if job.user_message_id is None:
+                user_msg = await task_leases.save_message(
+                    owner, task_id,
+                    lambda: Message(conversation_id=job.conversation_id, role="user", content=job.user_message),
+                    lambda message: {"user_message_id": message.id}
+                )
+                context_cache.append(job.conversation_id, user_msg.id, "user", job.user_message)
+            elif conversation_history[-1:] == [{"role": "user", "content": job.user_message}]:
+                # 之前的执行已保存用户消息，历史中已包含
+                conversation_history = conversation_history[:-1]
+            
+            # 调用AI服务
+            ai_response = await ai_service.generate_response(
+                messages=[{"role": "user", "content": job.user_message}],
+                conversation_history=conversation_history if conversation_history else None
+            )
+            
+            # 保存AI响应并完成任务
+            assistant_msg = await task_leases.save_message(
+                owner, task_id,
+                lambda: Message(conversation_id=job.conversation_id, role="assistant", content=ai_response),
+                lambda message: {"status": "completed", "result": TaskService._task_result(message.id, ai_response)},
+                finish=True
+            )
+            context_cache.append(job.conversation_id, assistant_msg.id, "assistant", ai_response)
+            TaskService._update_state(
+                task_id,
+                status="completed",
+                result=TaskService._task_result(assistant_msg.id, ai_response)
+            )
+            
+            TASK_EXECUTION_DURATION.labels("completed").observe(time.monotonic() - started_at)
+            logger.info("Task %s completed successfully", task_id)
+        
+        except LeaseLostError:
+            # 任务已由其他worker接管，结果以对方为准
+            logger.warning("Task %s was taken over by another worker, discarding this result", task_id)
+        
+        except Exception as e:
+            TASK_EXECUTION_DURATION.labels("failed").observe(time.monotonic() - started_at)
+            logger.error("Task %s failed: %s", task_id, e, exc_info=True)
+            
+            # 更新任务状态为failed
+            try:
+                await task_leases.finish(owner, task_id, status="failed", error_message=str(e))
+            except LeaseLostError:
+                logger.warning("Task %s was taken over by another worker", task_id)
+                return
+            TaskService._update_state(task_id, status="failed", error_message=str(e))
+    
+    @staticmethod
+    def _task_result(message_id: int, content: str) -> str:
+        """任务结果（JSON字符串）"""
+        return json.dumps({"message_id": message_id, "content": content})
+    
+    @staticmethod
+    async def _build_context(conversation_id: int, user_message: str) -> List[Dict[str, str]]:
+        """在token预算内构建历史上下文"""
+        from app.core.database import AsyncSessionLocal
+        
+        async with AsyncSessionLocal() as db:
+            conversation = await db.get(Conversation, conversation_id)
+            if not conversation:
+                raise Exception(f"Conversation {conversation_id} not found")
+            return await context_builder.build(db, conversation, user_message)
+    
+    @staticmethod
+    async def _prepare_turn(
         conversation_id: int,
         user_message: str
-    ):
+    ) -> Tuple[List[Dict[str, str]], int]:
         """
-        后台执行任务（异步）
+        构建历史上下文并保存用户消息
+        
+        Returns:
+            (历史上下文, 用户消息ID)
+        """
+        conversation_history = await TaskService._build_context(conversation_id, user_message)
+        
+        user_msg = await write_batcher.add(Message(
+            conversation_id=conversation_id,
+            role="user",
+            content=user_message
+        ))
+        context_cache.append(conversation_id, user_msg.id, "user", user_message)
+        return conversation_history, user_msg.id
+    
+    @staticmethod
+    async def _save_reply(conversation_id: int, content: str) -> int:
+        """保存AI响应，返回消息ID"""
+        assistant_msg = await write_batcher.add(Message(
+            conversation_id=conversation_id,
+            role="assistant",
+            content=content
+        ))
+        context_cache.append(conversation_id, assistant_msg.id, "assistant", content)
+        return assistant_msg.id
+    
+    @staticmethod
+    async def check_stream_capacity(user_id: int):
+        """流式响应开始前检查排队数和空闲执行槽，不足时抛出TaskQueueFullError"""
+        await TaskService._check_capacity(user_id)
+        if not task_worker.has_free_slot():
+            raise TaskQueueFullError("No free execution slot for streaming")
+    
+    @staticmethod
+    async def stream_message(
+        conversation_id: int,
+        user_message: str
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式处理消息（不创建任务，直接逐token返回）
+        
+        生成期间占用一个执行槽（与任务共用并发上限）。用户消息在开始生成前保存；
+        AI响应在流结束后保存，出错或客户端中途断开时保存已生成的部分
         
         Args:
-            db: 数据库会话（注意：这个会话会在函数开始时关闭，需要创建新会话）
-            task_id: 任务ID
             conversation_id: 对话ID
             user_message: 用户消息
+        
+        Yields:
+            事件字典：{"event": "token", "data": {...}} / "done" / "error"
         """
-        # 创建新的数据库会话（因为原会话可能已关闭）
-        from app.core.database import AsyncSessionLocal
+        if not task_worker.acquire_slot():
+            yield {"event": "error", "data": {"detail": "Server is busy, please try again later"}}
+            return
         
-        async with AsyncSessionLocal() as new_db:
+        chunks: List[str] = []
+        completed = False
+        error: Optional[Exception] = None
+        saving: Optional[asyncio.Future] = None
+        try:
+            # 构建历史上下文并保存用户消息
+            conversation_history, user_msg_id = await TaskService._prepare_turn(conversation_id, user_message)
+            
+            yield {"event": "start", "data": {"user_message_id": user_msg_id}}
+            
             try:
-                # 更新任务状态为processing
-                result = await new_db.execute(select(Task).where(Task.task_id == task_id))
-                task = result.scalar_one_or_none()
-                
-                if not task:
-                    logger.error(f"Task not found: {task_id}")
-                    return
-                
-                task.status = "processing"
-                await new_db.commit()
-                
-                logger.info(f"Task {task_id} started processing")
-                
-                # 获取对话历史
-                conversation_result = await new_db.execute(
-                    select(Conversation).where(Conversation.id == conversation_id)
-                )
-                conversation = conversation_result.scalar_one_or_none()
-                
-                if not conversation:
-                    raise Exception(f"Conversation {conversation_id} not found")
-                
-                # 获取历史消息
-                messages_result = await new_db.execute(
-                    select(Message)
-                    .where(Message.conversation_id == conversation_id)
-                    .order_by(Message.created_at)
-                )
-                history_messages = messages_result.scalars().all()
-                
-                # 构建历史对话格式
-                conversation_history = []
-                for msg in history_messages:
-                    conversation_history.append({
-                        "role": msg.role,
-                        "content": msg.content
-                    })
-                
-                # 保存用户消息
-                user_msg = Message(
-                    conversation_id=conversation_id,
-                    role="user",
-                    content=user_message
-                )
-                new_db.add(user_msg)
-                await new_db.commit()
-                
-                # 调用AI服务
-                ai_response = await ai_service.generate_response(
+                async for chunk in ai_service.stream_response(
                     messages=[{"role": "user", "content": user_message}],
                     conversation_history=conversation_history if conversation_history else None
-                )
-                
-                # 保存AI响应
-                assistant_msg = Message(
-                    conversation_id=conversation_id,
-                    role="assistant",
-                    content=ai_response
-                )
-                new_db.add(assistant_msg)
-                
-                # 更新任务状态为completed
-                task.status = "completed"
-                task.result = json.dumps({
-                    "message_id": assistant_msg.id,
-                    "content": ai_response
-                })
-                await new_db.commit()
-                
-                logger.info(f"Task {task_id} completed successfully")
-            
+                ):
+                    chunks.append(chunk)
+                    yield {"event": "token", "data": {"content": chunk}}
+                completed = True
             except Exception as e:
-                logger.error(f"Task {task_id} failed: {e}", exc_info=True)
-                
-                # 更新任务状态为failed
-                try:
-                    result = await new_db.execute(select(Task).where(Task.task_id == task_id))
-                    task = result.scalar_one_or_none()
-                    if task:
-                        task.status = "failed"
-                        task.error_message = str(e)
-                        await new_db.commit()
-                except Exception as commit_error:
-                    logger.error(f"Failed to update task status: {commit_error}", exc_info=True)
+                logger.error("Streaming reply for conversation %s failed: %s", conversation_id, e, exc_info=True)
+                error = e
+            finally:
+                if chunks or completed:
+                    # 在独立的任务中保存，请求被取消（客户端断开）时也会完成
+                    saving = asyncio.ensure_future(TaskService._save_reply(conversation_id, "".join(chunks)))
+                    if not completed:
+                        logger.info("Saving partial streaming reply for conversation %s", conversation_id)
+        finally:
+            task_worker.release_slot()
+        
+        ai_response = "".join(chunks)
+        assistant_msg_id = await asyncio.shield(saving) if saving is not None else None
+        if error is not None:
+            yield {"event": "error", "data": {"detail": str(error), "message_id": assistant_msg_id}}
+            return
+        
+        logger.info("Streaming reply saved: message %s in conversation %s", assistant_msg_id, conversation_id)
+        
+        yield {
+            "event": "done",
+            "data": {"message_id": assistant_msg_id, "content": ai_response}
+        }
     
     @staticmethod
     async def get_task_status(
         db: AsyncSession,
         task_id: str,
         user_id: int
-    ) -> Optional[Task]:
+    ) -> Optional[Union[TaskState, Task]]:
         """
         获取任务状态
         
@@ -181,17 +638,87 @@ class TaskService:
             user_id: 用户ID（用于验证权限）
         
         Returns:
-            Task对象或None
+            TaskState（内存中的任务）、Task对象或None
         """
+        # 已结束或正在本进程执行的任务读取内存状态，其余（排队中、由其他进程执行、
+        # 重启后）查询数据库并同步到内存
+        state = task_store.get(task_id, user_id)
+        if state is not None and (state.status in TERMINAL_STATUSES or task_worker.is_running(task_id)):
+            return state
+        
         result = await db.execute(
             select(Task).where(
                 Task.task_id == task_id,
                 Task.user_id == user_id
             )
         )
-        return result.scalar_one_or_none()
+        task = result.scalar_one_or_none()
+        if task is not None and state is not None:
+            task_store.refresh(task)
+        return task
+    
+    @staticmethod
+    async def wait_for_task(
+        db: AsyncSession,
+        task_id: str,
+        user_id: int,
+        timeout: float
+    ) -> Optional[Any]:
+        """
+        等待任务进入终止状态（长轮询）
+        
+        优先通过进程内事件立即返回；任务可能在其他worker进程执行，
+        因此每隔 TASK_WAIT_RECHECK_INTERVAL 秒重新查询一次数据库
+        
+        Args:
+            db: 数据库会话
+            task_id: 任务ID
+            user_id: 用户ID（用于验证权限）
+            timeout: 最长等待时间（秒）
+        
+        Returns:
+            任务状态（TaskState、Task对象或字典）；任务不存在时返回None
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        
+        # 先订阅再查询，避免错过两者之间发生的状态变化
+        with task_events.subscribe(task_id) as events:
+            task = await TaskService.get_task_status(db, task_id, user_id)
+            # 结束事务归还连接，等待期间不占用连接池
+            await db.commit()
+            while task is not None and task.status not in TERMINAL_STATUSES:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(
+                        events.get(),
+                        timeout=min(remaining, settings.TASK_WAIT_RECHECK_INTERVAL)
+                    )
+                    if event["status"] in TERMINAL_STATUSES:
+                        return event
+                except asyncio.TimeoutError:
+                    # 兜底：重新查询数据库
+                    db.expire_all()
+                    task = await TaskService.get_task_status(db, task_id, user_id)
+                    await db.commit()
+        
+        return task
+    
+    @staticmethod
+    def _update_state(task_id: str, **fields: Any):
+        """更新内存中的任务状态（数据库已通过租约写入）并发布状态变化"""
+        state = task_store.update(task_id, **fields)
+        if state is not None:
+            task_events.publish(task_id, state.to_dict())
 
 
 # 创建全局实例
+task_worker = TaskWorker(
+    concurrency=settings.TASK_WORKERS,
+    poll_interval=settings.TASK_POLL_INTERVAL
+)
+task_single_flight = SingleFlight(max_entries=settings.TASK_DEDUP_MAX_ENTRIES)
 task_service = TaskService()
 
@@ -0,0 +1,135 @@
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.models.task import Task
+from app.services.task_events import TERMINAL_STATUSES
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TaskState:
+    """内存中的任务状态（字段与TaskResponse一致，另含user_id）"""
+    id: int
+    task_id: str
+    user_id: int
+    status: str
+    result: Optional[str] = None
+    error_message: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    updated_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: Optional[float] = None  # 进入终止状态的时间（time.monotonic）
+    
+    @classmethod
+    def from_task(cls, task: Task) -> "TaskState":
+        return cls(
+            id=task.id,
+            task_id=task.task_id,
+            user_id=task.user_id,
+            status=task.status,
+            result=task.result,
+            error_message=task.error_message,
+            created_at=task.created_at,
+            updated_at=task.updated_at,
+        )
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为TaskResponse格式的字典（可直接JSON序列化）"""
+        return {
+            "id": self.id,
+            "task_id": self.task_id,
+            "status": self.status,
+            "result": self.result,
+            "error_message": self.error_message,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+        }
+
+
+class TaskStateStore:
+    """
+    内存任务状态表
+    
+    记录本进程创建或执行的任务状态，执行期间的查询和长轮询直接读内存。状态变化由
+    执行任务的进程通过租约写入数据库（见 task_lease.py），这里只更新内存；内存中没有的
+    任务（重启后、由其他进程执行的任务）由调用方回退到数据库查询，并用 refresh 同步。
+    """
+    
+    def __init__(self, max_entries: int, finished_ttl: float):
+        self.max_entries = max_entries
+        self.finished_ttl = finished_ttl
+        self._states: "OrderedDict[str, TaskState]" = OrderedDict()
+    
+    def track(self, state: TaskState) -> TaskState:
+        """登记任务（已存在时替换）"""
+        self._states[state.task_id] = state
+        self._states.move_to_end(state.task_id)
+        self._evict()
+        return state
+    
+    def get(self, task_id: str, user_id: Optional[int] = None) -> Optional[TaskState]:
+        """查询内存中的任务状态（指定user_id时校验归属）"""
+        state = self._states.get(task_id)
+        if state is None:
+            return None
+        if state.finished_at is not None and time.monotonic() - state.finished_at > self.finished_ttl:
+            del self._states[task_id]
+            return None
+        if user_id is not None and state.user_id != user_id:
+            return None
+        return state
+    
+    def update(self, task_id: str, **fields: Any) -> Optional[TaskState]:
+        """
+        更新内存中的任务状态
+        
+        Args:
+            task_id: 任务ID
+            **fields: 要更新的字段（status/result/error_message/updated_at）
+        
+        Returns:
+            更新后的状态；任务不在内存中时返回None
+        """
+        state = self._states.get(task_id)
+        if state is None:
+            return None
+        fields.setdefault("updated_at", datetime.utcnow())
+        for name, value in fields.items():
+            setattr(state, name, value)
+        if state.status in TERMINAL_STATUSES and state.finished_at is None:
+            state.finished_at = time.monotonic()
+        return state
+    
+    def refresh(self, task: Task) -> Optional[TaskState]:
+        """用数据库中的任务记录更新内存状态（任务由其他进程执行时）"""
+        return self.update(
+            task.task_id,
+            status=task.status,
+            result=task.result,
+            error_message=task.error_message,
+            updated_at=task.updated_at
+        )
+    
+    def _evict(self):
+        """淘汰过期的已结束任务；超出容量时从最早的任务开始淘汰（数据库仍可查询）"""
+        now = time.monotonic()
+        expired = [
+            task_id for task_id, state in self._states.items()
+            if state.finished_at is not None and now - state.finished_at > self.finished_ttl
+        ]
+        for task_id in expired:
+            del self._states[task_id]
+        while len(self._states) > self.max_entries:
+            self._states.popitem(last=False)
+
+
+# 创建全局实例
+task_store = TaskStateStore(
+    max_entries=settings.TASK_STORE_MAX_ENTRIES,
+    finished_ttl=settings.TASK_STORE_FINISHED_TTL
+)
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, List, Optional, TypeVar
+
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+WriteOperation = Callable[[AsyncSession], Awaitable[Any]]
+
+
+@dataclass
+class _PendingWrite:
+    operation: WriteOperation
+    future: asyncio.Future
+
+
+class WriteBatcher:
+    """
+    写入合并器（group commit）
+    
+    并发任务提交的写操作先进入队列，后台协程在 max_delay 秒内或攒够 max_batch 个操作后
+    在同一个事务中依次执行并提交一次。SQLite的写入吞吐受提交（fsync）次数限制，而不是行数。
+    
+    持久化语义：execute/add 在所在批次提交后才返回，返回即已落库，与直接提交相同；
+    代价是每次写入最多增加 max_delay 的延迟。批次中任一操作失败时整批回滚，
+    再把各操作逐个单独执行，失败只影响出错的操作。关闭时会执行完队列中剩余的操作；
+    未启动或已关闭时直接在独立事务中执行。
+    """
+    
+    def __init__(self, max_batch: int, max_delay: float):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._closing = False
+        self.commits = 0
+        self.operations = 0
+    
+    async def execute(self, operation: Callable[[AsyncSession], Awaitable[T]]) -> T:
+        """
+        执行写操作，提交后返回其结果
+        
+        Args:
+            operation: 接收数据库会话的协程函数（不要在其中提交；可能因批次失败被重新执行）
+        """
+        if self._runner is None or self._closing:
+            return (await self._commit([operation]))[0]
+        
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(_PendingWrite(operation, future))
+        return await future
+    
+    async def add(self, instance: T) -> T:
+        """插入ORM对象，提交后返回（主键和默认值已填充）"""
+        return await self.execute(lambda db: WriteBatcher.insert(db, instance))
+    
+    @staticmethod
+    async def insert(db: AsyncSession, instance: T) -> T:
+        """在写操作中插入ORM对象并flush（可以在传给execute的操作中与其他语句组合使用）"""
+        # 所在批次回滚后重新执行时，恢复为未持久化状态并清除上次flush分配的自增主键
+        make_transient(instance)
+        mapper = inspect(instance).mapper
+        for column in mapper.primary_key:
+            if column.autoincrement in (True, "auto"):
+                setattr(instance, mapper.get_property_by_column(column).key, None)
+        db.add(instance)
+        await db.flush()
+        return instance
+    
+    async def _commit(self, operations: List[WriteOperation]) -> List[Any]:
+        """在一个事务中执行全部操作并提交"""
+        from app.core.database import AsyncSessionLocal
+        
+        async with AsyncSessionLocal() as db:
+            results = [await operation(db) for operation in operations]
+            await db.commit()
+        self.commits += 1
+        self.operations += len(operations)
+        return results
+    
+    async def _process(self, batch: List[_PendingWrite]):
+        """执行一个批次，失败时逐个重试"""
+        batch = [item for item in batch if not item.future.done()]  # 跳过调用方已取消的操作
+        if not batch:
+            return
+        
+        try:
+            results = await self._commit([item.operation for item in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+                return
+            logger.warning("Write batch of %s failed (%s), retrying operations one by one", len(batch), e)
+            for item in batch:
+                try:
+                    result = (await self._commit([item.operation]))[0]
+                except Exception as item_error:
+                    if not item.future.done():
+                        item.future.set_exception(item_error)
+                else:
+                    if not item.future.done():
+                        item.future.set_result(result)
+            return
+        
+        for item, result in zip(batch, results):
+            if not item.future.done():
+                item.future.set_result(result)
+    
+    async def _run(self):
+        """后台协程：收集一批操作后提交（收到None表示关闭）"""
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            first = await self._queue.get()
+            if first is None:
+                break
+            
+            batch = [first]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    if self._queue.empty():
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        item = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                    else:
+                        item = self._queue.get_nowait()
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            
+            await self._process(batch)
+    
+    async def start(self):
+        """启动后台提交协程"""
+        if self._runner is not None:
+            return
+        self._closing = False
+        self._queue = asyncio.Queue()
+        self._runner = asyncio.create_task(self._run())
+        logger.info("Write batcher started (max batch %s, max delay %.1fms)", self.max_batch, self.max_delay * 1000)
+    
+    async def stop(self):
+        """执行完队列中剩余的操作后停止"""
+        if self._runner is None:
+            return
+        self._closing = True
+        self._queue.put_nowait(None)
+        await asyncio.gather(self._runner, return_exceptions=True)
+        self._runner = None
+        if self.commits:
+            logger.info(
+                "Write batcher stopped: %s writes in %s commits (%.1f per commit)",
+                self.operations, self.commits, self.operations / self.commits
+            )
+
+
+# 创建全局实例
+write_batcher = WriteBatcher(
+    max_batch=settings.DB_WRITE_BATCH_MAX_SIZE,
+    max_delay=settings.DB_WRITE_BATCH_MAX_DELAY
+)
@@ -0,0 +1,66 @@
+"""
+独立的任务worker进程
+
+从tasks表领取任务并执行，与API进程使用相同的数据库和配置，可以在多台机器上运行多个。
+API进程设置 TASK_WORKERS=0 时只接收请求、不执行任务，生成能力由worker进程单独扩展。
+收到SIGTERM/SIGINT后停止领取，等待执行中的任务完成（最多 TASK_QUEUE_DRAIN_TIMEOUT 秒），
+未完成的任务放回由其他进程执行。
+
+用法（在backend目录下）：
+    python -m app.worker --concurrency 8
+"""
+import argparse
+import asyncio
+import logging
+import signal
+
+from app.core.config import settings
+from app.core.database import engine, init_db
+from app.core.logging_config import flush_logging, setup_logging
+from app.core.metrics import instrument_engine
+from app.services.ai_service import ai_service
+from app.services.context_builder import context_builder
+from app.services.task_service import task_service
+
+logger = logging.getLogger(__name__)
+
+
+async def run(concurrency: int):
+    await init_db()
+    await ai_service.startup()
+    await task_service.start(concurrency)
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    
+    logger.info("Shutting down...")
+    await task_service.shutdown()
+    await context_builder.shutdown(settings.CONTEXT_SUMMARY_SHUTDOWN_TIMEOUT)
+    await ai_service.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--concurrency", type=int, default=settings.TASK_WORKERS,
+        help="并发执行的任务数（默认为 TASK_WORKERS）"
+    )
+    args = parser.parse_args()
+    if args.concurrency <= 0:
+        parser.error("--concurrency must be positive (TASK_WORKERS is 0 in this environment)")
+    
+    setup_logging()
+    if settings.METRICS_ENABLED:
+        # 与API进程共用 PROMETHEUS_MULTIPROC_DIR 时，指标由API的 /metrics 一起汇总
+        instrument_engine(engine)
+    try:
+        asyncio.run(run(args.concurrency))
+    finally:
+        flush_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,422 @@
+"""
+聊天链路端到端负载测试
+
+每个虚拟用户依次执行 注册 -> 登录 -> 创建对话，然后按场景循环：
+    chat    发送消息（202） -> 长轮询任务直到完成
+    stream  流式发送消息（SSE），记录首个token时间（仅 --base-url）和整轮时间
+    read    先完成一轮chat，然后循环获取对话详情和对话列表
+
+Ollama由 benchmarks.fake_ollama 模拟（单独进程，延迟和错误率可配置）。
+默认在当前进程中通过ASGI调用应用（临时SQLite数据库）；指定 --base-url 时对已启动的服务
+（例如gunicorn，其 OLLAMA_API_URL 指向 python -m benchmarks.fake_ollama）施压。
+
+输出每个步骤的 p50/p95/p99 延迟、请求数/秒，以及从 /metrics 统计的每个路由平均SQL条数和
+SQL总数（需要 METRICS_ENABLED）。结果保存到 benchmarks/results/<时间>-<commit>.json，
+可以用 --compare 与之前的结果对比。进程内运行时httpx的ASGITransport会缓冲整个响应，
+无法测量首个token时间。
+
+用法（在backend目录下）：
+    python -m benchmarks.bench_chat_load --users 20 --turns 5
+    python -m benchmarks.bench_chat_load --scenario stream --ollama-latency 0.5 --ollama-token-interval 0.02
+    python -m benchmarks.bench_chat_load --base-url http://127.0.0.1:8000 --scenario chat
+    python -m benchmarks.bench_chat_load --compare benchmarks/results/20261018-120000-1a2b3c4.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+from benchmarks import fake_ollama
+
+RESULTS_DIR = Path(__file__).parent / "results"
+POLL_WAIT_SECONDS = 20  # 长轮询等待时间（不超过 TASK_WAIT_MAX_SECONDS）
+
+
+class StepError(Exception):
+    """某个步骤失败，该虚拟用户停止"""
+    pass
+
+
+class Recorder:
+    """按步骤记录延迟（毫秒）和错误"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.last_errors: Dict[str, str] = {}
+        self.requests = 0
+        self.turns = 0
+
+    def record(self, step: str, started_at: float):
+        self.latencies[step].append((time.perf_counter() - started_at) * 1000)
+
+    def error(self, step: str, message: str):
+        """记录失败（如Ollama注入的错误），该用户继续下一轮"""
+        self.errors[step] += 1
+        self.last_errors[step] = message
+
+    def fail(self, step: str, message: str):
+        """记录失败并停止该用户（后续步骤依赖这一步的结果）"""
+        self.error(step, message)
+        raise StepError(f"{step}: {message}")
+
+    async def request(self, client: httpx.AsyncClient, step: str, method: str, url: str, **kwargs) -> httpx.Response:
+        started_at = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.fail(step, f"{type(e).__name__}: {e}")
+        self.requests += 1
+        if response.status_code >= 400:
+            self.fail(step, f"HTTP {response.status_code}: {response.text[:200]}")
+        self.record(step, started_at)
+        return response
+
+
+async def _sign_up(client: httpx.AsyncClient, recorder: Recorder, name: str) -> Tuple[Dict[str, str], int]:
+    """注册、登录并创建对话，返回认证头和对话ID"""
+    password = "benchmark-password"
+    await recorder.request(client, "register", "POST", "/api/auth/register", json={
+        "username": name, "email": f"{name}@example.com", "password": password
+    })
+    response = await recorder.request(client, "login", "POST", "/api/auth/login", data={
+        "username": name, "password": password
+    })
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = await recorder.request(client, "create_conversation", "POST", "/api/conversations", json={
+        "title": "benchmark"
+    }, headers=headers)
+    return headers, response.json()["id"]
+
+
+async def _chat_turn(client: httpx.AsyncClient, recorder: Recorder, headers: Dict[str, str], conversation_id: int, content: str):
+    started_at = time.perf_counter()
+    response = await recorder.request(
+        client, "send_message", "POST", f"/api/conversations/{conversation_id}/messages",
+        json={"role": "user", "content": content}, headers=headers
+    )
+    task_id = response.json()["task_id"]
+    while True:
+        response = await recorder.request(
+            client, "poll_task", "GET", f"/api/tasks/{task_id}",
+            params={"wait": POLL_WAIT_SECONDS}, headers=headers
+        )
+        task = response.json()
+        if task["status"] == "completed":
+            break
+        if task["status"] == "failed":
+            recorder.error("chat_turn", f"task failed: {task.get('error_message')}")
+            return
+    recorder.record("chat_turn", started_at)
+    recorder.turns += 1
+
+
+async def chat_user(client: httpx.AsyncClient, recorder: Recorder, name: str, turns: int):
+    headers, conversation_id = await _sign_up(client, recorder, name)
+    for turn in range(turns):
+        await _chat_turn(client, recorder, headers, conversation_id, f"{name} turn {turn}: how are you?")
+
+
+async def stream_user(client: httpx.AsyncClient, recorder: Recorder, name: str, turns: int):
+    headers, conversation_id = await _sign_up(client, recorder, name)
+    for turn in range(turns):
+        started_at = time.perf_counter()
+        event = None
+        first_token = False
+        try:
+            async with client.stream(
+                "POST", f"/api/conversations/{conversation_id}/messages/stream",
+                json={"role": "user", "content": f"{name} turn {turn}: tell me more"}, headers=headers
+            ) as response:
+                recorder.requests += 1
+                if response.status_code >= 400:
+                    recorder.fail("stream_turn", f"HTTP {response.status_code}")
+                async for line in response.aiter_lines():
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                        if event == "token" and not first_token:
+                            first_token = True
+                            recorder.record("stream_first_token", started_at)
+        except httpx.HTTPError as e:
+            recorder.fail("stream_turn", f"{type(e).__name__}: {e}")
+        if event != "done":
+            recorder.error("stream_turn", f"stream ended with {event!r}")
+            continue
+        recorder.record("stream_turn", started_at)
+        recorder.turns += 1
+
+
+async def read_user(client: httpx.AsyncClient, recorder: Recorder, name: str, turns: int):
+    headers, conversation_id = await _sign_up(client, recorder, name)
+    await _chat_turn(client, recorder, headers, conversation_id, f"{name}: seed message")
+    for _ in range(turns):
+        await recorder.request(client, "get_conversation", "GET", f"/api/conversations/{conversation_id}", headers=headers)
+        await recorder.request(client, "list_conversations", "GET", "/api/conversations", headers=headers)
+        recorder.turns += 1
+
+
+SCENARIOS: Dict[str, Callable[[httpx.AsyncClient, Recorder, str, int], Awaitable[None]]] = {
+    "chat": chat_user,
+    "stream": stream_user,
+    "read": read_user,
+}
+
+
+async def scrape_db_stats(client: httpx.AsyncClient) -> Optional[Dict[str, Any]]:
+    """从 /metrics 读取每个路由的SQL条数累计值和SQL总数（未启用指标时返回None）"""
+    try:
+        response = await client.get("/metrics")
+    except httpx.HTTPError:
+        return None
+    if response.status_code != 200:
+        return None
+    per_route: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0.0])  # route -> [SQL条数, 请求数]
+    total = 0.0
+    for family in text_string_to_metric_families(response.text):
+        for sample in family.samples:
+            if sample.name == "http_request_db_queries_sum":
+                per_route[sample.labels["route"]][0] += sample.value
+            elif sample.name == "http_request_db_queries_count":
+                per_route[sample.labels["route"]][1] += sample.value
+            elif sample.name == "db_query_duration_seconds_count":
+                total += sample.value
+    return {"routes": dict(per_route), "total": total}
+
+
+def _db_delta(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if before is None or after is None:
+        return None
+    per_request = {}
+    for route, (queries, requests) in after["routes"].items():
+        old_queries, old_requests = before["routes"].get(route, (0.0, 0.0))
+        if requests > old_requests and route != "/metrics":
+            per_request[route] = round((queries - old_queries) / (requests - old_requests), 2)
+    return {"queries_per_request": per_request, "total_queries": int(after["total"] - before["total"])}
+
+
+def _summarize(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    if len(values) >= 2:
+        quantiles = statistics.quantiles(values, n=100, method="inclusive")
+        p50, p95, p99 = quantiles[49], quantiles[94], quantiles[98]
+    else:
+        p50 = p95 = p99 = values[0]
+    return {
+        "count": len(values),
+        "mean_ms": round(statistics.fmean(values), 2),
+        "p50_ms": round(p50, 2),
+        "p95_ms": round(p95, 2),
+        "p99_ms": round(p99, 2),
+        "max_ms": round(values[-1], 2),
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, name: str, users: int, turns: int, run_id: str) -> Dict[str, Any]:
+    recorder = Recorder()
+    before = await scrape_db_stats(client)
+    started_at = time.perf_counter()
+    outcomes = await asyncio.gather(
+        *(SCENARIOS[name](client, recorder, f"bench_{run_id}_{name}_{index}", turns) for index in range(users)),
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - started_at
+    after = await scrape_db_stats(client)
+
+    unexpected = [outcome for outcome in outcomes if isinstance(outcome, Exception) and not isinstance(outcome, StepError)]
+    if unexpected:
+        raise unexpected[0]
+
+    db = _db_delta(before, after)
+    return {
+        "users": users,
+        "turns_per_user": turns,
+        "elapsed_s": round(elapsed, 3),
+        "requests": recorder.requests,
+        "requests_per_s": round(recorder.requests / elapsed, 2),
+        "turns": recorder.turns,
+        "turns_per_s": round(recorder.turns / elapsed, 2),
+        "failed_users": sum(isinstance(outcome, StepError) for outcome in outcomes),
+        "errors": dict(recorder.errors),
+        "last_errors": recorder.last_errors,
+        "steps": {step: _summarize(values) for step, values in recorder.latencies.items()},
+        "db": db,
+        "db_queries_per_turn": round(db["total_queries"] / recorder.turns, 2) if db and recorder.turns else None,
+    }
+
+
+def print_report(results: Dict[str, Any]):
+    for name, scenario in results["scenarios"].items():
+        print(
+            f"\n[{name}] {scenario['users']} users x {scenario['turns_per_user']} turns in {scenario['elapsed_s']:.2f}s: "
+            f"{scenario['requests_per_s']:.1f} req/s, {scenario['turns_per_s']:.1f} turns/s, "
+            f"failed users {scenario['failed_users']}"
+        )
+        print(f"  {'step':<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>8}")
+        for step, stats in scenario["steps"].items():
+            print(
+                f"  {step:<22}{stats['count']:>7}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+                f"{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}{scenario['errors'].get(step, 0):>8}"
+            )
+        for step, message in scenario["last_errors"].items():
+            print(f"  last error in {step}: {message}")
+        if scenario["db"]:
+            print(f"  SQL statements: {scenario['db']['total_queries']} total, {scenario['db_queries_per_turn']} per turn")
+            for route, queries in sorted(scenario["db"]["queries_per_request"].items()):
+                print(f"    {queries:>6.1f} per request  {route}")
+
+
+def print_comparison(previous: Dict[str, Any], current: Dict[str, Any]):
+    """与之前保存的结果对比（延迟和吞吐的变化百分比）"""
+    def change(old: float, new: float) -> str:
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"\nCompared with {previous['meta']['commit']} ({previous['meta']['timestamp']}):")
+    for name, scenario in current["scenarios"].items():
+        old = previous["scenarios"].get(name)
+        if old is None:
+            continue
+        print(
+            f"[{name}] req/s {old['requests_per_s']:.1f} -> {scenario['requests_per_s']:.1f} "
+            f"({change(old['requests_per_s'], scenario['requests_per_s'])})"
+        )
+        for step, stats in scenario["steps"].items():
+            old_stats = old["steps"].get(step)
+            if old_stats is None:
+                continue
+            print(
+                f"  {step:<22} p50 {old_stats['p50_ms']:.1f} -> {stats['p50_ms']:.1f} ({change(old_stats['p50_ms'], stats['p50_ms'])})"
+                f"  p95 {old_stats['p95_ms']:.1f} -> {stats['p95_ms']:.1f} ({change(old_stats['p95_ms'], stats['p95_ms'])})"
+            )
+
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(
+            ["git", *args], cwd=Path(__file__).parent, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_ollama(args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    """在子进程中启动模拟Ollama（不与被测应用争用事件循环），返回进程和地址"""
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_ollama", "--port", str(port)] + fake_ollama.options_to_argv(args, "ollama-"),
+        cwd=Path(__file__).parent.parent,
+        stdout=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{url}/api/tags", timeout=1)
+            return process, url
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Fake Ollama server did not start")
+
+
+async def run(args: argparse.Namespace, scenarios: List[str], ollama_url: Optional[str]) -> Dict[str, Any]:
+    run_id = uuid.uuid4().hex[:8]
+    timeout = httpx.Timeout(120.0)
+    limits = httpx.Limits(max_connections=args.users * 2)
+    results: Dict[str, Any] = {"scenarios": {}}
+
+    if args.base_url:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout, limits=limits) as client:
+            for name in scenarios:
+                results["scenarios"][name] = await run_scenario(client, name, args.users, args.turns, run_id)
+        return results
+
+    # 在导入应用之前指定临时数据库、模拟Ollama地址和日志
+    tmp = tempfile.mkdtemp(prefix="bench_chat_load_")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite+aiosqlite:///{Path(tmp) / 'bench.db'}",
+        "OLLAMA_API_URL": ollama_url,
+        "LOG_LEVEL": "CRITICAL",  # 注入的错误由报告统计，不输出应用日志
+        "LOG_FILE": str(Path(tmp) / "logs" / "app.log"),
+        "METRICS_ENABLED": "true",
+        "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+    })
+    from app.main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout, limits=limits) as client:
+            for name in scenarios:
+                results["scenarios"][name] = await run_scenario(client, name, args.users, args.turns, run_id)
+                results["scenarios"][name]["steps"].pop("stream_first_token", None)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=["all", *SCENARIOS], default="all", help="运行的场景")
+    parser.add_argument("--users", type=int, default=20, help="并发虚拟用户数")
+    parser.add_argument("--turns", type=int, default=5, help="每个用户的轮数")
+    parser.add_argument("--base-url", help="被测服务地址（默认在当前进程中通过ASGI调用应用）")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="进程内运行时的bcrypt cost（注册/登录耗时主要由它决定）")
+    parser.add_argument("--label", default="", help="保存结果时附带的说明")
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR, help="结果保存目录")
+    parser.add_argument("--no-save", action="store_true", help="不保存结果")
+    parser.add_argument("--compare", type=Path, help="与之前保存的结果文件对比")
+    fake_ollama.add_arguments(parser, prefix="ollama-")
+    args = parser.parse_args()
+
+    scenarios = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    process, ollama_url = (None, None) if args.base_url else start_fake_ollama(args)
+    try:
+        results = asyncio.run(run(args, scenarios, ollama_url))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    commit = _git("rev-parse", "--short", "HEAD") or "unknown"
+    results["meta"] = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "label": args.label,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "target": args.base_url or "in-process",
+        "options": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+    }
+    print_report(results)
+
+    if args.compare:
+        print_comparison(json.loads(args.compare.read_text(encoding="utf-8")), results)
+
+    if not args.no_save:
+        args.output.mkdir(parents=True, exist_ok=True)
+        path = args.output / f"{datetime.now():%Y%m%d-%H%M%S}-{commit}.json"
+        path.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nResults saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
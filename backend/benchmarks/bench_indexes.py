@@ -0,0 +1,160 @@
+"""
+热点查询索引基准测试
+
+在临时SQLite数据库中生成指定数量的消息，分别在没有/有复合索引时测量热点查询耗时
+
+用法（在backend目录下）：
+    python -m benchmarks.bench_indexes --messages 10000 --messages 1000000
+"""
+import argparse
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.dialects import sqlite
+
+from app.core.database import Base
+from app.models import User, Conversation, Message, Task
+
+# 每个对话的平均消息数、每个用户的平均对话数
+MESSAGES_PER_CONVERSATION = 100
+CONVERSATIONS_PER_USER = 10
+
+COMPOSITE_INDEXES = [
+    "ix_messages_conversation_id_created_at",
+    "ix_conversations_user_id_created_at",
+]
+
+
+def _compile(stmt) -> str:
+    return str(stmt.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def build_database(path: Path, message_count: int):
+    """创建表结构并批量写入测试数据"""
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    conversation_count = max(1, message_count // MESSAGES_PER_CONVERSATION)
+    user_count = max(1, conversation_count // CONVERSATIONS_PER_USER)
+    start = datetime(2024, 1, 1)
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.executemany(
+        "INSERT INTO users (id, username, email, hashed_password, created_at) VALUES (?, ?, ?, ?, ?)",
+        ((i, f"user{i}", f"user{i}@example.com", "x", start) for i in range(1, user_count + 1)),
+    )
+    conn.executemany(
+        "INSERT INTO conversations (id, user_id, title, created_at) VALUES (?, ?, ?, ?)",
+        (
+            (i, random.randint(1, user_count), f"conversation {i}", start + timedelta(seconds=i))
+            for i in range(1, conversation_count + 1)
+        ),
+    )
+    # 消息随机分布在各对话中，模拟多个对话交替写入
+    conn.executemany(
+        "INSERT INTO messages (id, conversation_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+        (
+            (
+                i,
+                random.randint(1, conversation_count),
+                "user" if i % 2 else "assistant",
+                "lorem ipsum " * 20,
+                start + timedelta(seconds=i),
+            )
+            for i in range(1, message_count + 1)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO tasks (id, user_id, task_id, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+        (
+            (i, random.randint(1, user_count), str(uuid.uuid4()), "completed", start, start)
+            for i in range(1, message_count // 2 + 1)
+        ),
+    )
+    conn.commit()
+    return conn, user_count, conversation_count
+
+
+def hot_queries(conn: sqlite3.Connection, user_count: int, conversation_count: int):
+    """应用中每个请求都会执行的查询"""
+    task_id, task_user_id = conn.execute(
+        "SELECT task_id, user_id FROM tasks ORDER BY random() LIMIT 1"
+    ).fetchone()
+    return {
+        "messages of conversation": _compile(
+            select(Message)
+            .where(Message.conversation_id == random.randint(1, conversation_count))
+            .order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(50)
+        ),
+        "conversations of user": _compile(
+            select(Conversation)
+            .where(Conversation.user_id == random.randint(1, user_count))
+            .order_by(Conversation.created_at.desc(), Conversation.id.desc())
+            .limit(50)
+        ),
+        "task by id and user": _compile(
+            select(Task).where(Task.task_id == task_id, Task.user_id == task_user_id)
+        ),
+    }
+
+
+def measure(conn: sqlite3.Connection, sql: str, repeat: int) -> float:
+    """返回查询耗时中位数（毫秒）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql).fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def run(message_count: int, repeat: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        print(f"\n== {message_count} messages ==")
+        conn, user_count, conversation_count = build_database(path, message_count)
+        queries = hot_queries(conn, user_count, conversation_count)
+
+        for name in COMPOSITE_INDEXES:
+            conn.execute(f"DROP INDEX {name}")
+        conn.execute("ANALYZE")
+        before = {name: measure(conn, sql, repeat) for name, sql in queries.items()}
+
+        # 重新创建索引（与迁移 0002 一致）
+        for table in (Message.__table__, Conversation.__table__):
+            for index in table.indexes:
+                if index.name in COMPOSITE_INDEXES:
+                    index.create(create_engine(f"sqlite:///{path}"))
+        conn.execute("ANALYZE")
+        after = {name: measure(conn, sql, repeat) for name, sql in queries.items()}
+        conn.close()
+
+        print(f"{'query':<28}{'before (ms)':>14}{'after (ms)':>14}")
+        for name in queries:
+            print(f"{name:<28}{before[name]:>14.3f}{after[name]:>14.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, action="append", help="消息行数（可多次指定）")
+    parser.add_argument("--repeat", type=int, default=50, help="每个查询的执行次数")
+    args = parser.parse_args()
+
+    random.seed(0)
+    for message_count in args.messages or [10_000]:
+        run(message_count, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
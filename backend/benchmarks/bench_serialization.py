@@ -0,0 +1,155 @@
+"""
+大对话响应序列化基准测试
+
+在临时SQLite数据库中生成一个包含大量消息的对话，比较获取对话详情的几种实现：
+    orm + response_model   查询ORM对象 -> 构建字典 -> Pydantic校验 -> 序列化（改造前）
+    columns + orjson       按列查询Row -> 字典 -> orjson直接序列化（当前实现）
+    endpoint               通过ASGI完整调用 GET /api/conversations/{id}（当前实现，含认证和路由开销）
+
+用法（在backend目录下）：
+    python -m benchmarks.bench_serialization --messages 5000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# 在导入应用之前指定临时数据库
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{Path(_tmp.name) / 'bench.db'}"
+
+from pydantic import TypeAdapter
+from sqlalchemy import insert, select
+
+from app.api.conversations import MESSAGE_COLUMNS
+from app.core.database import AsyncSessionLocal, engine, init_db
+from app.core.responses import ORJSONResponse
+from app.core.security import create_access_token
+from app.models import User, Conversation, Message
+from app.schemas.conversation import ConversationResponse
+
+CONTENT = "Serialization benchmark 序列化基准测试内容 " * 8
+
+
+async def seed(message_count: int) -> int:
+    """写入一个用户、一个对话和指定数量的消息，返回对话ID"""
+    await init_db()
+    start = datetime(2024, 1, 1)
+    async with AsyncSessionLocal() as db:
+        user = User(username="bench", email="bench@example.com", hashed_password="x")
+        db.add(user)
+        await db.flush()
+        conversation = Conversation(user_id=user.id, title="bench")
+        db.add(conversation)
+        await db.flush()
+        await db.execute(insert(Message), [
+            {
+                "conversation_id": conversation.id,
+                "role": "user" if i % 2 else "assistant",
+                "content": CONTENT,
+                "created_at": start + timedelta(seconds=i),
+            }
+            for i in range(message_count)
+        ])
+        await db.commit()
+        return conversation.id
+
+
+async def orm_response_model(conversation_id: int) -> bytes:
+    """改造前：ORM对象 + 字典 + response_model校验和序列化"""
+    async with AsyncSessionLocal() as db:
+        conversation = await db.get(Conversation, conversation_id)
+        result = await db.execute(
+            select(Message).where(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at, Message.id)
+        )
+        messages = result.scalars().all()
+        response = ConversationResponse(
+            id=conversation.id,
+            user_id=conversation.user_id,
+            title=conversation.title,
+            created_at=conversation.created_at,
+            messages=[{"id": m.id, "conversation_id": m.conversation_id, "role": m.role, "content": m.content, "created_at": m.created_at} for m in messages],
+        )
+        # FastAPI按response_model再次校验后序列化
+        adapter = TypeAdapter(ConversationResponse)
+        return adapter.dump_json(adapter.validate_python(response))
+
+
+async def columns_orjson(conversation_id: int) -> bytes:
+    """当前实现：按列查询 + orjson"""
+    async with AsyncSessionLocal() as db:
+        conversation = await db.get(Conversation, conversation_id)
+        result = await db.execute(
+            select(*MESSAGE_COLUMNS).where(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at, Message.id)
+        )
+        return ORJSONResponse({
+            "title": conversation.title,
+            "id": conversation.id,
+            "user_id": conversation.user_id,
+            "created_at": conversation.created_at,
+            "messages": [row._asdict() for row in result.all()],
+            "next_cursor": None,
+        }).body
+
+
+async def measure(func, repeat: int) -> tuple:
+    """返回 (耗时中位数毫秒, 响应字节数)"""
+    timings = []
+    body = b""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = await func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), len(body)
+
+
+async def run(message_count: int, repeat: int):
+    import httpx
+    from app.main import app
+
+    conversation_id = await seed(message_count)
+    token = create_access_token({"sub": "1"})
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def endpoint() -> bytes:
+            response = await client.get(
+                f"/api/conversations/{conversation_id}",
+                headers={"Authorization": f"Bearer {token}"}
+            )
+            response.raise_for_status()
+            return response.content
+
+        results = {
+            "orm + response_model": await measure(lambda: orm_response_model(conversation_id), repeat),
+            "columns + orjson": await measure(lambda: columns_orjson(conversation_id), repeat),
+            "endpoint": await measure(endpoint, repeat),
+        }
+    await engine.dispose()
+
+    print(f"\n== {message_count} messages ==")
+    print(f"{'implementation':<24}{'median (ms)':>14}{'bytes':>12}")
+    for name, (median, size) in results.items():
+        print(f"{name:<24}{median:>14.2f}{size:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000, help="对话中的消息数")
+    parser.add_argument("--repeat", type=int, default=20, help="每种实现的执行次数")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args.messages, args.repeat))
+    finally:
+        _tmp.cleanup()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+模拟Ollama的HTTP服务（用于基准测试，不需要真实模型）
+
+实现 /api/chat（流式NDJSON和非流式）和 /api/tags。回复内容为 "echo(消息数): 最后一条消息"，
+补足到 --tokens 个词。
+
+    --latency / --jitter   首个token前的等待时间（秒），在 latency±jitter 内均匀随机
+    --token-interval       流式响应每个token之间的间隔（秒）；非流式响应一次性等待全部token的时间
+    --error-rate           按概率返回 --error-status（默认500），用于测试失败处理和后端剔除
+    --stream-error-rate    流式响应输出一半后按概率返回 {"error": ...}
+
+用法（在backend目录下）：
+    python -m benchmarks.fake_ollama --port 11999 --latency 0.2 --jitter 0.1 --tokens 50
+"""
+import argparse
+import asyncio
+import json
+import random
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+
+class FakeOllama:
+    """可配置延迟和错误的Ollama模拟服务"""
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        tokens: int = 20,
+        token_interval: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        stream_error_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens = tokens
+        self.token_interval = token_interval
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stream_error_rate = stream_error_rate
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    def _reply_tokens(self, messages: List[Dict[str, Any]]) -> List[str]:
+        words = f"echo({len(messages)}): {messages[-1]['content'] if messages else ''}".split()
+        while len(words) < self.tokens:
+            words.append(f"token{len(words)}")
+        return [word + " " for word in words[:max(self.tokens, 1)]]
+
+    def _first_token_delay(self) -> float:
+        return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        await asyncio.sleep(self._first_token_delay())
+
+        if self._random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"error": "injected failure"}, status=self.error_status)
+
+        tokens = self._reply_tokens(body.get("messages", []))
+        model = body.get("model", "fake")
+        if not body.get("stream", True):
+            await asyncio.sleep(self.token_interval * len(tokens))
+            return web.json_response({
+                "model": model,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "done": True,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+        await response.prepare(request)
+        fail_at = len(tokens) // 2 if self._random.random() < self.stream_error_rate else -1
+        for index, token in enumerate(tokens):
+            if index == fail_at:
+                self.errors += 1
+                await response.write((json.dumps({"error": "injected stream failure"}) + "\n").encode())
+                await response.write_eof()
+                return response
+            if index and self.token_interval:
+                await asyncio.sleep(self.token_interval)
+            chunk = {"model": model, "message": {"role": "assistant", "content": token}, "done": False}
+            await response.write((json.dumps(chunk) + "\n").encode())
+        done = {"model": model, "message": {"role": "assistant", "content": ""}, "done": True}
+        await response.write((json.dumps(done) + "\n").encode())
+        await response.write_eof()
+        return response
+
+    async def tags(self, request: web.Request) -> web.Response:
+        return web.json_response({"models": [{"name": "fake"}]})
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/api/chat", self.chat)
+        app.router.add_get("/api/tags", self.tags)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """在当前事件循环中启动，返回服务地址（port为0时自动选择端口）"""
+        # 停止时不等待进行中的慢速响应
+        self._runner = web.AppRunner(self.create_app(), shutdown_timeout=0.1)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        bound_port = self._runner.addresses[0][1]
+        return f"http://{host}:{bound_port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def add_arguments(parser: argparse.ArgumentParser, prefix: str = ""):
+    """添加模拟服务的命令行参数（prefix用于在其他基准测试中区分参数）"""
+    parser.add_argument(f"--{prefix}latency", type=float, default=0.05, help="首个token前的等待时间（秒）")
+    parser.add_argument(f"--{prefix}jitter", type=float, default=0.0, help="等待时间的随机波动范围（秒）")
+    parser.add_argument(f"--{prefix}tokens", type=int, default=20, help="回复的token数")
+    parser.add_argument(f"--{prefix}token-interval", type=float, default=0.0, help="流式响应token之间的间隔（秒）")
+    parser.add_argument(f"--{prefix}error-rate", type=float, default=0.0, help="返回错误状态码的概率")
+    parser.add_argument(f"--{prefix}error-status", type=int, default=500, help="注入错误时的HTTP状态码")
+    parser.add_argument(f"--{prefix}stream-error-rate", type=float, default=0.0, help="流式响应中途出错的概率")
+    parser.add_argument(f"--{prefix}seed", type=int, default=None, help="随机种子")
+
+
+def options_to_argv(args: argparse.Namespace, prefix: str = "") -> List[str]:
+    """把 add_arguments 添加的参数转换回命令行（用于在子进程中启动模拟服务）"""
+    argv = []
+    for name in ("latency", "jitter", "tokens", "token_interval", "error_rate", "error_status", "stream_error_rate", "seed"):
+        value = getattr(args, prefix.replace("-", "_") + name)
+        if value is not None:
+            argv += [f"--{name.replace('_', '-')}", str(value)]
+    return argv
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11999)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fake = FakeOllama(
+        latency=args.latency,
+        jitter=args.jitter,
+        tokens=args.tokens,
+        token_interval=args.token_interval,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        stream_error_rate=args.stream_error_rate,
+        seed=args.seed
+    )
+    web.run_app(fake.create_app(), host=args.host, port=args.port, print=lambda message: print(message, flush=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,18 @@
 # gunicorn_conf.py
+import glob
 import multiprocessing
+import os
+import subprocess
+import sys
+import time
 
 # 1. 监听地址与端口
 bind = "127.0.0.1:8000"
 
 # 2. 工作进程数
 # 公式：CPU核心数 * 2 + 1 (这是业界通用平衡点)
-workers = multiprocessing.cpu_count() * 2 + 1
+# 可通过环境变量 WEB_CONCURRENCY 覆盖（SQLite同一时刻只允许一个写入者，进程过多只会增加锁等待）
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
 
 # 3. 指定工作模式：必须使用 uvicorn 提供的 worker 类
 worker_class = "uvicorn.workers.UvicornWorker"
@@ -15,6 +21,51 @@ worker_class = "uvicorn.workers.UvicornWorker"
 timeout = 120
 
 # 5. 日志配置
+# 应用日志（logs/app.log、logs/error.log）由master启动的日志写入进程统一写入和轮转，
+# worker通过 LOG_SOCKET 发送给它；gunicorn自身的错误日志使用单独的文件
 accesslog = "logs/access.log"
-errorlog = "logs/error.log"
-loglevel = "info"
\ No newline at end of file
+errorlog = "logs/gunicorn.error.log"
+loglevel = "info"
+log_socket = os.environ.setdefault("LOG_SOCKET", os.path.abspath("logs/app-log.sock"))
+
+# 6. 监控指标：每个worker把指标写入同一目录，/metrics 汇总所有worker
+# （必须在worker导入应用之前设置，可通过环境变量指定其他目录）
+prometheus_multiproc_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.abspath("logs/prometheus_multiproc")
+)
+
+
+_log_server = None
+
+
+def on_starting(server):
+    """启动日志写入进程，清空上次运行留下的指标文件"""
+    global _log_server
+    _log_server = subprocess.Popen([
+        sys.executable, "-c",
+        "import sys; from app.core.logging_config import run_log_server; run_log_server(sys.argv[1])",
+        log_socket,
+    ], stdin=subprocess.PIPE)  # master和worker都退出、管道关闭后日志写入进程才退出
+    deadline = time.monotonic() + 5
+    while not os.path.exists(log_socket) and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    os.makedirs(prometheus_multiproc_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(prometheus_multiproc_dir, "*.db")):
+        os.remove(path)
+
+
+def on_exit(server):
+    """所有worker退出后关闭管道，等待日志写入进程写完已收到的日志"""
+    if _log_server is not None:
+        _log_server.stdin.close()
+        try:
+            _log_server.wait(timeout=10)
+        except (subprocess.TimeoutExpired, ChildProcessError):
+            pass
+
+
+def child_exit(server, worker):
+    """worker退出后不再计入它的实时计数（进行中的请求/任务数）"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
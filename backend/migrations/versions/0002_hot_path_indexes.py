@@ -0,0 +1,37 @@
+"""composite indexes for hot query paths
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 对话内消息按时间读取/分页
+    op.create_index(
+        "ix_messages_conversation_id_created_at",
+        "messages",
+        ["conversation_id", "created_at", "id"],
+        if_not_exists=True,
+    )
+    # 用户对话列表按时间倒序
+    op.create_index(
+        "ix_conversations_user_id_created_at",
+        "conversations",
+        ["user_id", "created_at", "id"],
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_conversations_user_id_created_at", table_name="conversations")
+    op.drop_index("ix_messages_conversation_id_created_at", table_name="messages")
@@ -0,0 +1,32 @@
+"""idempotency key and request hash on tasks
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("tasks") as batch_op:
+        batch_op.add_column(sa.Column("idempotency_key", sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column("request_hash", sa.String(length=64), nullable=True))
+        batch_op.create_index(
+            "ix_tasks_user_id_idempotency_key", ["user_id", "idempotency_key"], unique=True
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("tasks") as batch_op:
+        batch_op.drop_index("ix_tasks_user_id_idempotency_key")
+        batch_op.drop_column("request_hash")
+        batch_op.drop_column("idempotency_key")
@@ -0,0 +1,44 @@
+"""task payload and lease columns for database-backed task execution
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("tasks") as batch_op:
+        batch_op.add_column(sa.Column("conversation_id", sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column("user_message", sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column("user_message_id", sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column("lease_owner", sa.String(length=128), nullable=True))
+        batch_op.add_column(sa.Column("lease_expires_at", sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"))
+        batch_op.create_index("ix_tasks_status_id", ["status", "id"])
+
+    # 之前的任务输入只保存在创建它的进程内存中，未完成的任务已无法执行
+    op.execute(
+        "UPDATE tasks SET status = 'failed', error_message = 'Task was interrupted by a server restart' "
+        "WHERE status IN ('pending', 'processing')"
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("tasks") as batch_op:
+        batch_op.drop_index("ix_tasks_status_id")
+        batch_op.drop_column("attempts")
+        batch_op.drop_column("lease_expires_at")
+        batch_op.drop_column("lease_owner")
+        batch_op.drop_column("user_message_id")
+        batch_op.drop_column("user_message")
+        batch_op.drop_column("conversation_id")
@@ -0,0 +1,102 @@
+"""owner column in the SQLite message search index
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 00:00:00
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+# SQLite：FTS5表增加不参与索引的user_id列（所属对话的用户），搜索时在FTS查询中直接按用户过滤，
+# 排序和分页只针对该用户的匹配；外部内容改为包含user_id的视图，触发器同样改为写入user_id。
+# 注意：与0005相同，以后对messages使用batch_alter_table会丢失这些触发器，需要在同一迁移中重新创建。
+# PostgreSQL的tsvector在messages表上，查询中已和用户条件一起使用索引，不需要改动
+SQLITE_UPGRADE = [
+    "DROP TRIGGER IF EXISTS messages_fts_update",
+    "DROP TRIGGER IF EXISTS messages_fts_delete",
+    "DROP TRIGGER IF EXISTS messages_fts_insert",
+    "DROP TABLE IF EXISTS messages_fts",
+    """
+    CREATE VIEW IF NOT EXISTS messages_search AS
+        SELECT messages.id AS id, messages.content AS content, conversations.user_id AS user_id
+        FROM messages JOIN conversations ON conversations.id = messages.conversation_id
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content, user_id UNINDEXED, content='messages_search', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content, user_id)
+        VALUES (new.id, new.content, (SELECT user_id FROM conversations WHERE id = new.conversation_id));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, user_id)
+        VALUES ('delete', old.id, old.content, (SELECT user_id FROM conversations WHERE id = old.conversation_id));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content, user_id)
+        VALUES ('delete', old.id, old.content, (SELECT user_id FROM conversations WHERE id = old.conversation_id));
+        INSERT INTO messages_fts(rowid, content, user_id)
+        VALUES (new.id, new.content, (SELECT user_id FROM conversations WHERE id = new.conversation_id));
+    END
+    """,
+    # 为已有消息建立索引
+    "INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')",
+]
+
+# 恢复为0005的结构
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS messages_fts_update",
+    "DROP TRIGGER IF EXISTS messages_fts_delete",
+    "DROP TRIGGER IF EXISTS messages_fts_insert",
+    "DROP TABLE IF EXISTS messages_fts",
+    "DROP VIEW IF EXISTS messages_search",
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content, content='messages', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    "INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')",
+]
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "sqlite":
+        for statement in SQLITE_UPGRADE:
+            op.execute(statement)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "sqlite":
+        for statement in SQLITE_DOWNGRADE:
+            op.execute(statement)
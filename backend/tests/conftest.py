@@ -0,0 +1,90 @@
+"""
+测试配置
+
+在导入应用模块之前设置环境变量：使用临时SQLite数据库，Ollama指向 benchmarks.fake_ollama
+启动的模拟服务（fake_ollama fixture）。在backend目录下运行：python -m pytest
+"""
+import os
+import socket
+import tempfile
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+_tmp_dir = tempfile.mkdtemp(prefix="chat-tests-")
+FAKE_OLLAMA_PORT = _free_port()
+
+os.environ.update({
+    "DATABASE_URL": f"sqlite+aiosqlite:///{_tmp_dir}/test.db",
+    "OLLAMA_API_URL": f"http://127.0.0.1:{FAKE_OLLAMA_PORT}",
+    "OLLAMA_HEALTH_CHECK_INTERVAL": "0",
+    "LOG_LEVEL": "WARNING",
+    "LOG_FILE": f"{_tmp_dir}/app.log",
+    "METRICS_ENABLED": "false",
+    "BCRYPT_ROUNDS": "4",
+    "GENERATION_CACHE_ENABLED": "false",
+    "CONTEXT_SUMMARY_ENABLED": "false",
+    "TASK_WORKERS": "1",
+    "TASK_QUEUE_MAX_PER_USER": "2",
+    "TASK_POLL_INTERVAL": "0.05",
+    "TASK_LEASE_SECONDS": "30",
+    "TASK_MAX_ATTEMPTS": "3",
+})
+
+import pytest  # noqa: E402
+from sqlalchemy import delete  # noqa: E402
+
+from app.core.database import AsyncSessionLocal, engine, init_db  # noqa: E402
+from app.models.conversation import Conversation  # noqa: E402
+from app.models.message import Message  # noqa: E402
+from app.models.task import Task  # noqa: E402
+from app.models.user import User  # noqa: E402
+from benchmarks.fake_ollama import FakeOllama  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def database():
+    """执行迁移并清空数据；测试结束后关闭连接（每个测试使用新的事件循环）"""
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        for model in (Task, Message, Conversation, User):
+            await db.execute(delete(model))
+        await db.commit()
+    yield
+    await engine.dispose()
+
+
+@pytest.fixture
+async def conversation(database) -> Conversation:
+    """一个用户及其对话"""
+    async with AsyncSessionLocal() as db:
+        user = User(username="alice", email="alice@example.com", hashed_password="x")
+        db.add(user)
+        await db.flush()
+        conv = Conversation(user_id=user.id, title="test")
+        db.add(conv)
+        await db.commit()
+        await db.refresh(conv)
+        return conv
+
+
+@pytest.fixture
+async def fake_ollama():
+    """在 OLLAMA_API_URL 端口上启动模拟Ollama，并初始化AI服务的连接池"""
+    from app.services.ai_service import ai_service
+
+    fake = FakeOllama(latency=0.01, tokens=5)
+    await fake.start(port=FAKE_OLLAMA_PORT)
+    await ai_service.startup()
+    yield fake
+    await ai_service.shutdown()
+    await fake.stop()
@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core.database import AsyncSessionLocal
+from app.models.task import Task
+from app.services.single_flight import SingleFlight
+from app.services.task_service import IdempotencyKeyConflictError, task_service, task_single_flight
+
+pytestmark = pytest.mark.anyio
+
+
+class Conflict(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def clear_single_flight():
+    task_single_flight._entries.clear()
+    yield
+    task_single_flight._entries.clear()
+
+
+async def test_single_flight_concurrent_callers_share_one_result():
+    flight = SingleFlight(max_entries=10)
+    calls = 0
+
+    async def create():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return f"task-{calls}", False
+
+    results = await asyncio.gather(*(
+        flight.run("key", ttl=10, fingerprint="f", create=create, reusable=lambda _: True)
+        for _ in range(5)
+    ))
+
+    assert calls == 1
+    assert results[0] == ("task-1", False)
+    assert all(result == ("task-1", True) for result in results[1:])
+
+
+async def test_single_flight_rejects_different_fingerprint():
+    flight = SingleFlight(max_entries=10)
+
+    async def create():
+        return "task-1", False
+
+    await flight.run("key", ttl=10, fingerprint="a", create=create, reusable=lambda _: True)
+    with pytest.raises(Conflict):
+        await flight.run(
+            "key", ttl=10, fingerprint="b", create=create, reusable=lambda _: True, on_mismatch=Conflict
+        )
+
+
+async def test_single_flight_waiters_retry_after_failure():
+    flight = SingleFlight(max_entries=10)
+    attempts = []
+
+    async def create():
+        attempts.append(len(attempts))
+        await asyncio.sleep(0.01)
+        if len(attempts) == 1:
+            raise RuntimeError("first attempt failed")
+        return f"task-{len(attempts)}", False
+
+    results = await asyncio.gather(
+        flight.run("key", ttl=10, fingerprint="f", create=create, reusable=lambda _: True),
+        flight.run("key", ttl=10, fingerprint="f", create=create, reusable=lambda _: True),
+        return_exceptions=True
+    )
+
+    assert isinstance(results[0], RuntimeError)
+    assert results[1] == ("task-2", False)
+
+
+async def test_single_flight_skips_results_that_are_not_reusable():
+    flight = SingleFlight(max_entries=10)
+    created = []
+
+    async def create():
+        created.append(f"task-{len(created) + 1}")
+        return created[-1], False
+
+    await flight.run("key", ttl=10, fingerprint="f", create=create, reusable=lambda _: False)
+    result = await flight.run("key", ttl=10, fingerprint="f", create=create, reusable=lambda _: False)
+
+    assert result == ("task-2", False)
+
+
+async def count_tasks() -> int:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(func.count(Task.id)))).scalar_one()
+
+
+async def test_idempotency_key_returns_same_task(conversation):
+    create = lambda: task_service.create_task(conversation.user_id, conversation.id, "hi", idempotency_key="k1")
+
+    results = await asyncio.gather(create(), create(), create())
+
+    assert len({task_id for task_id, _ in results}) == 1
+    assert sorted(reused for _, reused in results) == [False, True, True]
+    assert await count_tasks() == 1
+
+
+async def test_idempotency_key_replayed_from_database(conversation):
+    task_id, _ = await task_service.create_task(conversation.user_id, conversation.id, "hi", idempotency_key="k1")
+    # 模拟另一个进程或重启后：进程内没有登记
+    task_single_flight._entries.clear()
+
+    assert await task_service.create_task(
+        conversation.user_id, conversation.id, "hi", idempotency_key="k1"
+    ) == (task_id, True)
+    assert await count_tasks() == 1
+
+
+async def test_idempotency_key_with_different_request_conflicts(conversation):
+    await task_service.create_task(conversation.user_id, conversation.id, "hi", idempotency_key="k1")
+
+    with pytest.raises(IdempotencyKeyConflictError):
+        await task_service.create_task(conversation.user_id, conversation.id, "other", idempotency_key="k1")
+    task_single_flight._entries.clear()
+    with pytest.raises(IdempotencyKeyConflictError):
+        await task_service.create_task(conversation.user_id, conversation.id, "other", idempotency_key="k1")
+    assert await count_tasks() == 1
+
+
+async def test_duplicate_content_without_key_is_deduplicated(conversation):
+    first = await task_service.create_task(conversation.user_id, conversation.id, "same")
+    second = await task_service.create_task(conversation.user_id, conversation.id, "same")
+
+    assert second == (first[0], True)
+    assert await count_tasks() == 1
@@ -0,0 +1,153 @@
+import asyncio
+import uuid
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core.database import AsyncSessionLocal
+from app.models.conversation import Conversation
+from app.models.message import Message
+from app.models.task import Task
+from app.models.user import User
+from app.services.task_lease import LeaseLostError, TaskLeases
+
+pytestmark = pytest.mark.anyio
+
+SHORT_LEASE = 0.05
+
+
+async def add_task(conversation, message: str = "hello") -> str:
+    task_id = str(uuid.uuid4())
+    async with AsyncSessionLocal() as db:
+        db.add(Task(
+            user_id=conversation.user_id,
+            task_id=task_id,
+            status="pending",
+            conversation_id=conversation.id,
+            user_message=message
+        ))
+        await db.commit()
+    return task_id
+
+
+async def get_task(task_id: str) -> Task:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(Task).where(Task.task_id == task_id))).scalar_one()
+
+
+async def count_messages() -> int:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(func.count(Message.id)))).scalar_one()
+
+
+def user_message(conversation):
+    return lambda: Message(conversation_id=conversation.id, role="user", content="hello")
+
+
+async def test_claim_marks_task_processing(conversation):
+    leases = TaskLeases(lease_seconds=30, max_attempts=3)
+    task_id = await add_task(conversation)
+
+    claimed, available = await leases.claim("worker-a", 5)
+
+    assert available == 1
+    assert [job.task_id for job in claimed] == [task_id]
+    assert claimed[0].attempts == 1
+    task = await get_task(task_id)
+    assert task.status == "processing"
+    assert task.lease_owner == "worker-a"
+    # 租约未过期时其他worker领取不到
+    assert await leases.claim("worker-b", 5) == ([], 0)
+
+
+async def test_expired_lease_is_taken_over_and_old_owner_is_fenced(conversation):
+    leases = TaskLeases(lease_seconds=SHORT_LEASE, max_attempts=3)
+    task_id = await add_task(conversation)
+    (first,), _ = await leases.claim("worker-a", 1)
+
+    await asyncio.sleep(SHORT_LEASE * 2)
+    (second,), _ = await leases.claim("worker-b", 1)
+
+    assert second.task_id == task_id
+    assert second.attempts == first.attempts + 1
+    with pytest.raises(LeaseLostError):
+        await leases.save_message(
+            "worker-a", task_id, user_message(conversation), lambda message: {"user_message_id": message.id}
+        )
+    with pytest.raises(LeaseLostError):
+        await leases.finish("worker-a", task_id, status="failed", error_message="late")
+    assert await leases.renew("worker-a", [task_id]) == set()
+    # 被拒绝的写入整体回滚，消息没有保存
+    assert await count_messages() == 0
+
+    message = await leases.save_message(
+        "worker-b", task_id, user_message(conversation),
+        lambda message: {"status": "completed", "result": "ok"},
+        finish=True
+    )
+    task = await get_task(task_id)
+    assert task.status == "completed"
+    assert task.lease_owner is None
+    assert await count_messages() == 1
+    assert message.id is not None
+
+
+async def test_task_fails_after_max_attempts(conversation):
+    leases = TaskLeases(lease_seconds=SHORT_LEASE, max_attempts=2)
+    task_id = await add_task(conversation)
+
+    for owner in ("worker-a", "worker-b"):
+        claimed, _ = await leases.claim(owner, 1)
+        assert [job.task_id for job in claimed] == [task_id]
+        await asyncio.sleep(SHORT_LEASE * 2)
+
+    assert await leases.claim("worker-c", 1) == ([], 0)
+    task = await get_task(task_id)
+    assert task.status == "failed"
+    assert task.attempts == 2
+    assert task.lease_owner is None
+    assert "2 attempts" in task.error_message
+
+
+async def test_release_returns_task_without_counting_attempt(conversation):
+    leases = TaskLeases(lease_seconds=30, max_attempts=3)
+    task_id = await add_task(conversation)
+    await leases.claim("worker-a", 1)
+
+    await leases.release("worker-a", [task_id])
+
+    task = await get_task(task_id)
+    assert (task.status, task.attempts, task.lease_owner) == ("pending", 0, None)
+    claimed, _ = await leases.claim("worker-b", 1)
+    assert claimed[0].attempts == 1
+
+
+async def test_claim_alternates_between_users(conversation):
+    leases = TaskLeases(lease_seconds=30, max_attempts=3)
+    async with AsyncSessionLocal() as db:
+        other_user = User(username="bob", email="bob@example.com", hashed_password="x")
+        db.add(other_user)
+        await db.flush()
+        other = Conversation(user_id=other_user.id, title="other")
+        db.add(other)
+        await db.commit()
+        await db.refresh(other)
+    first_user = [await add_task(conversation, f"a{i}") for i in range(3)]
+    second_user = await add_task(other, "b0")
+
+    claimed, available = await leases.claim("worker-a", 2)
+
+    assert available == 4
+    assert [job.task_id for job in claimed] == [first_user[0], second_user]
+
+
+async def test_count_unfinished_includes_processing_tasks_for_user(conversation):
+    leases = TaskLeases(lease_seconds=30, max_attempts=3)
+    await add_task(conversation)
+    await add_task(conversation)
+    await leases.claim("worker-a", 1)
+
+    async with AsyncSessionLocal() as db:
+        pending, for_user = await leases.count_unfinished(db, conversation.user_id)
+
+    assert (pending, for_user) == (1, 2)
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import time
+import uuid
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core.database import AsyncSessionLocal
+from app.models.message import Message
+from app.models.task import Task
+from app.services.task_service import TaskQueueFullError, task_service, task_single_flight, task_worker
+from app.services.write_batcher import write_batcher
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def worker(database, fake_ollama):
+    task_single_flight._entries.clear()
+    await task_service.start(concurrency=1)
+    yield task_worker
+    await task_worker.stop(timeout=0.1)
+    await write_batcher.stop()
+
+
+async def get_task(task_id: str) -> Task:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(Task).where(Task.task_id == task_id))).scalar_one()
+
+
+async def wait_for_status(task_id: str, *statuses: str, timeout: float = 5.0) -> Task:
+    deadline = time.monotonic() + timeout
+    while True:
+        task = await get_task(task_id)
+        if task.status in statuses:
+            return task
+        assert time.monotonic() < deadline, f"task {task_id} still {task.status}"
+        await asyncio.sleep(0.02)
+
+
+async def wait_until_running(task_id: str, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not task_worker.is_running(task_id):
+        assert time.monotonic() < deadline, f"task {task_id} was not picked up"
+        await asyncio.sleep(0.01)
+
+
+async def conversation_messages(conversation_id: int):
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Message.role, Message.content)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.id)
+        )
+        return [tuple(row) for row in result.all()]
+
+
+async def test_created_task_is_executed(worker, conversation):
+    task_id, _ = await task_service.create_task(conversation.user_id, conversation.id, "hello")
+
+    task = await wait_for_status(task_id, "completed", "failed")
+
+    assert task.status == "completed"
+    assert task.lease_owner is None
+    assert json.loads(task.result)["content"].startswith("echo(1): hello")
+    messages = await conversation_messages(conversation.id)
+    assert [role for role, _ in messages] == ["user", "assistant"]
+
+
+async def test_same_message_after_completion_creates_new_task(worker, conversation):
+    first, _ = await task_service.create_task(conversation.user_id, conversation.id, "again")
+    await wait_for_status(first, "completed", "failed")
+
+    second, reused = await task_service.create_task(conversation.user_id, conversation.id, "again")
+
+    assert (second != first, reused) == (True, False)
+    await wait_for_status(second, "completed", "failed")
+    messages = await conversation_messages(conversation.id)
+    assert [role for role, _ in messages] == ["user", "assistant", "user", "assistant"]
+
+
+async def test_task_from_another_process_is_claimed(worker, conversation):
+    task_id = str(uuid.uuid4())
+    async with AsyncSessionLocal() as db:
+        db.add(Task(
+            user_id=conversation.user_id,
+            task_id=task_id,
+            status="pending",
+            conversation_id=conversation.id,
+            user_message="queued elsewhere"
+        ))
+        await db.commit()
+
+    task = await wait_for_status(task_id, "completed", "failed")
+
+    assert task.status == "completed"
+    assert task.attempts == 1
+
+
+async def test_stop_releases_unfinished_tasks(worker, fake_ollama, conversation):
+    fake_ollama.latency = 10
+    task_id, _ = await task_service.create_task(conversation.user_id, conversation.id, "slow")
+    await wait_until_running(task_id)
+
+    await task_worker.stop(timeout=0.1)
+
+    task = await get_task(task_id)
+    assert (task.status, task.attempts, task.lease_owner) == ("pending", 0, None)
+    assert await conversation_messages(conversation.id) == [("user", "slow")]
+
+
+async def test_per_user_cap_counts_running_tasks(worker, fake_ollama, conversation):
+    fake_ollama.latency = 10
+    running, _ = await task_service.create_task(conversation.user_id, conversation.id, "first")
+    await wait_until_running(running)
+    await task_service.create_task(conversation.user_id, conversation.id, "second")
+
+    # TASK_QUEUE_MAX_PER_USER=2：执行中的任务也计入上限
+    with pytest.raises(TaskQueueFullError) as error:
+        await task_service.create_task(conversation.user_id, conversation.id, "third")
+    assert error.value.per_user
+
+
+async def test_per_user_cap_holds_for_concurrent_creates(worker, fake_ollama, conversation):
+    fake_ollama.latency = 10
+
+    results = await asyncio.gather(
+        *(task_service.create_task(conversation.user_id, conversation.id, f"message {i}") for i in range(6)),
+        return_exceptions=True
+    )
+
+    created = [result for result in results if not isinstance(result, BaseException)]
+    rejected = [result for result in results if isinstance(result, TaskQueueFullError)]
+    assert (len(created), len(rejected)) == (2, 4)
+    async with AsyncSessionLocal() as db:
+        count = (await db.execute(
+            select(func.count(Task.id)).where(Task.user_id == conversation.user_id)
+        )).scalar_one()
+    assert count == 2
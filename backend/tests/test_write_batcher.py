@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import AsyncSessionLocal
+from app.models.message import Message
+from app.services.write_batcher import WriteBatcher
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def batcher(database):
+    # 足够长的合并窗口，保证并发提交的写操作落在同一个批次
+    batcher = WriteBatcher(max_batch=10, max_delay=0.05)
+    await batcher.start()
+    yield batcher
+    await batcher.stop()
+
+
+async def message_contents():
+    async with AsyncSessionLocal() as db:
+        return sorted((await db.execute(select(Message.content))).scalars().all())
+
+
+def new_message(conversation, content: str) -> Message:
+    return Message(conversation_id=conversation.id, role="user", content=content)
+
+
+async def test_concurrent_writes_share_one_commit(batcher, conversation):
+    messages = await asyncio.gather(*(batcher.add(new_message(conversation, f"m{i}")) for i in range(5)))
+
+    assert batcher.commits == 1
+    assert all(message.id is not None for message in messages)
+    assert await message_contents() == [f"m{i}" for i in range(5)]
+
+
+async def test_failed_operation_rolls_back_batch_and_others_are_retried(batcher, conversation):
+    async def failing(db: AsyncSession):
+        db.add(new_message(conversation, "bad"))
+        await db.flush()
+        raise IntegrityError("INSERT", {}, Exception("constraint failed"))
+
+    results = await asyncio.gather(
+        batcher.add(new_message(conversation, "a")),
+        batcher.execute(failing),
+        batcher.add(new_message(conversation, "b")),
+        return_exceptions=True
+    )
+
+    assert isinstance(results[1], IntegrityError)
+    assert results[0].id is not None and results[2].id is not None
+    # 第一次整批执行已回滚，重试后每条消息只保存一次，失败操作的写入没有提交
+    assert await message_contents() == ["a", "b"]
+
+
+async def test_commit_failure_fails_every_caller(batcher, conversation, monkeypatch):
+    async def failing_commit(self):
+        raise OperationalError("COMMIT", {}, Exception("disk I/O error"))
+
+    monkeypatch.setattr(AsyncSession, "commit", failing_commit)
+
+    results = await asyncio.gather(
+        *(batcher.add(new_message(conversation, f"m{i}")) for i in range(3)),
+        return_exceptions=True
+    )
+
+    assert all(isinstance(result, OperationalError) for result in results)
+    monkeypatch.undo()
+    assert await message_contents() == []
+
+
+async def test_executes_directly_when_not_started(database, conversation):
+    batcher = WriteBatcher(max_batch=10, max_delay=0.05)
+
+    message = await batcher.add(new_message(conversation, "direct"))
+
+    assert message.id is not None
+    assert batcher.commits == 1
+    assert await message_contents() == ["direct"]
@@ -6,6 +6,9 @@ export interface Conversation {
   title: string
   created_at: string
   messages?: Message[]
+  next_cursor?: string | null
+  message_count?: number
+  last_message?: Omit<Message, 'conversation_id'> | null
 }
 
 export interface Message {
@@ -16,14 +19,20 @@ export interface Message {
   created_at: string
 }
 
+export interface PageParams {
+  limit?: number
+  before?: string
+  after?: string
+}
+
 export interface ConversationCreate {
   title: string
 }
 
 export const conversationsApi = {
-  // 获取所有对话
-  getConversations() {
-    return request.get<Conversation[]>('/conversations')
+  // 获取所有对话（summary=true 时只返回摘要，不包含完整消息）
+  getConversations(summary = true) {
+    return request.get<Conversation[]>('/conversations', { params: { summary } })
   },
 
   // 创建对话
@@ -31,9 +40,9 @@ export const conversationsApi = {
     return request.post<Conversation>('/conversations', data)
   },
 
-  // 获取单个对话
-  getConversation(id: number) {
-    return request.get<Conversation>(`/conversations/${id}`)
+  // 获取单个对话（传入limit时按游标分页，next_cursor用于加载更早的消息）
+  getConversation(id: number, params?: PageParams) {
+    return request.get<Conversation>(`/conversations/${id}`, { params })
   }
 }
 
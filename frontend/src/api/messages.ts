@@ -12,9 +12,11 @@ export interface MessageResponse {
 }
 
 export const messagesApi = {
-  // 发送消息（返回202和task_id）
-  sendMessage(conversationId: number, data: MessageCreate) {
-    return request.post<MessageResponse>(`/conversations/${conversationId}/messages`, data)
+  // 发送消息（返回202和task_id；重试时传入相同的idempotencyKey，返回同一个任务）
+  sendMessage(conversationId: number, data: MessageCreate, idempotencyKey?: string) {
+    return request.post<MessageResponse>(`/conversations/${conversationId}/messages`, data, {
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : undefined
+    })
   }
 }
 
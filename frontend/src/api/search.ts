@@ -0,0 +1,24 @@
+import request from '@/utils/request'
+
+export interface SearchResult {
+  id: number
+  conversation_id: number
+  conversation_title: string
+  role: 'user' | 'assistant'
+  created_at: string
+  snippet: string // 已转义的HTML，匹配部分用<mark>标记
+  score: number
+}
+
+export interface SearchResponse {
+  query: string
+  results: SearchResult[]
+  next_offset: number | null
+}
+
+export const searchApi = {
+  // 搜索当前用户的消息（按相关度排序，翻页时传入上一页的next_offset）
+  searchMessages(q: string, limit = 20, offset = 0) {
+    return request.get<SearchResponse>('/search', { params: { q, limit, offset } })
+  }
+}
@@ -11,9 +11,9 @@ export interface Task {
 }
 
 export const tasksApi = {
-  // 获取任务状态
-  getTaskStatus(taskId: string) {
-    return request.get<Task>(`/tasks/${taskId}`)
+  // 获取任务状态（wait>0 时为长轮询：服务端等到任务结束或超时后才返回）
+  getTaskStatus(taskId: string, wait = 0) {
+    return request.get<Task>(`/tasks/${taskId}`, { params: wait > 0 ? { wait } : undefined })
   }
 }
 